@@ -0,0 +1,223 @@
+import contextvars
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from rate_limit import per_minute
+from upstream_pool import get_upstream_pool
+
+# Lower numbers are served first when calls have to wait
+PRIORITY_CRISIS = 0
+PRIORITY_REPORT = 1
+PRIORITY_FOLLOW_UP = 2
+PRIORITY_SCREENING = 3
+PRIORITY_BATCH = 4
+
+AGENT_PRIORITIES = {
+    "report": PRIORITY_REPORT,
+    "follow_up": PRIORITY_FOLLOW_UP,
+    "screening": PRIORITY_SCREENING
+}
+
+# Messages containing these are answered before anything else in the queue
+CRISIS_PHRASES = [
+    "suicide", "suicidal", "kill myself", "end my life", "want to die", "self-harm", "self harm",
+    "hurt myself", "harm myself", "overdose", "not safe"
+]
+
+# Per-session buckets unused for this long are dropped
+SESSION_IDLE_SECONDS = 600
+
+_context = contextvars.ContextVar("admission_context", default={})
+
+class AdmissionRejected(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+# Function to check a patient message for crisis language
+def is_crisis_message(text):
+    text = text.lower()
+    return any(phrase in text for phrase in CRISIS_PHRASES)
+
+# Function to set who is making the model calls in this block: the session, the queue-position
+# callback and a priority override (anything not given is kept from an enclosing block)
+@contextmanager
+def request_context(session_id=None, on_queue=None, priority=None):
+    current = _context.get()
+    token = _context.set({
+        "session_id": session_id if session_id is not None else current.get("session_id"),
+        "on_queue": on_queue if on_queue is not None else current.get("on_queue"),
+        "priority": priority if priority is not None else current.get("priority")
+    })
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+# Function to get the current request context
+def current_context():
+    return _context.get()
+
+# A granted call; release() returns the tokens it reserved but did not use
+class Ticket:
+    def __init__(self, controller, session_id, priority, tokens):
+        self.controller = controller
+        self.session_id = session_id
+        self.priority = priority
+        self.tokens = tokens
+        self.sequence = next(controller.sequence)
+        self.waited = 0.0
+        self.released = False
+
+    def release(self, used_tokens=None):
+        if self.released:
+            return
+        self.released = True
+        if used_tokens is not None:
+            self.controller.refund(self.session_id, self.tokens - used_tokens)
+
+class _SessionBuckets:
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = per_minute(requests_per_minute)
+        self.tokens = per_minute(tokens_per_minute)
+        self.last_used = time.monotonic()
+
+# Admission control in front of the model: global and per-session request and token buckets,
+# with a bounded queue that lets the highest-priority waiting call go first
+class AdmissionController:
+    def __init__(self, requests_per_minute=500, tokens_per_minute=200000, session_requests_per_minute=20,
+                 session_tokens_per_minute=40000, max_queue=200, max_wait_seconds=120):
+        self.requests = per_minute(requests_per_minute)
+        self.tokens = per_minute(tokens_per_minute)
+        self.session_requests_per_minute = session_requests_per_minute
+        self.session_tokens_per_minute = session_tokens_per_minute
+        self.max_queue = max_queue
+        self.max_wait_seconds = max_wait_seconds
+        self.sequence = itertools.count()
+        self.sessions = {}
+        self.waiting = []
+        self.paused_until = 0.0
+        self.stats = {"admitted": 0, "queued": 0, "rejected": 0, "upstream_throttled": 0}
+        self._condition = threading.Condition()
+
+    def _session(self, session_id):
+        buckets = self.sessions.get(session_id)
+        if buckets is None:
+            now = time.monotonic()
+            for idle_id in [sid for sid, b in self.sessions.items() if now - b.last_used > SESSION_IDLE_SECONDS]:
+                del self.sessions[idle_id]
+            buckets = self.sessions[session_id] = _SessionBuckets(self.session_requests_per_minute, self.session_tokens_per_minute)
+        buckets.last_used = time.monotonic()
+        return buckets
+
+    def _session_ready(self, ticket):
+        if ticket.session_id is None:
+            return True
+        buckets = self._session(ticket.session_id)
+        return buckets.requests.available() >= 1 and buckets.tokens.available() >= min(ticket.tokens, buckets.tokens.capacity)
+
+    # A ticket may go when no higher-priority waiter could go instead and every bucket has room
+    def _try_grant(self, ticket):
+        if time.monotonic() < self.paused_until:
+            return False
+        for ahead in self.waiting:
+            if ahead is ticket:
+                break
+            if self._session_ready(ahead):
+                return False
+        tokens = min(ticket.tokens, self.tokens.capacity)
+        if not self._session_ready(ticket) or self.requests.available() < 1 or self.tokens.available() < tokens:
+            return False
+        self.requests.try_acquire(1)
+        self.tokens.try_acquire(tokens)
+        if ticket.session_id is not None:
+            buckets = self._session(ticket.session_id)
+            buckets.requests.try_acquire(1)
+            buckets.tokens.try_acquire(min(ticket.tokens, buckets.tokens.capacity))
+        return True
+
+    # Function to wait for a turn to call the model; on_queue(position) is called while waiting
+    # and on_queue(None) once the call is let through
+    def admit(self, session_id, priority, tokens, on_queue=None):
+        ticket = Ticket(self, session_id, priority, tokens)
+        start = time.monotonic()
+        deadline = start + self.max_wait_seconds
+        reported = None
+        with self._condition:
+            if len(self.waiting) >= self.max_queue:
+                self.stats["rejected"] += 1
+                raise AdmissionRejected("The service is very busy right now. Please try again in a minute.", 60)
+            self.waiting.append(ticket)
+            self.waiting.sort(key=lambda t: (t.priority, t.sequence))
+        try:
+            while True:
+                with self._condition:
+                    if self._try_grant(ticket):
+                        self.waiting.remove(ticket)
+                        self.stats["admitted"] += 1
+                        self._condition.notify_all()
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.stats["rejected"] += 1
+                        raise AdmissionRejected("The service is very busy right now. Please try again in a minute.", 60)
+                    position = self.waiting.index(ticket) + 1
+                    if reported is None:
+                        self.stats["queued"] += 1
+                    changed = position != reported
+                    reported = position
+                    if not changed:
+                        self._condition.wait(min(0.25, remaining))
+                # Callbacks run outside the lock, since the UI may take a moment to redraw
+                if changed and on_queue is not None:
+                    on_queue(position)
+        finally:
+            with self._condition:
+                if ticket in self.waiting:
+                    self.waiting.remove(ticket)
+                    self._condition.notify_all()
+            if reported is not None and on_queue is not None:
+                on_queue(None)
+        ticket.waited = time.monotonic() - start
+        return ticket
+
+    def refund(self, session_id, tokens):
+        with self._condition:
+            self.tokens.refund(tokens)
+            if session_id is not None and session_id in self.sessions:
+                self.sessions[session_id].tokens.refund(tokens)
+            self._condition.notify_all()
+
+    # Function to hold every call back for a while after the upstream answers 429
+    def pause(self, seconds):
+        with self._condition:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.stats["upstream_throttled"] += 1
+
+    def snapshot(self):
+        with self._condition:
+            return dict(self.stats, waiting=len(self.waiting), sessions=len(self.sessions))
+
+_controller = None
+_controller_lock = threading.Lock()
+
+# Function to get the shared controller (configured with the ADMISSION_* and SESSION_* variables; when the
+# upstream pool sets a quota for every key, the global limits default to the pool's total)
+def get_admission_controller():
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                requests_per_minute, tokens_per_minute = get_upstream_pool().total_quota() or (500, 200000)
+                _controller = AdmissionController(
+                    requests_per_minute=int(os.getenv("ADMISSION_REQUESTS_PER_MINUTE", str(requests_per_minute))),
+                    tokens_per_minute=int(os.getenv("ADMISSION_TOKENS_PER_MINUTE", str(tokens_per_minute))),
+                    session_requests_per_minute=int(os.getenv("SESSION_REQUESTS_PER_MINUTE", "20")),
+                    session_tokens_per_minute=int(os.getenv("SESSION_TOKENS_PER_MINUTE", "40000")),
+                    max_queue=int(os.getenv("ADMISSION_QUEUE_SIZE", "200")),
+                    max_wait_seconds=float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "120"))
+                )
+    return _controller
@@ -0,0 +1,470 @@
+import argparse
+import atexit
+import hashlib
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+from array import array
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+# Columns of each table and their array type codes; text columns hold codes from the segment's dictionary
+TABLES = {
+    "results": [("day", "i"), ("session", "q"), ("instrument", "H"), ("subscale", "H"), ("band", "H"), ("mode", "H"), ("score", "h")],
+    "items": [("day", "i"), ("session", "q"), ("instrument", "H"), ("item", "B"), ("position", "B"), ("completes", "B"), ("score", "b")]
+}
+TEXT_COLUMNS = {"instrument", "subscale", "band", "mode"}
+
+# What each block summary groups by; the last column of each table (score) is summed
+DIMENSIONS = {
+    "results": ("day", "instrument", "subscale", "band", "mode"),
+    "items": ("day", "instrument", "item", "position", "completes")
+}
+
+# Rows per block; a full block never changes, so its summary is worked out once and kept on disk
+BLOCK_ROWS = 65536
+
+# Function to get the day number (days since 1970-01-01) of a timestamp
+def day_number(timestamp=None):
+    return int((time.time() if timestamp is None else timestamp) // 86400)
+
+# Function to get the Monday that starts a day's week, as a date
+def week_start(day):
+    return date(1970, 1, 1) + timedelta(days=day - (day + 3) % 7)
+
+# Function to turn a session ID into the 64-bit number stored for it (the ID itself is not kept)
+def session_number(session_id):
+    digest = hashlib.blake2b((session_id or "").encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+# One process's append-only files: a file per column per table, and the dictionary for its text columns
+class SegmentWriter:
+    def __init__(self, directory):
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        self.path = os.path.join(directory, f"segment-{stamp}-{os.getpid()}")
+        suffix = 1
+        while os.path.exists(self.path):
+            self.path = os.path.join(directory, f"segment-{stamp}-{os.getpid()}-{suffix}")
+            suffix += 1
+        os.makedirs(self.path)
+        self.codes = {}
+
+    def _code(self, column, value, new_entries):
+        key = (column, value)
+        if key not in self.codes:
+            self.codes[key] = len(self.codes)
+            new_entries.append({"column": column, "value": value, "code": self.codes[key]})
+        return self.codes[key]
+
+    # Function to append rows ({table: [row tuples]}); dictionary entries are written first, so a
+    # reader never meets a code it cannot look up
+    def append(self, rows_by_table):
+        new_entries = []
+        columns_by_table = {}
+        for table, rows in rows_by_table.items():
+            columns = list(zip(*rows)) if rows else []
+            encoded = []
+            for (name, type_code), values in zip(TABLES[table], columns):
+                if name in TEXT_COLUMNS:
+                    values = [self._code(name, value, new_entries) for value in values]
+                encoded.append((name, array(type_code, values)))
+            columns_by_table[table] = encoded
+        if new_entries:
+            with open(os.path.join(self.path, "dictionary.jsonl"), "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(entry) + "\n" for entry in new_entries))
+        for table, encoded in columns_by_table.items():
+            for name, values in encoded:
+                with open(os.path.join(self.path, f"{table}.{name}.bin"), "ab") as f:
+                    values.tofile(f)
+
+# Background writer: the UI thread queues rows, a worker thread appends them in batches
+class AnalyticsWriter:
+    def __init__(self, directory, batch_size=500, flush_interval=2.0, max_queue=100000):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.segment = None
+        self.dropped = 0
+        self.errors = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="analytics-writer", daemon=True)
+        self._thread.start()
+
+    # Called from the UI thread: never blocks, drops the rows if the queue is full
+    def submit(self, table, rows):
+        try:
+            self.queue.put_nowait((table, rows))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def close(self, timeout=10):
+        self._stopped.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while not (self._stopped.is_set() and self.queue.empty()):
+            batch = {}
+            count = 0
+            deadline = time.monotonic() + self.flush_interval
+            while count < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    table, rows = self.queue.get(timeout=min(remaining, 0.5))
+                except queue.Empty:
+                    if self._stopped.is_set():
+                        break
+                    continue
+                batch.setdefault(table, []).extend(rows)
+                count += 1
+            if batch:
+                try:
+                    if self.segment is None:
+                        self.segment = SegmentWriter(self.directory)
+                    self.segment.append(batch)
+                except Exception as e:
+                    self.errors += 1
+                    print(f"Error writing analytics: {str(e)}", file=sys.stderr)
+                    # A failed write can leave some columns a row longer than others, so later rows would not
+                    # line up; the segment is left as it is (readers stop at its shortest column) and a new one started
+                    self.segment = None
+
+# Function to summarise rows: {(dimension values...): [count, score sum]}
+def summarise(dimension_columns, scores):
+    # Counting whole rows, score included, runs in C; the sums are folded from the counts
+    cells = {}
+    for key, count in Counter(zip(*dimension_columns, scores)).items():
+        cell = cells.setdefault(key[:-1], [0, 0])
+        cell[0] += count
+        cell[1] += count * key[-1]
+    return cells
+
+# Reader for one segment: row counts, column slices and block summaries
+class Segment:
+    def __init__(self, path):
+        self.path = path
+        self.values = {}
+        self.blocks = {table: {} for table in TABLES}
+        self._dictionary_size = -1
+        self._load_summaries()
+
+    def _file(self, table, name):
+        return os.path.join(self.path, f"{table}.{name}.bin")
+
+    def load_dictionary(self):
+        path = os.path.join(self.path, "dictionary.jsonl")
+        if not os.path.exists(path) or os.path.getsize(path) == self._dictionary_size:
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                self.values[(entry["column"], entry["code"])] = entry["value"]
+        self._dictionary_size = os.path.getsize(path)
+
+    # Rows every column of a table has (a write cut off by a crash leaves some columns longer)
+    def rows(self, table):
+        counts = []
+        for name, type_code in TABLES[table]:
+            path = self._file(table, name)
+            counts.append(os.path.getsize(path) // array(type_code).itemsize if os.path.exists(path) else 0)
+        return min(counts)
+
+    def column(self, table, name, start, stop):
+        type_code = dict(TABLES[table])[name]
+        values = array(type_code)
+        # A segment may not have written a table yet (its files do not exist)
+        if stop <= start:
+            return values
+        with open(self._file(table, name), "rb") as f:
+            f.seek(start * values.itemsize)
+            values.fromfile(f, stop - start)
+        return values
+
+    def summarise_rows(self, table, start, stop):
+        dimension_columns = [self.column(table, name, start, stop) for name in DIMENSIONS[table]]
+        return summarise(dimension_columns, self.column(table, TABLES[table][-1][0], start, stop))
+
+    def _summary_path(self, table):
+        return os.path.join(self.path, f"{table}.summaries.jsonl")
+
+    def _load_summaries(self):
+        for table in TABLES:
+            path = self._summary_path(table)
+            if not os.path.exists(path):
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.blocks[table][entry["block"]] = {tuple(cell[:-2]): cell[-2:] for cell in entry["cells"]}
+
+    # Function to get the summaries of every full block, working out (and saving) any not seen before
+    def sealed_blocks(self, table):
+        sealed = self.rows(table) // BLOCK_ROWS
+        new_lines = []
+        for block in range(sealed):
+            if block not in self.blocks[table]:
+                cells = self.summarise_rows(table, block * BLOCK_ROWS, (block + 1) * BLOCK_ROWS)
+                self.blocks[table][block] = cells
+                new_lines.append(json.dumps({"block": block, "cells": [list(key) + value for key, value in cells.items()]}) + "\n")
+        if new_lines:
+            with open(self._summary_path(table), "a", encoding="utf-8") as f:
+                f.write("".join(new_lines))
+        return [self.blocks[table][block] for block in range(sealed)]
+
+# Population view over every segment: full blocks are summarised once and added to a running
+# total, and only a segment's unfinished last block is summarised again when it grows
+class AnalyticsStore:
+    def __init__(self, directory):
+        self.directory = directory
+        self.segments = {}
+        self.sealed = {table: {} for table in TABLES}
+        self.sealed_counts = {}
+        self.tails = {}
+        self.rows = {table: 0 for table in TABLES}
+        self._lock = threading.RLock()
+
+    # Function to pick up new segments and rows; returns the time it took in seconds
+    def refresh(self):
+        start = time.perf_counter()
+        with self._lock:
+            names = sorted(os.listdir(self.directory)) if os.path.isdir(self.directory) else []
+            for name in names:
+                if name.startswith("segment-") and name not in self.segments:
+                    self.segments[name] = Segment(os.path.join(self.directory, name))
+            rows = {table: 0 for table in TABLES}
+            for name, segment in self.segments.items():
+                segment.load_dictionary()
+                for table in TABLES:
+                    blocks = segment.sealed_blocks(table)
+                    for cells in blocks[self.sealed_counts.get((name, table), 0):]:
+                        merge_into(self.sealed[table], self._decode(segment, table, cells))
+                    self.sealed_counts[(name, table)] = len(blocks)
+                    segment_rows = segment.rows(table)
+                    cached = self.tails.get((name, table))
+                    if cached is None or cached[0] != segment_rows:
+                        tail = segment.summarise_rows(table, len(blocks) * BLOCK_ROWS, segment_rows)
+                        self.tails[(name, table)] = (segment_rows, table, self._decode(segment, table, tail))
+                    rows[table] += segment_rows
+            self.rows = rows
+        return time.perf_counter() - start
+
+    # Function to swap a segment's dictionary codes for the text they stand for
+    def _decode(self, segment, table, cells):
+        positions = [(i, name) for i, name in enumerate(DIMENSIONS[table]) if name in TEXT_COLUMNS]
+        decoded = {}
+        for key, (count, total) in cells.items():
+            key = list(key)
+            for i, name in positions:
+                key[i] = segment.values.get((name, key[i]), "?")
+            cell = decoded.setdefault(tuple(key), [0, 0])
+            cell[0] += count
+            cell[1] += total
+        return decoded
+
+    # Function to go through every summary cell of a table: (key, (count, score sum))
+    def _cells(self, table):
+        yield from self.sealed[table].items()
+        for _, tail_table, cells in self.tails.values():
+            if tail_table == table:
+                yield from cells.items()
+
+    # Function to list the instruments, with their subscales and bands, seen in the results
+    def instruments(self):
+        found = {}
+        with self._lock:
+            for (_, instrument, subscale, band, _), _ in self._cells("results"):
+                found.setdefault(instrument, {}).setdefault(subscale, set()).add(band)
+        return {instrument: {subscale: sorted(bands) for subscale, bands in subscales.items()} for instrument, subscales in found.items()}
+
+    def _results(self, instrument, start_day=None, end_day=None, mode=None):
+        with self._lock:
+            for (day, cube_instrument, subscale, band, cube_mode), (count, total) in self._cells("results"):
+                if cube_instrument != instrument or (mode and cube_mode != mode):
+                    continue
+                if (start_day is not None and day < start_day) or (end_day is not None and day > end_day):
+                    continue
+                yield day, subscale, band, count, total
+
+    # Function to count results in each band, by week: {week start: {band: count}}
+    def band_distribution(self, instrument, subscale, start_day=None, end_day=None, mode=None):
+        weeks = {}
+        for day, cube_subscale, band, count, _ in self._results(instrument, start_day, end_day, mode):
+            if cube_subscale == subscale:
+                bands = weeks.setdefault(week_start(day), {})
+                bands[band] = bands.get(band, 0) + count
+        return dict(sorted(weeks.items()))
+
+    # Function to get the mean score of each subscale, by week: {week start: {subscale: (mean, count)}}
+    def subscale_trend(self, instrument, start_day=None, end_day=None, mode=None):
+        sums = {}
+        for day, subscale, _, count, total in self._results(instrument, start_day, end_day, mode):
+            cell = sums.setdefault(week_start(day), {}).setdefault(subscale, [0, 0])
+            cell[0] += count
+            cell[1] += total
+        return {week: {subscale: (total / count, count) for subscale, (count, total) in subscales.items()} for week, subscales in sorted(sums.items())}
+
+    # Function to follow administrations item by item: how many reached each answer, how many finished
+    # there and how many stopped there without finishing, and each item's answer count and mean score
+    def item_funnel(self, instrument, start_day=None, end_day=None):
+        reached = {}
+        completed = {}
+        items = {}
+        with self._lock:
+            for (day, cube_instrument, item, position, completes), (count, total) in self._cells("items"):
+                if cube_instrument != instrument:
+                    continue
+                if (start_day is not None and day < start_day) or (end_day is not None and day > end_day):
+                    continue
+                reached[position] = reached.get(position, 0) + count
+                if completes:
+                    completed[position] = completed.get(position, 0) + count
+                cell = items.setdefault(item, [0, 0])
+                cell[0] += count
+                cell[1] += total
+        positions = []
+        for position in sorted(reached):
+            dropped = max(0, reached[position] - reached.get(position + 1, 0) - completed.get(position, 0))
+            positions.append({
+                "position": position,
+                "reached": reached[position],
+                "completed_here": completed.get(position, 0),
+                "dropped": dropped,
+                "drop_rate": dropped / reached[position]
+            })
+        started = reached.get(1, 0)
+        finished = sum(completed.values())
+        return {
+            "started": started,
+            "completed": finished,
+            "completion_rate": finished / started if started else None,
+            "positions": positions,
+            "items": [{"item": item + 1, "answered": count, "mean_score": total / count} for item, (count, total) in sorted(items.items())]
+        }
+
+# Function to add one set of summary cells into another
+def merge_into(target, cells):
+    for key, (count, total) in cells.items():
+        cell = target.get(key)
+        if cell is None:
+            target[key] = [count, total]
+        else:
+            cell[0] += count
+            cell[1] += total
+
+# Function to check whether outcomes are recorded (off unless ANALYTICS is set)
+def analytics_enabled():
+    return os.getenv("ANALYTICS", "").lower() in ["1", "true", "yes"]
+
+_writer = None
+_writer_lock = threading.Lock()
+
+# Function to get the shared writer (ANALYTICS_DIR, default ./analytics), starting it on first use
+def get_analytics_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = AnalyticsWriter(os.getenv("ANALYTICS_DIR", "analytics"))
+                atexit.register(_writer.close)
+    return _writer
+
+# Function to record one answered questionnaire item; position counts the answers given so far
+def record_item(session_id, assessment, item_index, score, position, completes):
+    if analytics_enabled():
+        get_analytics_writer().submit("items", [(day_number(), session_number(session_id), assessment, item_index, position, int(completes), score)])
+
+# Function to record a scored questionnaire, one row per subscale (or one for a total score)
+def record_result(session_id, assessment, result):
+    if not analytics_enabled():
+        return
+    day = day_number()
+    session = session_number(session_id)
+    mode = result.get("administration", {}).get("mode", "full")
+    if "scores" in result:
+        rows = [(day, session, assessment, subscale, result["interpretations"][subscale], mode, score) for subscale, score in result["scores"].items()]
+    else:
+        rows = [(day, session, assessment, "total", result["interpretation"], mode, result["score"])]
+    get_analytics_writer().submit("results", rows)
+
+# Function to write made-up administrations straight to a new segment, to try the dashboard at scale
+def generate(directory, sessions, days, seed=1):
+    from content_store import get_content_store
+    from scoring import score_responses
+
+    rng = random.Random(seed)
+    instruments = get_content_store().current.instruments
+    segment = SegmentWriter(directory)
+    today = day_number()
+    # Sessions are written oldest first, as a live store receives them
+    session_days = sorted(today - int(days * rng.random() ** 0.7) for _ in range(sessions))
+    batch = {"results": [], "items": []}
+    for number, day in enumerate(session_days):
+        session = rng.getrandbits(63)
+        for name, data in instruments.items():
+            item_count = len(data["questions"])
+            severity = rng.random()
+            weights = [max(0.05, 1 - abs(severity * (len(data["scores"]) - 1) - score)) for score in data["scores"]]
+            responses = rng.choices(data["scores"], weights, k=item_count)
+            # About one in ten stops part-way, more often early on
+            answered = item_count if rng.random() > 0.1 else 1 + int(item_count * rng.random() ** 2)
+            for index in range(answered):
+                batch["items"].append((day, session, name, index, index + 1, int(answered == item_count and index == item_count - 1), responses[index]))
+            if answered == item_count:
+                result = score_responses(data, responses)
+                if "scores" in result:
+                    batch["results"].extend((day, session, name, subscale, result["interpretations"][subscale], "full", score) for subscale, score in result["scores"].items())
+                else:
+                    batch["results"].append((day, session, name, "total", result["interpretation"], "full", result["score"]))
+        if len(batch["items"]) >= 200000 or number == sessions - 1:
+            segment.append(batch)
+            batch = {"results": [], "items": []}
+    return segment.path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspect or load-test the questionnaire analytics store.")
+    parser.add_argument("--dir", default=os.getenv("ANALYTICS_DIR", "analytics"))
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    generate_parser = subparsers.add_parser("generate", help="Write made-up sessions to a new segment")
+    generate_parser.add_argument("--sessions", type=int, default=100000)
+    generate_parser.add_argument("--days", type=int, default=365)
+    subparsers.add_parser("bench", help="Time a refresh and the dashboard queries")
+    args = parser.parse_args(argv)
+
+    if args.command == "generate":
+        start = time.perf_counter()
+        path = generate(args.dir, args.sessions, args.days)
+        print(f"Wrote {args.sessions} sessions to {path} in {time.perf_counter() - start:.1f} s")
+        return
+
+    store = AnalyticsStore(args.dir)
+    print(f"First refresh (summarises blocks not seen before): {store.refresh() * 1000:.0f} ms")
+    print(f"Second refresh: {store.refresh() * 1000:.0f} ms")
+    print(f"Rows: {store.rows}")
+    today = day_number()
+    for instrument, subscales in store.instruments().items():
+        subscale = sorted(subscales)[0]
+        for label, query in [
+            ("band distribution", lambda: store.band_distribution(instrument, subscale, today - 90, today)),
+            ("subscale trend", lambda: store.subscale_trend(instrument, today - 180, today)),
+            ("item funnel", lambda: store.item_funnel(instrument))
+        ]:
+            start = time.perf_counter()
+            query()
+            print(f"{instrument} {label}: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
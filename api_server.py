@@ -0,0 +1,359 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs
+
+import dotenv
+
+import engine
+from admission import get_admission_controller
+from content_store import ContentError, get_content_store, session_content
+from fallback_responder import fallback_snapshot
+from model_router import circuit_snapshot
+from report_export import export_report
+from singleflight import get_single_flight
+from upstream_pool import get_upstream_pool
+
+# Requests larger than this are rejected
+MAX_BODY_BYTES = 64 * 1024
+
+# Idle sessions are looked for this often (or every session TTL, if shorter)
+EVICT_INTERVAL_SECONDS = 60
+
+STATUS_TEXT = {
+    200: "OK", 201: "Created", 204: "No Content", 400: "Bad Request", 404: "Not Found",
+    405: "Method Not Allowed", 409: "Conflict", 410: "Gone", 413: "Payload Too Large", 500: "Internal Server Error"
+}
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+# In-memory sessions, each with a lock so one session handles one request at a time
+class SessionStore:
+    def __init__(self, ttl_seconds=3600):
+        self.ttl_seconds = ttl_seconds
+        self.sessions = {}
+        self.locks = {}
+
+    def create(self):
+        session = engine.Session()
+        engine.start_conversation(session)
+        self.sessions[session.session_id] = session
+        self.locks[session.session_id] = asyncio.Lock()
+        return session
+
+    def get(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise HttpError(404, f"Unknown session: {session_id}")
+        session.last_active = time.time()
+        return session, self.locks[session_id]
+
+    # Waits for a request already running on the session, so it is not deleted while the engine still uses it
+    async def delete(self, session_id):
+        _, lock = self.get(session_id)
+        async with lock:
+            self.sessions.pop(session_id, None)
+            self.locks.pop(session_id, None)
+
+    def evict_expired(self):
+        cutoff = time.time() - self.ttl_seconds
+        for session_id in [sid for sid, session in self.sessions.items() if session.last_active < cutoff]:
+            if not self.locks[session_id].locked():
+                del self.sessions[session_id]
+                del self.locks[session_id]
+
+# Function to describe a session for API responses
+def session_view(session, since=None):
+    view = {
+        "session_id": session.session_id,
+        "chat_state": session.chat_state,
+        "question": engine.current_question(session),
+        "diagnosis": session.diagnosis,
+        "report_generated": session.report_generated
+    }
+    if since is None:
+        view["messages"] = session.messages
+    else:
+        view["new_messages"] = session.messages[since:]
+    return view
+
+class ApiServer:
+    def __init__(self, workers=32, session_ttl=3600):
+        self.store = SessionStore(session_ttl)
+        # Model calls block, so they run on a thread pool while the event loop keeps serving other sessions
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="engine")
+
+    # Drops idle sessions on a timer, so they go even when no new sessions are created
+    async def evict_periodically(self, interval=None):
+        interval = interval or min(EVICT_INTERVAL_SECONDS, self.store.ttl_seconds)
+        while True:
+            await asyncio.sleep(interval)
+            self.store.evict_expired()
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                try:
+                    streamed = await self.dispatch(method, path, body, writer)
+                    if streamed:
+                        break
+                except HttpError as e:
+                    await write_json(writer, e.status, {"error": e.message}, keep_alive)
+                except ContentError as e:
+                    # The session's content version is no longer loaded; the client must start a new session
+                    await write_json(writer, 410, {"error": str(e)}, keep_alive)
+                except Exception as e:
+                    await write_json(writer, 500, {"error": str(e)}, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except HttpError as e:
+            await write_json(writer, e.status, {"error": e.message}, False)
+        finally:
+            writer.close()
+
+    # Routes requests; returns True when the response was streamed (the connection is then closed)
+    async def dispatch(self, method, path, body, writer):
+        path, _, query = path.partition("?")
+        parts = [part for part in path.split("/") if part]
+
+        if parts == ["health"] and method == "GET":
+            await write_json(writer, 200, {"status": "ok", "sessions": len(self.store.sessions), "admission": get_admission_controller().snapshot(), "coalescing": get_single_flight().snapshot(), "content": get_content_store().current.summary(), "circuits": circuit_snapshot(), "fallback": fallback_snapshot(), "upstream": get_upstream_pool().snapshot()})
+            return False
+        if parts == ["sessions"]:
+            if method != "POST":
+                raise HttpError(405, "Use POST to create a session.")
+            session = self.store.create()
+            await write_json(writer, 201, session_view(session))
+            return False
+        if len(parts) < 2 or parts[0] != "sessions":
+            raise HttpError(404, f"Unknown path: {path}")
+
+        session_id = parts[1]
+        action = parts[2] if len(parts) > 2 else None
+        payload = parse_json(body)
+
+        if action is None:
+            if method == "GET":
+                session, _ = self.store.get(session_id)
+                await write_json(writer, 200, session_view(session))
+            elif method == "DELETE":
+                await self.store.delete(session_id)
+                await write_json(writer, 204, None)
+            else:
+                raise HttpError(405, "Use GET or DELETE on a session.")
+            return False
+
+        session, lock = self.store.get(session_id)
+        async with lock:
+            if action == "question" and method == "GET":
+                await write_json(writer, 200, {"question": engine.current_question(session), "chat_state": session.chat_state})
+                return False
+            if action == "export" and method == "GET":
+                if not session.report_generated:
+                    raise HttpError(409, "The report has not been generated yet.")
+                fmt = parse_qs(query).get("format", ["pdf"])[0]
+                loop = asyncio.get_running_loop()
+                try:
+                    # Rendering a PDF takes long enough to hold up other sessions, so it runs off the event loop
+                    data, mime, file_name = await loop.run_in_executor(self.executor, export_report, session.report, session.diagnosis, fmt, session_content(session).instruments)
+                except ValueError as e:
+                    raise HttpError(400, str(e))
+                await write_file(writer, data, mime, file_name)
+                return False
+            if method != "POST":
+                raise HttpError(405, f"Use POST for {action}.")
+
+            if action == "messages":
+                content = require_text(payload)
+                return await self.run_engine(writer, session, payload.get("stream"), lambda notify, on_token, on_queue: engine.handle_user_message(session, content, notify, on_token, on_queue))
+            if action == "follow-up":
+                content = require_text(payload)
+                if session.chat_state != "follow_up":
+                    raise HttpError(409, "Follow-up questions are available after the report is generated.")
+                return await self.run_engine(writer, session, payload.get("stream"), lambda notify, on_token, on_queue: engine.handle_user_message(session, content, notify, on_token, on_queue))
+            if action == "answers":
+                option = payload.get("option")
+                # JSON true and false arrive as bool, which is a subclass of int
+                if not isinstance(option, int) or isinstance(option, bool):
+                    raise HttpError(400, "Send the chosen option index as {\"option\": <int>}.")
+                if engine.current_question(session) is None:
+                    raise HttpError(409, "There is no questionnaire item waiting for an answer.")
+                since = len(session.messages)
+                loop = asyncio.get_running_loop()
+                try:
+                    # Answering the last item scores the questionnaire and may start the next, so it runs off the event loop too
+                    result = await loop.run_in_executor(self.executor, engine.answer_item, session, option)
+                except ValueError as e:
+                    raise HttpError(400, str(e))
+                view = session_view(session, since)
+                view["result"] = result
+                await write_json(writer, 200, view)
+                return False
+            if action == "report":
+                if session.chat_state != "awaiting_report":
+                    raise HttpError(409, f"A report can be generated once the questionnaires are complete (current state: {session.chat_state}).")
+                return await self.run_engine(writer, session, payload.get("stream"), lambda notify, on_token, on_queue: engine.generate_report(session, notify, on_token, on_queue))
+
+        raise HttpError(404, f"Unknown action: {action}")
+
+    # Runs an engine call on the thread pool, either as one JSON response or as a stream of server-sent events
+    async def run_engine(self, writer, session, stream, call):
+        loop = asyncio.get_running_loop()
+        since = len(session.messages)
+        notices = []
+
+        def notify(level, text):
+            notices.append({"level": level, "message": text})
+
+        if not stream:
+            response = await loop.run_in_executor(self.executor, call, notify, None, None)
+            view = session_view(session, since)
+            view["response"] = response
+            view["notices"] = notices
+            await write_json(writer, 200, view)
+            return False
+
+        events = asyncio.Queue()
+
+        def on_token(text):
+            loop.call_soon_threadsafe(events.put_nowait, ("token", {"text": text}))
+
+        # While the call waits in admission control the client is told its place in line
+        def on_queue(position):
+            loop.call_soon_threadsafe(events.put_nowait, ("queue", {"position": position}))
+
+        await write_stream_headers(writer)
+        future = loop.run_in_executor(self.executor, call, notify, on_token, on_queue)
+        while True:
+            get_event = asyncio.ensure_future(events.get())
+            done, _ = await asyncio.wait([get_event, future], return_when=asyncio.FIRST_COMPLETED)
+            if get_event in done:
+                await write_event(writer, *get_event.result())
+                continue
+            get_event.cancel()
+            break
+        while not events.empty():
+            await write_event(writer, *events.get_nowait())
+
+        try:
+            response = future.result()
+            view = session_view(session, since)
+            view["response"] = response
+            view["notices"] = notices
+            await write_event(writer, "done", view)
+        except Exception as e:
+            await write_event(writer, "error", {"error": str(e)})
+        return True
+
+# Function to read one HTTP/1.1 request (None when the client closed the connection)
+async def read_request(reader):
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    try:
+        method, path, _ = request_line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HttpError(400, "Malformed request line.")
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    length = int(headers.get("content-length", "0") or 0)
+    if length > MAX_BODY_BYTES:
+        raise HttpError(413, "Request body too large.")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), path, headers, body
+
+def parse_json(body):
+    if not body:
+        return {}
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HttpError(400, "Request body must be JSON.")
+    if not isinstance(payload, dict):
+        raise HttpError(400, "Request body must be a JSON object.")
+    return payload
+
+def require_text(payload):
+    content = payload.get("content")
+    if not isinstance(content, str) or not content.strip():
+        raise HttpError(400, "Send the message as {\"content\": \"...\"}.")
+    return content
+
+async def write_json(writer, status, payload, keep_alive=True):
+    body = b"" if payload is None else json.dumps(payload).encode("utf-8")
+    headers = [
+        f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+        "Content-Type: application/json",
+        f"Content-Length: {len(body)}",
+        "Connection: " + ("keep-alive" if keep_alive else "close")
+    ]
+    writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body)
+    await writer.drain()
+
+async def write_file(writer, data, mime, file_name, keep_alive=True):
+    headers = [
+        "HTTP/1.1 200 OK",
+        f"Content-Type: {mime}",
+        f"Content-Length: {len(data)}",
+        f"Content-Disposition: attachment; filename=\"{file_name}\"",
+        "Connection: " + ("keep-alive" if keep_alive else "close")
+    ]
+    writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + data)
+    await writer.drain()
+
+async def write_stream_headers(writer):
+    headers = [
+        "HTTP/1.1 200 OK",
+        "Content-Type: text/event-stream",
+        "Cache-Control: no-cache",
+        "Connection: close"
+    ]
+    writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1"))
+    await writer.drain()
+
+async def write_event(writer, event, payload):
+    writer.write(f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode("utf-8"))
+    await writer.drain()
+
+async def serve(host, port, workers, session_ttl):
+    api = ApiServer(workers, session_ttl)
+    evictor = asyncio.create_task(api.evict_periodically())
+    server = await asyncio.start_server(api.handle_connection, host, port, limit=MAX_BODY_BYTES)
+    print(f"Mental health chatbot API listening on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+if __name__ == "__main__":
+    dotenv.load_dotenv()
+    parser = argparse.ArgumentParser(description="Headless JSON API for the screening, assessment and report engine.")
+    parser.add_argument("--host", default=os.getenv("API_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("API_PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("API_WORKERS", "32")), help="Threads for model calls")
+    parser.add_argument("--session-ttl", type=int, default=int(os.getenv("API_SESSION_TTL", "3600")), help="Seconds before an idle session is dropped")
+    args = parser.parse_args(sys.argv[1:])
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.session_ttl))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,276 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+
+import engine
+from admission import PRIORITY_BATCH, request_context
+from content_store import get_content_store, session_content
+from model_router import load_model_config
+from prompts import estimate_message_tokens, estimate_tokens
+from rate_limit import per_minute
+from report_store import get_report_store
+from scoring import administration_summary, check_responses, score_responses
+from upstream_pool import Endpoint, UpstreamPool, set_upstream_pool
+
+RESULTS_FILE = "results.jsonl"
+FAILURES_FILE = "failures.jsonl"
+PROGRESS_FILE = "progress.json"
+
+# How often the progress file is rewritten
+PROGRESS_INTERVAL_SECONDS = 5
+
+class FatalBatchError(Exception):
+    pass
+
+# Function to read stored sessions one at a time (one Session.to_dict() object per line)
+def iter_session_records(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield line_number, None, f"Line {line_number} is not valid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield line_number, None, f"Line {line_number} is not a JSON object"
+                continue
+            record.setdefault("session_id", f"line-{line_number}")
+            yield line_number, record, None
+
+# Function to read the IDs already finished in an earlier run (a cut-off last line is ignored)
+def read_finished_ids(path):
+    finished = set()
+    if not os.path.exists(path):
+        return finished
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                finished.add(json.loads(line)["session_id"])
+            except (ValueError, KeyError, TypeError):
+                continue
+    return finished
+
+# Function to open a results file for appending, ending any line cut off by a crash first
+def open_for_append(path):
+    handle = open(path, "a+", encoding="utf-8")
+    if handle.tell() > 0:
+        handle.seek(handle.tell() - 1)
+        if handle.read(1) != "\n":
+            handle.write("\n")
+    return handle
+
+# Function to turn a stored record into a session ready for a report
+def session_from_record(record):
+    session = engine.Session.from_dict(record)
+    # A stored session finished its questionnaires long ago, so its report is written with the content loaded now
+    # when the version it was answered on is gone
+    if get_content_store().get(session.content_version) is None:
+        session.content_version = None
+    # Imported paper questionnaires bring raw item scores but no results, so score them here
+    for assessment, responses in session.assessment_responses.items():
+        if assessment in session.diagnosis["assessment_results"]:
+            continue
+        content = session_content(session)
+        assessment_data = content.instruments.get(assessment)
+        if assessment_data is None:
+            raise ValueError(f"Unknown questionnaire: {assessment}")
+        check_responses(assessment, assessment_data, responses)
+        result = score_responses(assessment_data, responses, content.band_tables[assessment])
+        result["administration"] = administration_summary(assessment_data, responses, False)
+        session.diagnosis["assessment_results"][assessment] = result
+    if not session.diagnosis["assessment_results"]:
+        raise ValueError("The session has no questionnaire results or responses")
+    session.chat_state = "awaiting_report"
+    return session
+
+# Function to estimate the tokens a report call will use: the prompt plus the most the model may write
+def estimate_report_tokens(session):
+    content = session_content(session)
+    prompt = session.messages + [{"role": "user", "content": engine.format_assessment_results(session.diagnosis)}]
+    max_tokens = load_model_config()["agents"]["report"].get("max_tokens", 2000)
+    # The report prompt is sent twice (see generate_report_with_gpt)
+    return 2 * content.prompt_tokens["report"] + estimate_message_tokens(prompt), max_tokens
+
+class BatchRunner:
+    def __init__(self, output_dir, concurrency=4, tokens_per_minute=90000, retry_failed=True):
+        self.output_dir = output_dir
+        self.concurrency = max(1, concurrency)
+        self.limiter = per_minute(tokens_per_minute)
+        self.retry_failed = retry_failed
+        self.stop = threading.Event()
+        self.counts = {"done": 0, "failed": 0, "skipped": 0, "cached": 0, "tokens": 0}
+        self.started_at = None
+        self.last_progress = 0.0
+
+    def _path(self, name):
+        return os.path.join(self.output_dir, name)
+
+    # Function to generate one report (runs on a worker thread)
+    def generate(self, record):
+        if self.stop.is_set():
+            return {"session_id": record["session_id"], "status": "cancelled"}
+        start = time.perf_counter()
+        notices = []
+        try:
+            session = session_from_record(record)
+        except (ValueError, TypeError, KeyError) as e:
+            return {"session_id": record["session_id"], "status": "failed", "error": str(e), "notices": notices}
+
+        # Stored reports cost no tokens, so only new ones wait for the tokens-per-minute ceiling
+        cached = get_report_store().contains(engine.prepare_report_key(session))
+        reserved = 0
+        prompt_tokens = 0
+        if not cached:
+            prompt_tokens, max_tokens = estimate_report_tokens(session)
+            reserved = prompt_tokens + max_tokens
+            self.limiter.acquire(reserved)
+
+        try:
+            # Batch reports wait behind every live session in admission control
+            with request_context(priority=PRIORITY_BATCH):
+                report = engine.generate_report(session, notify=lambda level, text: notices.append({"level": level, "message": text}))
+        except Exception as e:
+            # generate_report only raises for authentication errors, which would fail every session
+            self.stop.set()
+            raise FatalBatchError(str(e))
+        used = 0 if cached else prompt_tokens + estimate_tokens(report)
+        if reserved:
+            self.limiter.refund(reserved - used)
+
+        if not session.report_generated:
+            return {"session_id": session.session_id, "status": "failed", "error": "Report generation failed", "notices": notices}
+        return {
+            "session_id": session.session_id,
+            "status": "ok",
+            "report_id": session.diagnosis["report_id"],
+            "report": report,
+            "diagnosis": session.diagnosis,
+            "cached": cached,
+            "estimated_tokens": used,
+            "generated_at": datetime.now().isoformat(),
+            "elapsed_seconds": round(time.perf_counter() - start, 3),
+            "notices": notices
+        }
+
+    # Function to append one result line and flush it, so a crash never loses a finished report
+    def _append(self, handle, entry):
+        handle.write(json.dumps(entry) + "\n")
+        handle.flush()
+        os.fsync(handle.fileno())
+
+    def _write_progress(self, input_path, force=False):
+        now = time.time()
+        if not force and now - self.last_progress < PROGRESS_INTERVAL_SECONDS:
+            return
+        self.last_progress = now
+        progress = dict(self.counts)
+        progress.update({
+            "input": os.path.abspath(input_path),
+            "started_at": self.started_at,
+            "updated_at": datetime.now().isoformat(),
+            "elapsed_seconds": round(time.perf_counter() - self._start, 1)
+        })
+        temp_path = self._path(PROGRESS_FILE) + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(progress, f, indent=2)
+        os.replace(temp_path, self._path(PROGRESS_FILE))
+
+    def _record(self, entry, results, failures):
+        if entry["status"] == "ok":
+            self._append(results, entry)
+            self.counts["done"] += 1
+            self.counts["cached"] += int(entry["cached"])
+            self.counts["tokens"] += entry["estimated_tokens"]
+        elif entry["status"] == "failed":
+            entry["attempted_at"] = datetime.now().isoformat()
+            self._append(failures, entry)
+            self.counts["failed"] += 1
+
+    # Function to run every session in the input file that is not finished yet
+    def run(self, input_path):
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.started_at = datetime.now().isoformat()
+        self._start = time.perf_counter()
+        finished = read_finished_ids(self._path(RESULTS_FILE))
+        if not self.retry_failed:
+            finished |= read_finished_ids(self._path(FAILURES_FILE))
+
+        fatal = None
+        with open_for_append(self._path(RESULTS_FILE)) as results, \
+                open_for_append(self._path(FAILURES_FILE)) as failures, \
+                ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch-report") as pool:
+            pending = set()
+
+            def collect(futures):
+                nonlocal fatal
+                for future in futures:
+                    try:
+                        self._record(future.result(), results, failures)
+                    except FatalBatchError as e:
+                        fatal = fatal or str(e)
+                self._write_progress(input_path)
+
+            try:
+                for line_number, record, error in iter_session_records(input_path):
+                    if self.stop.is_set():
+                        break
+                    if error:
+                        if f"line-{line_number}" in finished:
+                            self.counts["skipped"] += 1
+                            continue
+                        self._record({"session_id": f"line-{line_number}", "status": "failed", "error": error, "notices": []}, results, failures)
+                        continue
+                    if record["session_id"] in finished or record.get("report_generated"):
+                        self.counts["skipped"] += 1
+                        continue
+                    # Keep only a few sessions queued, so a file of any size is read as the run goes
+                    while len(pending) >= self.concurrency * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+                    pending.add(pool.submit(self.generate, record))
+            except KeyboardInterrupt:
+                print("Stopping: finishing the reports already in progress...", file=sys.stderr)
+                self.stop.set()
+            done, _ = wait(pending)
+            collect(done)
+
+        self._write_progress(input_path, force=True)
+        if fatal:
+            raise FatalBatchError(fatal)
+        return dict(self.counts)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate reports for stored sessions in bulk. Re-running with the same output folder resumes where the last run stopped.")
+    parser.add_argument("sessions", help="JSONL file with one stored session per line (Session.to_dict() format)")
+    parser.add_argument("--output", default="batch_reports", help="Folder for results.jsonl, failures.jsonl and progress.json")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("BATCH_CONCURRENCY", "4")), help="Reports generated at once")
+    parser.add_argument("--tokens-per-minute", type=int, default=int(os.getenv("BATCH_TOKENS_PER_MINUTE", "90000")), help="Ceiling on estimated tokens sent and received per minute")
+    parser.add_argument("--skip-failed", action="store_true", help="Do not retry sessions that failed in an earlier run")
+    parser.add_argument("--endpoint", help="API base URL, or 'local' for the offline stand-in (default: API_BASE_URL)")
+    args = parser.parse_args(argv)
+
+    import dotenv
+    dotenv.load_dotenv()
+    if args.endpoint:
+        from evaluate import create_client
+        set_upstream_pool(UpstreamPool([Endpoint(args.endpoint, client=create_client(args.endpoint))], health_check_seconds=0))
+
+    runner = BatchRunner(args.output, args.concurrency, args.tokens_per_minute, retry_failed=not args.skip_failed)
+    try:
+        counts = runner.run(args.sessions)
+    except FatalBatchError as e:
+        print(f"Stopped: {e}. Fix the problem and run the same command again to resume.", file=sys.stderr)
+        sys.exit(1)
+    print(f"Reports generated: {counts['done']} ({counts['cached']} from the report cache), failed: {counts['failed']}, skipped: {counts['skipped']}, estimated tokens: {counts['tokens']}")
+    print(f"Results in {os.path.join(args.output, RESULTS_FILE)}")
+    return counts
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,191 @@
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+# How a cassette is used: "record" every call, "replay" recorded calls only (no client or network is
+# needed), or "new": replay what was recorded and record the rest
+CASSETTE_MODES = ["record", "replay", "new"]
+
+# Replay pace: "instant", or "recorded" to send each chunk when it arrived when recorded
+CASSETTE_PACES = ["instant", "recorded"]
+
+# Dates in prompts (the report asks for today's date) are masked when matching, so a cassette keeps working the next day
+DATE_PATTERN = re.compile(r"\b(?:January|February|March|April|May|June|July|August|September|October|November|December) \d{2}, \d{4}\b")
+
+class CassetteMiss(Exception):
+    # Reported like a 404, so the engine shows the error instead of quietly using the fallback questions
+    status_code = 404
+
+# Function to get the key a request is matched on: the model, messages, temperature and token limit
+# (not the timeout, or whether it is streamed)
+def request_fingerprint(model, messages, temperature=None, max_tokens=None):
+    data = json.dumps({"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(DATE_PATTERN.sub("<date>", data).encode("utf-8")).hexdigest()[:32]
+
+def open_cassette(path, mode):
+    if path.endswith(".gz"):
+        import gzip
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+# Recorded model calls: one JSON line per call with its key, the text chunks as they arrived, when each
+# arrived (ms after the request) and the token usage. Calls with the same key are replayed in turn
+class Cassette:
+    def __init__(self, path, mode="replay", pace="instant"):
+        if mode not in CASSETTE_MODES:
+            raise ValueError(f"Cassette mode must be one of {', '.join(CASSETTE_MODES)}")
+        if pace not in CASSETTE_PACES:
+            raise ValueError(f"Cassette pace must be one of {', '.join(CASSETTE_PACES)}")
+        self.path = path
+        self.mode = mode
+        self.pace = pace
+        self.calls = {}
+        self.next_call = {}
+        self.stats = {"replayed": 0, "recorded": 0, "missed": 0}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open_cassette(path, "r") as f:
+                for line in f:
+                    if line.strip():
+                        call = json.loads(line)
+                        self.calls.setdefault(call["key"], []).append(call)
+
+    # Function to get the recorded call for a key, taking each recording in turn (None if there is none)
+    def find(self, key):
+        with self._lock:
+            recorded = self.calls.get(key)
+            if not recorded:
+                self.stats["missed"] += 1
+                return None
+            index = self.next_call.get(key, 0)
+            self.next_call[key] = index + 1
+            self.stats["replayed"] += 1
+            return recorded[index % len(recorded)]
+
+    def record(self, key, model, messages, streamed, chunks, offsets_ms, usage):
+        hint = next((message["content"][:80] for message in reversed(messages) if message["role"] == "user"), "")
+        call = {"key": key, "model": model, "hint": hint, "streamed": streamed, "chunks": chunks, "offsets_ms": offsets_ms, "usage": usage}
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Appending works for gzip files too: each write adds a member that gzip reads back in order
+            with open_cassette(self.path, "a") as f:
+                f.write(json.dumps(call, ensure_ascii=False, separators=(",", ":")) + "\n")
+            self.calls.setdefault(key, []).append(call)
+            self.stats["recorded"] += 1
+
+    # Function to wrap a chat client (None when only replaying)
+    def client(self, inner):
+        return CassetteClient(self, inner)
+
+# Chat client that records the calls of the client it wraps, or replays them from the cassette
+class CassetteClient:
+    def __init__(self, cassette, inner):
+        self.cassette = cassette
+        self.inner = inner
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        # Health checks go to the real upstream; a replay-only client has none to check
+        if inner is not None and hasattr(inner, "models"):
+            self.models = inner.models
+
+    def _create(self, model, messages, temperature=None, max_tokens=None, stream=False, **kwargs):
+        key = request_fingerprint(model, messages, temperature, max_tokens)
+        if self.cassette.mode != "record":
+            call = self.cassette.find(key)
+            if call is not None:
+                return self._replay(call, stream)
+            if self.cassette.mode == "replay":
+                raise CassetteMiss(f"No recorded call in {self.cassette.path} for this request (last message: {messages[-1]['content'][:80]!r})")
+        request = dict(kwargs, model=model, messages=messages, temperature=temperature, max_tokens=max_tokens)
+        if stream:
+            return self._record_stream(key, request)
+        start = time.perf_counter()
+        completion = self.inner.chat.completions.create(**request)
+        content = completion.choices[0].message.content or ""
+        self.cassette.record(key, model, messages, False, [content], [round((time.perf_counter() - start) * 1000)], usage_dict(completion))
+        return completion
+
+    def _record_stream(self, key, request):
+        start = time.perf_counter()
+        chunks = []
+        offsets_ms = []
+        usage = None
+        for chunk in self.inner.chat.completions.create(stream=True, **request):
+            if chunk.choices and chunk.choices[0].delta.content:
+                chunks.append(chunk.choices[0].delta.content)
+                offsets_ms.append(round((time.perf_counter() - start) * 1000))
+            usage = usage_dict(chunk) or usage
+            yield chunk
+        # Recorded once the stream has been read to the end; a stream abandoned halfway is not kept
+        self.cassette.record(key, request["model"], request["messages"], True, chunks, offsets_ms, usage)
+
+    def _replay(self, call, stream):
+        if stream:
+            return self._replay_stream(call)
+        if self.cassette.pace == "recorded" and call["offsets_ms"]:
+            time.sleep(call["offsets_ms"][-1] / 1000)
+        usage = SimpleNamespace(**call["usage"]) if call.get("usage") else None
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="".join(call["chunks"])))], usage=usage)
+
+    def _replay_stream(self, call):
+        start = time.perf_counter()
+        for text, offset_ms in zip(call["chunks"], call["offsets_ms"]):
+            if self.cassette.pace == "recorded":
+                wait = offset_ms / 1000 - (time.perf_counter() - start)
+                if wait > 0:
+                    time.sleep(wait)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))])
+
+# Function to read the token usage of a completion or chunk as a plain dict (None if it has none)
+def usage_dict(response):
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return None
+    return {name: getattr(usage, name, None) for name in ["prompt_tokens", "completion_tokens", "total_tokens"]}
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+# Function to get the cassette every upstream client goes through (MODEL_CASSETTE, with MODEL_CASSETTE_MODE,
+# default replay, and MODEL_CASSETTE_PACE, default instant); None when no cassette is set
+def get_cassette():
+    global _cassette
+    path = os.getenv("MODEL_CASSETTE")
+    if not path:
+        return _cassette
+    if _cassette is None:
+        with _cassette_lock:
+            if _cassette is None:
+                _cassette = Cassette(path, os.getenv("MODEL_CASSETTE_MODE", "replay"), os.getenv("MODEL_CASSETTE_PACE", "instant"))
+    return _cassette
+
+def main(argv=None):
+    import statistics
+
+    parser = argparse.ArgumentParser(description="Describe the model calls recorded in a cassette.")
+    parser.add_argument("cassette", help="Cassette file (.jsonl, or .jsonl.gz)")
+    parser.add_argument("--calls", action="store_true", help="List every recorded call")
+    args = parser.parse_args(argv)
+
+    cassette = Cassette(args.cassette)
+    calls = [call for recorded in cassette.calls.values() for call in recorded]
+    if not calls:
+        print(f"No calls recorded in {args.cassette}")
+        sys.exit(1)
+    durations = [call["offsets_ms"][-1] for call in calls if call["offsets_ms"]]
+    print(f"{len(calls)} calls ({len(cassette.calls)} distinct requests, {sum(call['streamed'] for call in calls)} streamed) in {os.path.getsize(args.cassette):,} bytes")
+    if durations:
+        print(f"Recorded duration: median {statistics.median(durations):.0f} ms, max {max(durations)} ms, total {sum(durations) / 1000:.1f} s")
+    if args.calls:
+        for call in calls:
+            print(f"  {call['key'][:12]} {call['model']:<20} {'stream' if call['streamed'] else 'whole':<6} {len(call['chunks']):>4} chunks {call['offsets_ms'][-1] if call['offsets_ms'] else 0:>6} ms  {call['hint']!r}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,95 @@
+import re
+from functools import lru_cache
+
+# Words whose stems the suffix rules below would not line up
+IRREGULAR_STEMS = {
+    "anxieti": "anxi",
+    "anxious": "anxi",
+    "trauma": "traumat",
+    "panicky": "pan",
+    "panick": "pan"
+}
+
+# Suffix rules: (suffix, replacement). The first rule that fits is applied and the rules are tried again on
+# what is left, so an inflected word ("worries", "worrying") ends on the same stem as its base word ("worry").
+# A final "e" is dropped and a "y" after a consonant made "i", as inflections do, so "-ive" and "-ity" are
+# matched as "iv" and "iti"
+SUFFIX_RULES = [
+    ("izations", ""), ("ization", ""), ("ations", ""), ("ation", ""),
+    ("ised", ""), ("ized", ""), ("nesses", ""), ("ness", ""),
+    ("ments", ""), ("ment", ""), ("ful", ""), ("ings", ""), ("ing", ""),
+    ("ions", ""), ("ion", ""), ("iti", ""), ("iv", ""), ("ics", ""), ("ic", ""),
+    ("ied", "i"), ("ies", "i"), ("sses", "ss"), ("ed", ""), ("s", ""), ("e", ""), ("y", "i")
+]
+
+# Function to reduce a word to a simple stem so "depressed", "depressive" and "depression" match
+def stem(word):
+    while word not in IRREGULAR_STEMS:
+        for suffix, replacement in SUFFIX_RULES:
+            if not word.endswith(suffix) or len(word) - len(suffix) < 3:
+                continue
+            if suffix == "s" and word.endswith("ss"):
+                continue
+            if suffix in ("e", "y") and word[-2] in "aeiouy":
+                continue
+            word = word[:-len(suffix)] + replacement
+            break
+        else:
+            return word
+    return IRREGULAR_STEMS[word]
+
+# Function to split a condition into normalised, stemmed tokens
+def normalize(text):
+    return tuple(stem(token) for token in re.findall(r'[a-z0-9]+', text.lower()))
+
+# Prebuilt synonym index: stemmed phrase -> instruments, in the order instruments are registered
+class ConditionIndex:
+    def __init__(self, assessments):
+        self.phrases = {}
+        self.max_phrase_length = 1
+        for assessment_name, assessment_data in assessments.items():
+            for phrase in assessment_data.get("conditions", []):
+                key = normalize(phrase)
+                if not key:
+                    continue
+                instruments = self.phrases.setdefault(key, [])
+                if assessment_name not in instruments:
+                    instruments.append(assessment_name)
+                self.max_phrase_length = max(self.max_phrase_length, len(key))
+        self.resolve = lru_cache(maxsize=4096)(self._resolve)
+
+    # Longest phrase wins, so "post-traumatic stress" maps to PCL-5 and not to the "stress" scale
+    def _resolve(self, condition):
+        tokens = normalize(condition)
+        instruments = []
+        i = 0
+        while i < len(tokens):
+            for length in range(min(self.max_phrase_length, len(tokens) - i), 0, -1):
+                matched = self.phrases.get(tokens[i:i + length])
+                if matched:
+                    for assessment_name in matched:
+                        if assessment_name not in instruments:
+                            instruments.append(assessment_name)
+                    i += length
+                    break
+            else:
+                i += 1
+        return tuple(instruments)
+
+    # Function to map a priority-ordered list of conditions to de-duplicated instruments
+    def resolve_all(self, conditions):
+        instruments = []
+        for condition in conditions:
+            for assessment_name in self.resolve(condition):
+                if assessment_name not in instruments:
+                    instruments.append(assessment_name)
+        return instruments
+
+_indexes = {}
+
+# Function to get the index for a set of instruments, building it only when their condition lists change
+def get_condition_index(assessments):
+    key = tuple((name, tuple(data.get("conditions", []))) for name, data in assessments.items())
+    if key not in _indexes:
+        _indexes[key] = ConditionIndex(assessments)
+    return _indexes[key]
@@ -0,0 +1,300 @@
+import contextvars
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from condition_index import get_condition_index
+from item_planner import ItemLinks
+from prompts import estimate_tokens
+from scoring import compile_bands, get_band_labels, parse_score_range
+
+# Prompt files in content/prompts, by the name the engine uses for them
+PROMPT_FILES = {
+    "screening": "screening_system.txt",
+    "report": "report_system.txt",
+    "follow_up": "follow_up_system.txt",
+    "screening_wrap_up": "screening_wrap_up.txt"
+}
+
+# Older versions are kept so sessions that started on them can finish. Past this many, the oldest version no
+# session has used for VERSION_IDLE_SECONDS is dropped; a version still in use is kept however many there are
+MAX_VERSIONS = 20
+VERSION_IDLE_SECONDS = 24 * 3600
+
+_active = contextvars.ContextVar("active_content", default=None)
+
+class ContentError(Exception):
+    pass
+
+# One validated, compiled set of prompts and instruments; never changed after it is built
+class ContentVersion:
+    def __init__(self, version, prompts, welcome_messages, instruments, knowledge=None):
+        self.version = version
+        self.loaded_at = time.time()
+        # When a session last used this version (see session_content)
+        self.last_used = self.loaded_at
+        # Interned so every session on this version shares one copy of each prompt
+        self.prompts = {name: sys.intern(text) for name, text in prompts.items()}
+        self.welcome_messages = welcome_messages
+        self.instruments = instruments
+        # Reference material for follow-up questions: {file name: markdown text}
+        self.knowledge = knowledge or {}
+        self.prompt_tokens = {name: estimate_tokens(text) for name, text in self.prompts.items()}
+        # Band tables with parsed ranges: {instrument: {subscale: [(min, max, label), ...]}}, passed to the
+        # scoring functions so they never parse a band label again
+        self.band_tables = {name: {subscale: compile_bands(bands) for subscale, bands in get_band_labels(data).items()} for name, data in instruments.items()}
+        self.condition_index = get_condition_index(instruments)
+        self.item_links = ItemLinks(instruments)
+
+    def summary(self):
+        return {
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "instruments": list(self.instruments),
+            "knowledge_files": list(self.knowledge),
+            "prompt_tokens": self.prompt_tokens
+        }
+
+# Function to check an instrument definition, raising ContentError with what is wrong
+def validate_instrument(name, data):
+    for key in ["name", "description", "questions", "options", "scores", "interpretation"]:
+        if key not in data:
+            raise ContentError(f"{name}: missing '{key}'")
+    if not data["questions"]:
+        raise ContentError(f"{name}: has no questions")
+    if len(data["options"]) != len(data["scores"]):
+        raise ContentError(f"{name}: {len(data['options'])} options but {len(data['scores'])} scores")
+    question_count = len(data["questions"])
+    for subscale, items in data.get("subscales", {}).items():
+        if subscale not in data["interpretation"]:
+            raise ContentError(f"{name}: no interpretation bands for subscale '{subscale}'")
+        bad = [i for i in items if not 0 <= i < question_count]
+        if bad:
+            raise ContentError(f"{name}: subscale '{subscale}' refers to missing items {bad}")
+    for subscale, bands in get_band_labels(data).items():
+        if not isinstance(bands, dict) or not bands:
+            raise ContentError(f"{name}: interpretation for '{subscale}' must map score ranges to labels")
+        for range_str in bands:
+            try:
+                parse_score_range(range_str)
+            except ValueError:
+                raise ContentError(f"{name}: '{range_str}' is not a score range like '10-13' or '34+'")
+    shared = data.get("shared_items", [])
+    for link in shared:
+        if not all(key in link for key in ["item", "from", "from_item", "score_map", "source"]):
+            raise ContentError(f"{name}: each shared item needs 'item', 'from', 'from_item', 'score_map' and 'source'")
+        if not 0 <= link["item"] < question_count:
+            raise ContentError(f"{name}: shared item {link['item']} is not one of its items")
+        if not str(link["source"]).strip():
+            raise ContentError(f"{name}: shared item {link['item']} must cite the study that validated the mapping")
+        bad = [score for score in link["score_map"] if score not in data["scores"]]
+        if bad:
+            raise ContentError(f"{name}: shared item {link['item']} maps to scores {bad} that are not among its scores")
+    if len({(link["item"], link["from"]) for link in shared}) < len(shared):
+        raise ContentError(f"{name}: an item is shared with the same questionnaire twice")
+    if shared and len({link["item"] for link in shared}) >= question_count:
+        raise ContentError(f"{name}: at least one item must always be asked")
+
+# Function to check that shared items point at real items of other instruments, with a score for each of their scores
+def validate_shared_items(instruments):
+    for name, data in instruments.items():
+        for link in data.get("shared_items", []):
+            source = instruments.get(link["from"])
+            if source is None or link["from"] == name:
+                raise ContentError(f"{name}: shared item {link['item']} comes from unknown questionnaire '{link['from']}'")
+            if not 0 <= link["from_item"] < len(source["questions"]):
+                raise ContentError(f"{name}: shared item {link['item']} comes from missing {link['from']} item {link['from_item']}")
+            if len(link["score_map"]) != max(source["scores"]) + 1:
+                raise ContentError(f"{name}: shared item {link['item']} needs a score for each {link['from']} score 0-{max(source['scores'])}")
+
+# Function to read, validate and compile everything in a content folder
+def load_content(directory):
+    digest = hashlib.sha256()
+    prompts = {}
+    for name, file_name in PROMPT_FILES.items():
+        path = os.path.join(directory, "prompts", file_name)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError as e:
+            raise ContentError(f"Cannot read {path}: {e}")
+        digest.update(file_name.encode("utf-8") + b"\0" + data)
+        prompts[name] = data.decode("utf-8")
+        if not prompts[name].strip():
+            raise ContentError(f"{path} is empty")
+    if "{conditions}" not in prompts["screening_wrap_up"]:
+        raise ContentError("screening_wrap_up.txt must contain {conditions}")
+
+    try:
+        with open(os.path.join(directory, "welcome_messages.json"), "rb") as f:
+            data = f.read()
+        digest.update(b"welcome_messages.json\0" + data)
+        welcome_messages = json.loads(data)
+    except (OSError, ValueError) as e:
+        raise ContentError(f"Cannot load welcome_messages.json: {e}")
+    if not isinstance(welcome_messages, list) or not all(isinstance(m, dict) and m.get("role") and m.get("content") for m in welcome_messages):
+        raise ContentError("welcome_messages.json must be a list of {\"role\", \"content\"} messages")
+
+    instrument_dir = os.path.join(directory, "instruments")
+    loaded = []
+    for file_name in sorted(os.listdir(instrument_dir)) if os.path.isdir(instrument_dir) else []:
+        if not file_name.endswith(".json"):
+            continue
+        with open(os.path.join(instrument_dir, file_name), "rb") as f:
+            data = f.read()
+        digest.update(file_name.encode("utf-8") + b"\0" + data)
+        try:
+            instrument = json.loads(data)
+        except ValueError as e:
+            raise ContentError(f"{file_name}: {e}")
+        name = instrument.pop("id", None)
+        if not name:
+            raise ContentError(f"{file_name}: missing 'id'")
+        validate_instrument(name, instrument)
+        loaded.append((instrument.pop("order", 0), name, instrument))
+    if not loaded:
+        raise ContentError(f"No instruments in {instrument_dir}")
+    # The order matters: it breaks ties when several instruments cover a condition
+    instruments = {name: instrument for _, name, instrument in sorted(loaded, key=lambda entry: (entry[0], entry[1]))}
+    validate_shared_items(instruments)
+
+    # Reference material is optional; every .md file in content/knowledge is used
+    knowledge = {}
+    knowledge_dir = os.path.join(directory, "knowledge")
+    for file_name in sorted(os.listdir(knowledge_dir)) if os.path.isdir(knowledge_dir) else []:
+        if not file_name.endswith(".md"):
+            continue
+        with open(os.path.join(knowledge_dir, file_name), "rb") as f:
+            data = f.read()
+        digest.update(file_name.encode("utf-8") + b"\0" + data)
+        try:
+            knowledge[file_name] = data.decode("utf-8")
+        except UnicodeDecodeError as e:
+            raise ContentError(f"{file_name}: {e}")
+    return ContentVersion(digest.hexdigest()[:12], prompts, welcome_messages, instruments, knowledge)
+
+# Function to get the modification times of the content files, to notice edits cheaply
+def content_fingerprint(directory):
+    fingerprint = []
+    for root, _, files in os.walk(directory):
+        for file_name in sorted(files):
+            path = os.path.join(root, file_name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            fingerprint.append((path, stat.st_mtime_ns, stat.st_size))
+    return sorted(fingerprint)
+
+# File-backed prompts and instruments: a watcher reloads them on change and swaps in the new version
+# for new sessions, while sessions already under way keep the version they started with
+class ContentStore:
+    def __init__(self, directory, poll_seconds=2.0):
+        self.directory = directory
+        self.poll_seconds = poll_seconds
+        self.versions = {}
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._fingerprint = content_fingerprint(directory)
+        self.current = load_content(directory)
+        self.versions[self.current.version] = self.current
+        self._watcher = None
+
+    # Function to reload if any file changed; a version that fails validation is not used
+    def reload(self):
+        fingerprint = content_fingerprint(self.directory)
+        if fingerprint == self._fingerprint:
+            return False
+        try:
+            content = load_content(self.directory)
+        except (ContentError, OSError) as e:
+            # Keep serving the last good version; the same broken files are not retried until they change again
+            self._fingerprint = fingerprint
+            self.last_error = str(e)
+            print(f"[error] Content not reloaded: {e}", file=sys.stderr)
+            return False
+        with self._lock:
+            self._fingerprint = fingerprint
+            self.last_error = None
+            if content.version == self.current.version:
+                return False
+            self.versions[content.version] = content
+            self.current = content
+            idle = [v for v in self.versions.values() if v is not content and time.time() - v.last_used > VERSION_IDLE_SECONDS]
+            for oldest in sorted(idle, key=lambda v: v.loaded_at)[:max(0, len(self.versions) - MAX_VERSIONS)]:
+                del self.versions[oldest.version]
+        print(f"[info] Content version {content.version} loaded", file=sys.stderr)
+        return True
+
+    def get(self, version):
+        return self.versions.get(version)
+
+    # Function to add a version built outside the content folder (e.g. an edited prompt being evaluated),
+    # so sessions can be pinned to it; it does not become the current version
+    def register(self, content):
+        with self._lock:
+            self.versions.setdefault(content.version, content)
+            return self.versions[content.version]
+
+    def start_watching(self):
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, name="content-watcher", daemon=True)
+            self._watcher.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.poll_seconds)
+            try:
+                self.reload()
+            except Exception as e:
+                print(f"[error] Content watcher: {e}", file=sys.stderr)
+
+_store = None
+_store_lock = threading.Lock()
+
+# Function to get the shared content store (CONTENT_DIR, default ./content next to this file;
+# CONTENT_POLL_SECONDS=0 turns the watcher off)
+def get_content_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                directory = os.getenv("CONTENT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "content"))
+                poll_seconds = float(os.getenv("CONTENT_POLL_SECONDS", "2"))
+                _store = ContentStore(directory, poll_seconds)
+                if poll_seconds > 0:
+                    _store.start_watching()
+    return _store
+
+# Function to get the content version a session uses, pinning it to the current one on first use. A session
+# is never moved to another version part-way: if its version is no longer loaded, ContentError is raised
+def session_content(state):
+    store = get_content_store()
+    version = state.content_version if "content_version" in state else None
+    if not version:
+        content = store.current
+        state.content_version = content.version
+    else:
+        content = store.get(version)
+        if content is None:
+            raise ContentError(f"This conversation used content version {version}, which is no longer loaded. Please start a new conversation.")
+    content.last_used = time.time()
+    return content
+
+# Function to make a content version the one used by the code in this block
+@contextmanager
+def using_content(content):
+    token = _active.set(content)
+    try:
+        yield content
+    finally:
+        _active.reset(token)
+
+# Function to get the content version for the current block (the latest one outside any session)
+def active_content():
+    content = _active.get()
+    return content if content is not None else get_content_store().current
@@ -0,0 +1,89 @@
+import streamlit as st
+import os
+import dotenv
+from datetime import date, timedelta
+from analytics_store import AnalyticsStore, day_number
+from content_store import active_content
+
+# Clinic dashboard; run separately from the patient app with: streamlit run dashboard.py
+dotenv.load_dotenv(override=True)
+
+st.set_page_config(page_title="Screening Analytics", layout="wide")
+
+# Function to get the store shared by every dashboard session (refreshed on each rerun)
+@st.cache_resource
+def get_store(directory):
+    return AnalyticsStore(directory)
+
+# Asks for DASHBOARD_PASSWORD when one is set
+password = os.getenv("DASHBOARD_PASSWORD")
+if password and st.session_state.get("dashboard_password") != password:
+    entered = st.text_input("Dashboard password", type="password")
+    if entered != password:
+        if entered:
+            st.error("Wrong password.")
+        st.stop()
+    st.session_state.dashboard_password = entered
+
+store = get_store(os.getenv("ANALYTICS_DIR", "analytics"))
+refresh_seconds = store.refresh()
+
+st.title("Screening Analytics")
+
+instruments = store.instruments()
+if not instruments:
+    st.info("No questionnaire results have been recorded yet.")
+    st.stop()
+
+# Filters
+today = date.fromordinal(date(1970, 1, 1).toordinal() + day_number())
+with st.sidebar:
+    instrument = st.selectbox("Questionnaire", sorted(instruments))
+    subscale = st.selectbox("Subscale", sorted(instruments[instrument]))
+    period = st.date_input("Dates", (today - timedelta(days=90), today))
+    mode = st.selectbox("Administration", ["all", "full", "adaptive"])
+    st.caption(f"{store.rows['results']:,} result rows, {store.rows['items']:,} item rows, refreshed in {refresh_seconds * 1000:.0f} ms")
+
+start, end = period if len(period) == 2 else (period[0], period[0])
+start_day = start.toordinal() - date(1970, 1, 1).toordinal()
+end_day = end.toordinal() - date(1970, 1, 1).toordinal()
+mode = None if mode == "all" else mode
+
+funnel = store.item_funnel(instrument, start_day, end_day)
+bands = store.band_distribution(instrument, subscale, start_day, end_day, mode)
+trend = store.subscale_trend(instrument, start_day, end_day, mode)
+
+cols = st.columns(3)
+cols[0].metric("Started", f"{funnel['started']:,}")
+cols[1].metric("Completed", f"{funnel['completed']:,}")
+cols[2].metric("Completion rate", "-" if funnel["completion_rate"] is None else f"{funnel['completion_rate']:.1%}")
+
+# Bands by week, in the order the instrument lists them
+st.subheader(f"{subscale.title()} bands by week")
+definition = active_content().instruments.get(instrument, {}).get("interpretation", {})
+band_order = list(dict.fromkeys((definition.get(subscale, {}) if subscale in definition else definition).values()))
+band_order = [band for band in band_order if band in instruments[instrument][subscale]] + [band for band in instruments[instrument][subscale] if band not in band_order]
+st.bar_chart({band: [weeks.get(band, 0) for weeks in bands.values()] for band in band_order} | {"week": [str(week) for week in bands]}, x="week", y=band_order)
+
+st.subheader("Mean score by week")
+subscales = sorted(instruments[instrument])
+st.line_chart({name: [weeks.get(name, (None, 0))[0] for weeks in trend.values()] for name in subscales} | {"week": [str(week) for week in trend]}, x="week", y=subscales)
+
+# Where people stop answering
+st.subheader("Completion and drop-off by question")
+st.dataframe([
+    {
+        "Answer": row["position"],
+        "Reached": row["reached"],
+        "Finished here": row["completed_here"],
+        "Stopped here": row["dropped"],
+        "Drop-off rate": f"{row['drop_rate']:.1%}"
+    }
+    for row in funnel["positions"]
+], use_container_width=True, hide_index=True)
+
+st.subheader("Answers by item")
+st.dataframe([
+    {"Item": row["item"], "Answered": row["answered"], "Mean score": round(row["mean_score"], 2)}
+    for row in funnel["items"]
+], use_container_width=True, hide_index=True)
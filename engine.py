@@ -0,0 +1,711 @@
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime
+
+from admission import AGENT_PRIORITIES, PRIORITY_CRISIS, PRIORITY_SCREENING, AdmissionRejected, current_context, get_admission_controller, is_crisis_message, request_context
+from analytics_store import record_item, record_result
+from content_store import active_content, session_content, using_content
+from fallback_responder import fallback_reply
+from item_planner import next_open_index
+from knowledge import HEALTHCARE_RECOMMENDATIONS, format_passages, get_knowledge_base, search_report
+from model_router import CircuitOpenError, record_latency, record_outcome, route
+from norms import NORMS_FIRST_LOAD_SECONDS, get_population_norms, ordinal
+from preclassifier import get_preclassifier
+from prompts import add_chat_system_prompt, build_screening_prompt, estimate_tokens, parse_screening_result
+from report_store import get_report_store, report_cache_key
+from scoring import administration_summary, format_score, get_band, next_adaptive_index, score_responses
+from singleflight import get_single_flight, request_key
+from transcript_capture import capture_screening_session
+from upstream_pool import UpstreamUnavailable, get_upstream_pool
+
+# Conversation states: screening -> assessment -> awaiting_report -> follow_up
+# ("report" is used briefly while a report is generated straight after a normal screening)
+CHAT_STATES = ["screening", "assessment", "awaiting_report", "report", "follow_up"]
+
+# How many times a call is retried after the upstream answers 429, and how long to hold calls back
+# when it does not say (Retry-After)
+UPSTREAM_THROTTLE_RETRIES = 2
+DEFAULT_THROTTLE_PAUSE_SECONDS = 5
+
+# Follow-up messages sent with each follow-up question, besides the retrieved context
+FOLLOW_UP_RECENT_MESSAGES = 4
+
+# Function used when the caller does not say how to show notices (the Streamlit app passes st.error/st.warning)
+def print_notice(level, text):
+    print(f"[{level}] {text}", file=sys.stderr)
+
+# Function to get the starting values of a session
+def new_session_values():
+    return {
+        "messages": [],
+        "chat_state": "screening",
+        "diagnosis": {
+            "possible_conditions": [],
+            "screening_notes": "",
+            "assessment_results": {},
+            "final_diagnosis": "",
+            "recommendations": "",
+            "report_id": None,
+            "norms": {}
+        },
+        "current_assessment": None,
+        "assessment_responses": {},
+        "assessment_index": 0,
+        "carried_items": {},
+        "last_assessment": None,
+        "report_generated": False,
+        "report": "",
+        "follow_up_start": 0,
+        "content_version": None
+    }
+
+# Function to reset a session (works on a Session or on st.session_state)
+def reset_session(state):
+    for key, value in new_session_values().items():
+        setattr(state, key, value)
+
+# Session state for callers that do not use Streamlit (the HTTP API, scripts and tests)
+class Session:
+    def __init__(self, session_id=None):
+        self.session_id = session_id or uuid.uuid4().hex
+        self.created_at = time.time()
+        self.last_active = self.created_at
+        reset_session(self)
+
+    def __contains__(self, key):
+        return hasattr(self, key)
+
+    def to_dict(self):
+        data = {"session_id": self.session_id}
+        for key in new_session_values():
+            data[key] = getattr(self, key)
+        return data
+    
+    # Function to rebuild a session from to_dict() output (missing keys get their starting values)
+    @classmethod
+    def from_dict(cls, data):
+        session = cls(data.get("session_id"))
+        for key, value in new_session_values().items():
+            if key == "diagnosis":
+                value.update(data.get("diagnosis", {}))
+                session.diagnosis = value
+            elif key in data:
+                setattr(session, key, data[key])
+        return session
+
+# Function to add the welcome messages to a new conversation
+def start_conversation(state):
+    if not state.messages:
+        for welcome_message in session_content(state).welcome_messages:
+            state.messages.append(dict(welcome_message))
+    return state.messages
+
+# Function to make a routed model call
+def create_routed_completion(agent, enhanced_messages, temperature=None, max_tokens=None, timeout=None, on_token=None):
+    routing = route(agent, enhanced_messages)
+    request = {
+        "model": routing["model"],
+        "messages": enhanced_messages,
+        "temperature": routing["temperature"] if temperature is None else temperature,
+        "max_tokens": routing["max_tokens"] if max_tokens is None else max_tokens
+    }
+    # Calls give up at the agent's deadline, so a slow upstream does not hold the patient up
+    if timeout is None and routing["deadline_ms"]:
+        timeout = routing["deadline_ms"] / 1000
+    if timeout is not None:
+        request["timeout"] = timeout
+    
+    # Identical requests already in flight (e.g. the first screening turn after the shared welcome
+    # messages) wait for that call's result instead of going upstream again
+    return get_single_flight().do(request_key(request), lambda publish: call_upstream(agent, routing, request, publish), on_token, agent)
+
+# Function to send one request upstream, after admission control, and record its latency for the router
+def call_upstream(agent, routing, request, on_token=None):
+    # Every call waits its turn in admission control; crisis messages and reports go first
+    controller = get_admission_controller()
+    context = current_context()
+    priority = context.get("priority")
+    if priority is None:
+        priority = AGENT_PRIORITIES.get(agent, PRIORITY_SCREENING)
+    
+    for attempt in range(UPSTREAM_THROTTLE_RETRIES + 1):
+        ticket = controller.admit(context.get("session_id"), priority, routing["prompt_tokens"] + request["max_tokens"], context.get("on_queue"))
+        parts = []
+        lease = None
+        failed = False
+        start = time.perf_counter()
+        try:
+            # The pool picks the endpoint and key with the fewest calls in flight that has quota left
+            lease = get_upstream_pool().acquire(routing["prompt_tokens"] + request["max_tokens"])
+            client = lease.endpoint.client
+            if on_token is None:
+                completion = client.chat.completions.create(**request)
+                parts.append(completion.choices[0].message.content or "")
+                result = completion.choices[0].message.content
+            else:
+                # Streamed call: pass each piece of text on as it arrives and return the full text
+                for chunk in client.chat.completions.create(stream=True, **request):
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        parts.append(chunk.choices[0].delta.content)
+                        on_token(chunk.choices[0].delta.content)
+                result = "".join(parts)
+            record_outcome(routing["model"], True)
+            return result
+        except Exception as e:
+            status_code = get_status_code(e)
+            # The key is over its quota: rest it and try again, on another key if one has room
+            # (when none has, every call is held back for a moment)
+            if status_code == 429 and lease is not None:
+                lease.throttle(get_retry_after(e))
+                if attempt < UPSTREAM_THROTTLE_RETRIES and not parts:
+                    if not get_upstream_pool().has_ready():
+                        controller.pause(get_retry_after(e))
+                    continue
+            # Timeouts, dropped connections and server errors count against the endpoint's health
+            # and towards opening the model's circuit
+            if status_code is None or status_code >= 500:
+                failed = True
+                record_outcome(routing["model"], False)
+            raise
+        finally:
+            used_tokens = routing["prompt_tokens"] + estimate_tokens("".join(parts))
+            if lease is not None:
+                lease.release(used_tokens, failed)
+            record_latency(routing["model"], time.perf_counter() - start)
+            ticket.release(used_tokens)
+
+# Function to read how long the upstream asked us to wait after a 429
+def get_retry_after(error):
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return DEFAULT_THROTTLE_PAUSE_SECONDS
+
+# Function to get the HTTP status of an API error (None for timeouts and connection errors)
+def get_status_code(error):
+    return getattr(error, "status_code", None)
+
+# Function to name why a call fell back: the circuit was open, the deadline passed or the upstream failed
+def get_fallback_reason(error):
+    if isinstance(error, CircuitOpenError):
+        return "circuit_open"
+    if isinstance(error, UpstreamUnavailable):
+        return "no_endpoint"
+    if "Timeout" in type(error).__name__:
+        return "timeout"
+    return "error"
+
+# Function to communicate with the GPT API
+def chat_with_gpt(messages, agent="screening", temperature=None, max_tokens=None, timeout=None, notify=print_notice, on_token=None):
+    try:
+        # Enhanced system prompt with few-shot examples, followed by the conversation history
+        enhanced_messages = add_chat_system_prompt(messages, active_content().prompts["screening"])
+        
+        return create_routed_completion(agent, enhanced_messages, temperature, max_tokens, timeout, on_token)
+    except AdmissionRejected as e:
+        notify("warning", str(e))
+        return "I'm sorry, a lot of people are using this service right now and I couldn't answer in time. Please send your message again in a minute."
+    except Exception as e:
+        if agent == "screening" and get_status_code(e) not in (400, 401, 403, 404):
+            # The model is slow or down: keep the screening going with a stored question instead of stalling
+            notify("warning", "The assistant is responding slowly right now, so this question comes from a prepared set.")
+            return fallback_reply(messages, agent, get_fallback_reason(e), str(e))
+        notify("error", f"API Error: {str(e)}")
+        return f"Sorry, I encountered an error while processing your request. Please try again. Error: {str(e)}"
+
+# Function to communicate with the GPT API for report generation
+def generate_report_with_gpt(messages, notify=print_notice, on_token=None):
+    max_retries = 2
+    retry_count = 0
+    last_error = None
+    
+    while retry_count <= max_retries:
+        try:
+            # Enhanced system prompt for report generation, followed by the conversation history
+            enhanced_messages = add_chat_system_prompt(messages, active_content().prompts["report"])
+            
+            return create_routed_completion("report", enhanced_messages, on_token=on_token)
+        except Exception as e:
+            last_error = e
+            retry_count += 1
+            notify("warning", f"API error on attempt {retry_count}/{max_retries+1}: {str(e)}. Retrying...")
+            time.sleep(2)
+    
+    notify("error", f"Failed to generate report after {max_retries+1} attempts. Last error: {str(last_error)}")
+    raise last_error
+
+# Function to calculate DASS-21 scores
+def calculate_dass_scores(responses):
+    # DASS-21 scoring (items skipped in adaptive mode count as 0)
+    content = active_content()
+    return score_responses(content.instruments["DASS-21"], responses, content.band_tables["DASS-21"])["scores"]
+
+# Function to get DASS-21 interpretation
+def get_dass_interpretation(scores):
+    interpretations = {}
+    for category, score in scores.items():
+        interpretations[category] = get_band(active_content().band_tables["DASS-21"][category], score)
+    return interpretations
+
+# Function to check whether an instrument is given in adaptive mode (ADAPTIVE_ASSESSMENTS overrides the defaults)
+def is_adaptive(assessment_name):
+    override = os.getenv("ADAPTIVE_ASSESSMENTS")
+    if override is not None:
+        return assessment_name in [name.strip() for name in override.split(",")]
+    return active_content().instruments[assessment_name].get("adaptive", False)
+
+# Function to get healthcare recommendations based on assessment results
+def get_healthcare_recommendation(assessment_name, score, interpretation):
+    if assessment_name == "DASS-21":
+        # For DASS-21, we need to determine which category (depression, anxiety, or stress) to use
+        # The interpretation parameter contains the severity level (e.g., "Mild", "Moderate", etc.)
+        # We'll use the first word of the interpretation to determine the category
+        category = interpretation.split()[0].lower()
+        if category in ["normal", "mild", "moderate", "severe", "extremely"]:
+            severity = interpretation
+            return HEALTHCARE_RECOMMENDATIONS[assessment_name]["depression"][severity]
+        else:
+            return HEALTHCARE_RECOMMENDATIONS[assessment_name]["depression"]["Normal"]
+    else:
+        # For PCL-5, we can use the interpretation directly
+        return HEALTHCARE_RECOMMENDATIONS[assessment_name][interpretation]
+
+# Function to determine assessment priorities (skipping questionnaires that are already completed)
+def get_assessment_priorities(conditions, current_assessment=None, completed_assessments=(), suggested_conditions=()):
+    priorities = []
+    
+    # Conditions are in order of priority (as they appear in the list); each is resolved with one index lookup
+    for assessment in active_content().condition_index.resolve_all(conditions):
+        if assessment not in completed_assessments and assessment != current_assessment:
+            priorities.append(assessment)
+    
+    # Conditions suggested by the local pre-classifier are only used when the screening found no questionnaire
+    if not priorities and suggested_conditions:
+        return get_assessment_priorities(suggested_conditions, current_assessment, completed_assessments)
+    
+    return priorities
+
+# Function to get the conditions the local pre-classifier is already confident about (empty without a trained model)
+def get_screening_signals(state, user_input):
+    classifier = get_preclassifier()
+    if classifier is None or is_crisis_message(user_input):
+        return []
+    return classifier.confident_labels([message["content"] for message in state.messages if message["role"] == "user"])
+
+# Function to calculate assessment score and interpretation
+def calculate_assessment_results(assessment_data, responses, band_tables=None):
+    result = score_responses(assessment_data, responses, band_tables)
+    if "scores" in result:
+        return result["scores"], result["interpretations"]
+    return result["score"], result["interpretation"]
+
+# Function to get the ID that admission control uses for a session (None if the state has none)
+def get_session_id(state):
+    return state.session_id if "session_id" in state else None
+
+# Function to handle a chat message from the patient, based on the conversation state
+def handle_user_message(state, user_input, notify=print_notice, on_token=None, on_queue=None):
+    # Model calls for this message are queued under the session, ahead of others if it sounds like a crisis,
+    # and use the prompts and questionnaires the session started with
+    with request_context(get_session_id(state), on_queue, PRIORITY_CRISIS if is_crisis_message(user_input) else None), using_content(session_content(state)):
+        return _handle_user_message(state, user_input, notify, on_token)
+
+def _handle_user_message(state, user_input, notify, on_token):
+    state.messages.append({"role": "user", "content": user_input})
+    
+    if state.chat_state == "screening":
+        response = screening_agent(state, user_input, notify)
+    elif state.chat_state == "assessment":
+        response = "I see you've sent a message during the assessment. Please use the buttons above to answer the current assessment question. If you need to stop the assessment, you can click 'Start New Conversation'."
+        state.messages.append({"role": "assistant", "content": response})
+    elif state.chat_state == "follow_up":
+        response = follow_up_agent(state, user_input, notify, on_token)
+    else:
+        response = "I'm not sure what to do with your message. Please try starting a new conversation."
+        state.messages.append({"role": "assistant", "content": response})
+    
+    return response
+
+# Function for the screening agent
+def screening_agent(state, user_input, notify=print_notice):
+    screening_prompt = build_screening_prompt(state.messages, user_input, active_content().prompts["screening"])
+    
+    # Once the local classifier is confident, ask the model to wrap up instead of asking more questions
+    signals = get_screening_signals(state, user_input)
+    if signals:
+        screening_prompt.append({"role": "system", "content": active_content().prompts["screening_wrap_up"].format(conditions=", ".join(signals))})
+    
+    # Get response from GPT
+    response = chat_with_gpt(screening_prompt, agent="screening", notify=notify)
+    
+    # Check if response contains JSON
+    try:
+        result = parse_screening_result(response)
+        if result is not None:
+            if result.get("screening_complete"):
+                state.diagnosis["possible_conditions"] = result.get("possible_conditions", [])
+                state.diagnosis["screening_notes"] = result.get("notes", "")
+                
+                # Queue the finished screening for the opt-in training capture (handled off the UI thread)
+                capture_screening_session(state.messages, result)
+                state.chat_state = "assessment"
+                
+                # Add a user-friendly response to chat history
+                user_friendly_message = "Thank you for sharing your experiences with me. Based on what you've told me, I have a better understanding of your situation."
+                state.messages.append({"role": "assistant", "content": user_friendly_message})
+                
+                # Prepare for assessment if needed
+                if "normal" not in result.get("possible_conditions", []) and result.get("possible_conditions"):
+                    assessment_priorities = get_assessment_priorities(result.get("possible_conditions", []), completed_assessments=state.diagnosis["assessment_results"], suggested_conditions=signals)
+                    
+                    if not assessment_priorities:
+                        # No questionnaire covers these conditions, so go straight to the report
+                        state.chat_state = "awaiting_report"
+                        no_assessment_message = "Based on your responses, it's important to speak with a healthcare provider for a proper evaluation and discussion of treatment options."
+                        state.messages.append({"role": "assistant", "content": no_assessment_message})
+                        return no_assessment_message
+                    
+                    state.current_assessment = assessment_priorities[0]
+                    assessment_intro = f"Based on our conversation, I'd like to conduct a {active_content().instruments[state.current_assessment]['name']} assessment to better understand your symptoms. Let's begin with the first question."
+                    state.messages.append({"role": "assistant", "content": assessment_intro})
+                    return assessment_intro
+                else:
+                    state.chat_state = "report"
+                    normal_message = "Based on our conversation, it seems you are mentally healthy. However, if you have any concerns or symptoms that are troubling you, please speak with a healthcare provider for a proper evaluation and discussion of treatment options. Here is a report summarizing our conversation:"
+                    state.messages.append({"role": "assistant", "content": normal_message})
+                    generate_report(state, notify)
+                    return None
+            else:
+                state.messages.append({"role": "assistant", "content": response})
+                return response
+    except Exception as e:
+        notify("error", f"Error parsing screening result: {str(e)}")
+        state.messages.append({"role": "assistant", "content": response})
+        return response
+    
+    state.messages.append({"role": "assistant", "content": response})
+    return response
+
+# Function to get the questionnaire item the patient should answer next (None when no questionnaire is running)
+def current_question(state):
+    current = state.current_assessment
+    if state.chat_state != "assessment" or not current:
+        return None
+    assessment_data = session_content(state).instruments[current]
+    
+    # Reset assessment index if switching to a new assessment, past any items carried from an earlier one
+    if state.last_assessment != current:
+        state.assessment_index = 0
+        if current in state.assessment_responses:
+            state.assessment_index = next_open_index(state.assessment_responses[current])
+        state.last_assessment = current
+    
+    if state.assessment_index >= len(assessment_data["questions"]):
+        return None
+    return {
+        "assessment": current,
+        "index": state.assessment_index,
+        "number": state.assessment_index + 1,
+        "question": assessment_data["questions"][state.assessment_index],
+        "options": assessment_data["options"]
+    }
+
+# Function to record the patient's answer to the current item and move the questionnaire on
+def answer_item(state, option_index):
+    with using_content(session_content(state)):
+        return _answer_item(state, option_index)
+
+def _answer_item(state, option_index):
+    question = current_question(state)
+    if question is None:
+        raise ValueError("There is no questionnaire item waiting for an answer.")
+    current = question["assessment"]
+    assessment_data = active_content().instruments[current]
+    band_tables = active_content().band_tables[current]
+    if not 0 <= option_index < len(assessment_data["options"]):
+        raise ValueError(f"Option must be between 0 and {len(assessment_data['options']) - 1}.")
+    
+    state.messages.append({"role": "assistant", "content": f"Question {question['number']}: {question['question']}"})
+    
+    # Responses are stored by item position; items skipped in adaptive mode stay None
+    if current not in state.assessment_responses:
+        state.assessment_responses[current] = [None] * len(assessment_data["questions"])
+    responses = state.assessment_responses[current]
+    adaptive = is_adaptive(current)
+    
+    score = assessment_data["scores"][option_index]
+    if "reverse_scored" in assessment_data and state.assessment_index in assessment_data.get("reverse_scored", []):
+        score = assessment_data["scores"][-option_index-1]
+    
+    responses[state.assessment_index] = score
+    state.messages.append({"role": "user", "content": f"My answer: {assessment_data['options'][option_index]}"})
+    carry_answer(state, current, state.assessment_index, score)
+    
+    if adaptive:
+        next_index = next_adaptive_index(assessment_data, responses, state.assessment_index + 1, band_tables)
+        state.assessment_index = len(assessment_data["questions"]) if next_index is None else next_index
+    else:
+        state.assessment_index = next_open_index(responses, state.assessment_index + 1)
+    
+    complete = state.assessment_index >= len(assessment_data["questions"])
+    answered = sum(1 for response in responses if response is not None)
+    record_item(get_session_id(state), current, question["number"] - 1, score, answered, complete)
+    
+    if not complete:
+        return {"assessment_complete": False, "chat_state": state.chat_state}
+    
+    administration = administration_summary(assessment_data, responses, adaptive, state.carried_items.get(current, []))
+    skipped_note = ""
+    if administration["items_skipped"]:
+        skipped_note = f"\n\n_{len(administration['items_skipped'])} remaining questions were skipped because they could not change your results._"
+    
+    if current == "DASS-21":
+        scores, interpretations = calculate_assessment_results(assessment_data, responses, band_tables)
+        state.diagnosis["assessment_results"][current] = {
+            "scores": scores,
+            "interpretations": interpretations,
+            "administration": administration
+        }
+        
+        result_message = f"""Thank you for completing the questionnaire. Here are your results:
+
+Depression Level: {interpretations['depression']}
+Anxiety Level: {interpretations['anxiety']}
+Stress Level: {interpretations['stress']}{skipped_note}
+
+**Healthcare Recommendations:**
+{get_healthcare_recommendation(current, scores['depression'], interpretations['depression'])}
+
+**Important Disclaimer:**
+This questionnaire is a screening tool and not a clinical diagnosis. The chatbot cannot provide a real medical diagnosis and is not a substitute for professional healthcare. Please consult with a qualified healthcare provider for proper evaluation and treatment."""
+    else:
+        total_score, interpretation = calculate_assessment_results(assessment_data, responses, band_tables)
+        state.diagnosis["assessment_results"][current] = {
+            "score": total_score,
+            "interpretation": interpretation,
+            "administration": administration
+        }
+        
+        result_message = f"""Thank you for completing the questionnaire. Here are your results:
+
+Score: {format_score(state.diagnosis["assessment_results"][current])}
+Interpretation: {interpretation}{skipped_note}
+
+**Healthcare Recommendation:**
+{get_healthcare_recommendation(current, total_score, interpretation)}
+
+**Important Disclaimer:**
+This questionnaire is a screening tool and not a clinical diagnosis. The chatbot cannot provide a real medical diagnosis and is not a substitute for professional healthcare. Please consult with a qualified healthcare provider for proper evaluation and treatment."""
+    
+    state.messages.append({"role": "assistant", "content": result_message})
+    record_result(get_session_id(state), current, state.diagnosis["assessment_results"][current])
+    # Starts loading the norms in the background, so they are ready when the report is written
+    get_population_norms()
+    
+    # Get next assessment based on priority
+    assessment_priorities = get_assessment_priorities(state.diagnosis["possible_conditions"], current, state.diagnosis["assessment_results"])
+    
+    if assessment_priorities:
+        next_assessment = assessment_priorities[0]
+        state.current_assessment = next_assessment
+        state.assessment_index = 0
+        next_assessment_intro = "I have another questionnaire for you to complete. Please answer the following questions honestly."
+        carried = len(state.carried_items.get(next_assessment, []))
+        if carried:
+            next_assessment_intro += f" {carried} of its questions {'was' if carried == 1 else 'were'} already answered by your earlier answers, so {'it is' if carried == 1 else 'they are'} not asked again."
+        state.messages.append({"role": "assistant", "content": next_assessment_intro})
+    else:
+        # No more assessments needed, show generate report button
+        state.chat_state = "awaiting_report"
+        completion_message = """Thank you for completing all the questionnaires. 
+
+You can now generate your comprehensive report by clicking the "Generate Report" button below. The report will include:
+1. A summary of your results
+2. Interpretation of your scores
+3. Recommendations for next steps
+4. Important information about seeking professional help
+
+When you're ready, click the button to generate your report."""
+        state.messages.append({"role": "assistant", "content": completion_message})
+    
+    return {"assessment_complete": True, "assessment": current, "result": state.diagnosis["assessment_results"][current], "chat_state": state.chat_state}
+
+# Function to fill in the items of other questionnaires that share this item, so they are not asked again
+# (only items not yet answered, of questionnaires not yet finished)
+def carry_answer(state, instrument, item, score):
+    content = active_content()
+    for target, target_item, target_score in content.item_links.carried(instrument, item, score):
+        if target in state.diagnosis["assessment_results"]:
+            continue
+        if target not in state.assessment_responses:
+            state.assessment_responses[target] = [None] * len(content.instruments[target]["questions"])
+        if state.assessment_responses[target][target_item] is None:
+            state.assessment_responses[target][target_item] = target_score
+            state.carried_items.setdefault(target, []).append(target_item)
+
+# Function to build the grounding for one follow-up question: stored results, matching report sections
+# and matching reference passages
+def build_follow_up_context(diagnosis, report_id, report, question):
+    context = format_assessment_results(diagnosis)
+    report_sections = search_report(report, question)
+    if report_sections:
+        context += f"\nParts of the patient's report (ID {report_id[:12]}) related to the question:\n{format_passages(report_sections)}\n"
+    passages = get_knowledge_base().search(question)
+    if passages:
+        context += f"\nReference material (use it where it answers the question):\n{format_passages(passages)}\n"
+    return context
+
+# Function for post-report follow-up chat
+def follow_up_agent(state, user_input, notify=print_notice, on_token=None):
+    follow_up_prompt = [
+        {"role": "system", "content": active_content().prompts["follow_up"]}
+    ]
+    
+    # With a stored report, the question is answered from the results, the report sections and the
+    # reference passages that match it, plus the last few follow-up turns, instead of the whole transcript
+    report_id = state.diagnosis.get("report_id")
+    report = get_report_store().get(report_id) if report_id else None
+    if report is not None:
+        follow_up_prompt.append({"role": "system", "content": build_follow_up_context(state.diagnosis, report_id, report, user_input)})
+        history = state.messages[max(state.follow_up_start, len(state.messages) - 1 - FOLLOW_UP_RECENT_MESSAGES):-1]
+    else:
+        history = state.messages
+    
+    # Add chat history
+    for message in history:
+        if message["role"] in ["user", "assistant"]:
+            follow_up_prompt.append(message)
+    
+    # Add current user input
+    follow_up_prompt.append({"role": "user", "content": user_input})
+    
+    # Get response from GPT
+    response = chat_with_gpt(follow_up_prompt, agent="follow_up", notify=notify, on_token=on_token)
+    state.messages.append({"role": "assistant", "content": response})
+    return response
+
+# Function to describe where a score falls among our patients, e.g. "68th percentile of 12,345 patients screened here"
+def format_percentile(norms, subscale):
+    if subscale not in norms:
+        return None
+    return f"{ordinal(norms[subscale]['percentile'])} percentile of {norms[subscale]['sample']:,} patients screened here"
+
+# Function to summarise the assessment results for the report prompt
+def format_assessment_results(diagnosis):
+    assessment_results = "Assessment Results Summary:\n"
+    if any(result.get("administration", {}).get("items_skipped") for result in diagnosis["assessment_results"].values()):
+        assessment_results += "(A score shown as a range, e.g. 14-22, comes from an adaptive questionnaire whose skipped questions could not change the interpretation; the exact score is somewhere in that range.)\n"
+    for assessment, result in diagnosis["assessment_results"].items():
+        assessment_data = active_content().instruments[assessment]
+        norms = diagnosis.get("norms", {}).get(assessment, {})
+        assessment_results += f"- {assessment_data['name']} ({assessment_data['description']})\n"
+        if "scores" in result:
+            # DASS-21 has one score and interpretation per subscale
+            for category in result["scores"]:
+                percentile = format_percentile(norms, category)
+                assessment_results += f"  {category.capitalize()} Score: {format_score(result, category)} ({result['interpretations'][category]}{'; ' + percentile if percentile else ''})\n"
+            assessment_results += "\n"
+        else:
+            percentile = format_percentile(norms, "total")
+            assessment_results += f"  Score: {format_score(result)}{f' ({percentile})' if percentile else ''}\n"
+            assessment_results += f"  Interpretation: {result['interpretation']}\n\n"
+    
+    conditions = ", ".join(diagnosis["possible_conditions"]) if diagnosis["possible_conditions"] else "No specific conditions identified"
+    assessment_results += f"Possible conditions identified during screening: {conditions}\n\n"
+    return assessment_results
+
+# Function to get the conversation sent with the report request
+def report_messages(state):
+    return [message for message in state.messages if message["role"] in ["user", "assistant"]]
+
+# Function to get the date written in a report's header
+def report_date():
+    return datetime.now().strftime('%B %d, %Y')
+
+# Function to fix the session's percentile ranks among our own patients for its report, and get the
+# key the report is cached under
+def prepare_report_key(state, date=None):
+    norms = get_population_norms()
+    norms.ready.wait(NORMS_FIRST_LOAD_SECONDS)
+    state.diagnosis["norms"] = {assessment: norms.result_percentiles(assessment, result) for assessment, result in state.diagnosis["assessment_results"].items()}
+    return report_cache_key(state.diagnosis, session_content(state).prompts["report"], report_messages(state), date or report_date())
+
+# Function to generate a diagnosis report
+def generate_report(state, notify=print_notice, on_token=None, on_queue=None):
+    with request_context(get_session_id(state), on_queue), using_content(session_content(state)):
+        return _generate_report(state, notify, on_token)
+
+def _generate_report(state, notify, on_token):
+    assessment_results = ""
+    try:
+        if not state.diagnosis["assessment_results"]:
+            notify("warning", "No assessments have been completed yet. The report may be limited.")
+        
+        date = report_date()
+        report_id = prepare_report_key(state, date)
+        
+        # Add chat history
+        report_prompt = [{"role": "system", "content": active_content().prompts["report"]}] + report_messages(state)
+        
+        # Add assessment results
+        assessment_results = format_assessment_results(state.diagnosis)
+        
+        # The same conversation and results on the same day give the same report, so reuse a stored one
+        report_store = get_report_store()
+        report = report_store.get(report_id)
+        
+        state.messages.append({"role": "assistant", "content": "report generating..."})
+        if report is None:
+            report_prompt.append({"role": "user", "content": f"Generate a comprehensive diagnosis report based on our conversation and the following assessment results:\n{assessment_results}\nInclude today's date ({date}) in the report header."})
+            report = generate_report_with_gpt(report_prompt, notify, on_token)
+            report_store.put(report_id, report)
+        elif on_token is not None:
+            on_token(report)
+        state.messages.append({"role": "assistant", "content": report})
+        state.diagnosis["report_id"] = report_id
+        state.report = report
+        state.report_generated = True
+        state.chat_state = "follow_up"
+        
+        # Add a message inviting follow-up questions
+        follow_up_invitation = """I've generated your report based on our conversation and assessment results. 
+
+You can now:
+1. Ask questions about your assessment results
+2. Get more information about mental health conditions
+3. Discuss your concerns about the recommendations
+4. Learn more about self-care strategies
+
+What would you like to know more about?"""
+        
+        state.messages.append({"role": "assistant", "content": follow_up_invitation})
+        state.follow_up_start = len(state.messages)
+        return report
+    except Exception as e:
+        error_message = str(e)
+        if "401" in error_message or "无效的令牌" in error_message:
+            notify("error", "Authentication Error: Please check your API key. It appears to be invalid.")
+            raise e
+        error_message = f"Error generating report: {str(e)}"
+        notify("error", error_message)
+        
+        fallback_report = f"""
+        # Mental Health Report
+        
+        ## Date: {datetime.now().strftime('%B %d, %Y')}
+        
+        ### Assessment Results
+        {assessment_results}
+        
+        ### Note
+        There was an issue generating the complete report. Please try restarting the conversation or contact support.
+        
+        This report is not a substitute for professional psychiatric evaluation. Please consult with a mental health professional for a comprehensive assessment.
+        """
+        
+        state.messages.append({"role": "assistant", "content": fallback_report})
+        return fallback_report
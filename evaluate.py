@@ -0,0 +1,378 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from types import SimpleNamespace
+
+import dotenv
+
+from admission import current_context
+from condition_index import get_condition_index, normalize, stem
+from content_store import ContentVersion, get_content_store
+from prompts import estimate_message_tokens, estimate_tokens
+
+# Text that marks the crisis message from the screening prompt
+CRISIS_MARKER = "Are you currently in a safe location?"
+
+# Keywords used by the local stand-in model to pick conditions
+STAND_IN_KEYWORDS = {
+    "depression": ["down", "sad", "hopeless", "empty", "worthless", "hungry", "appetite", "lost my job", "no energy", "nothing to look forward"],
+    "anxiety": ["worry", "worrying", "nervous", "anxious", "panic", "tense", "heart racing", "on edge"],
+    "stress": ["stress", "pressure", "overwhelmed", "deadline", "headaches", "work"],
+    "ptsd": ["accident", "nightmare", "flashback", "trauma", "assault", "startled", "reminds me", "war"]
+}
+STAND_IN_CRISIS_WORDS = ["want to die", "kill myself", "suicide", "end my life"]
+STAND_IN_QUESTIONS = [
+    "I'm sorry you're feeling this way. Can you tell me more about what has been making you feel like this?",
+    "How has this been affecting your daily life? Have you noticed any changes in your sleep or appetite?",
+    "How long have you been feeling this way?"
+]
+
+# Local stand-in for the chat completions endpoint, so the harness runs without network access
+class StandInCompletions:
+    def __init__(self, questions_before_complete=2, latency=0.0):
+        self.questions_before_complete = questions_before_complete
+        self.latency = latency
+
+    def create(self, model, messages, temperature=0.7, max_tokens=1000, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)
+
+        # The app repeats the latest user input, so count distinct patient turns
+        user_turns = []
+        for message in messages:
+            if message["role"] == "user" and message["content"] not in user_turns:
+                user_turns.append(message["content"])
+        patient_text = " ".join(user_turns).lower()
+        latest = user_turns[-1].lower() if user_turns else ""
+
+        if any(word in latest for word in STAND_IN_CRISIS_WORDS):
+            content = f"***\nCall emergency services: 999\n\n**{CRISIS_MARKER}** If not, please seek immediate help using the emergency contacts above.\n*** Do you want to keep going with the screening?"
+        elif len(user_turns) <= self.questions_before_complete:
+            content = STAND_IN_QUESTIONS[min(len(user_turns), len(STAND_IN_QUESTIONS)) - 1]
+        else:
+            hits = []
+            for condition, words in STAND_IN_KEYWORDS.items():
+                count = sum(1 for word in words if word in patient_text)
+                if count:
+                    hits.append((count, condition))
+            hits.sort(key=lambda hit: -hit[0])
+            conditions = [condition for _, condition in hits] or ["normal"]
+            content = json.dumps({"screening_complete": True, "possible_conditions": conditions, "notes": "Stand-in screening result."})
+
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+        usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=estimate_tokens(content), total_tokens=prompt_tokens + estimate_tokens(content))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+class StandInClient:
+    def __init__(self, questions_before_complete=2, latency=0.0):
+        self.chat = SimpleNamespace(completions=StandInCompletions(questions_before_complete, latency))
+
+# Function to create a client for the configured endpoint
+def create_client(endpoint, api_key=None, stand_in_latency=0.0):
+    if endpoint == "local":
+        return StandInClient(latency=stand_in_latency)
+    from openai import OpenAI
+    return OpenAI(api_key=api_key or os.getenv("API_KEY"), base_url=endpoint)
+
+# Function to load the patient scripts (one JSON object per line)
+def load_corpus(path):
+    scripts = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            script = json.loads(line)
+            script.setdefault("id", str(line_number))
+            script.setdefault("labels", [])
+            scripts.append(script)
+    return scripts
+
+# Function to reduce a condition to what it is scored as: the questionnaire scales it resolves to through the
+# condition index, so "anxiety disorder" matches "anxiety" but "post-traumatic stress" does not match "stress".
+# A condition no questionnaire covers ("normal") is kept as its normalised words
+def condition_key(condition, instruments):
+    resolved = get_condition_index(instruments).resolve(condition)
+    if not resolved:
+        return (("", " ".join(normalize(condition))),)
+    tokens = set(normalize(condition))
+    scales = []
+    for name in resolved:
+        subscales = instruments[name].get("subscales")
+        named = [subscale for subscale in subscales if stem(subscale) in tokens] if subscales else ["total"]
+        scales.extend((name, subscale) for subscale in named or [None])
+    return tuple(scales)
+
+# Chat client put in the upstream pool for an evaluation: counts each session's calls, tokens and call
+# latency (by the session ID admission control gives every call) and can send another model than the router chose
+class MeteredClient:
+    def __init__(self, inner, model=None):
+        self.inner = inner
+        self.model = model
+        self.sessions = {}
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages, **kwargs):
+        start = time.perf_counter()
+        completion = self.inner.chat.completions.create(model=self.model or model, messages=messages, **kwargs)
+        if kwargs.get("stream"):
+            return completion
+        elapsed = time.perf_counter() - start
+        usage = getattr(completion, "usage", None)
+        prompt_tokens = usage.prompt_tokens if usage is not None else estimate_message_tokens(messages)
+        completion_tokens = usage.completion_tokens if usage is not None else estimate_tokens(completion.choices[0].message.content or "")
+        with self._lock:
+            metered = self.sessions.setdefault(current_context().get("session_id"), {"prompt_tokens": 0, "completion_tokens": 0, "latencies": []})
+            metered["prompt_tokens"] += prompt_tokens
+            metered["completion_tokens"] += completion_tokens
+            metered["latencies"].append(elapsed)
+        return completion
+
+# Function to get the content version to evaluate: the current one, or a copy with another screening prompt
+# (registered with the store, so sessions can be pinned to it like any other version)
+def evaluation_content(system_prompt=None):
+    store = get_content_store()
+    content = store.current
+    if system_prompt is None or system_prompt == content.prompts["screening"]:
+        return content
+    prompts = dict(content.prompts, screening=system_prompt)
+    version = f"{content.version}-{hashlib.sha256(system_prompt.encode('utf-8')).hexdigest()[:8]}"
+    return store.register(ContentVersion(version, prompts, content.welcome_messages, content.instruments, content.knowledge))
+
+# Function to count the fallback replies given to each session, from the fallback log
+def count_fallbacks(path):
+    counts = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    session_id = json.loads(line).get("session_id")
+                except ValueError:
+                    continue
+                counts[session_id] = counts.get(session_id, 0) + 1
+    return counts
+
+# Function to replay one patient script through the engine, as the app would: routing, admission control,
+# the pre-classifier's wrap-up hint and the local fallback all take part
+def replay_script(engine, script, content):
+    session = {
+        "id": script["id"],
+        "labels": list(script["labels"]),
+        "expects_crisis": bool(script.get("crisis")),
+        "completed": False,
+        "crisis_detected": False,
+        "predicted": [],
+        "turns": 0,
+        "turn_latencies": [],
+        "notices": [],
+        "error": None
+    }
+    state = engine.Session()
+    state.content_version = content.version
+    engine.start_conversation(state)
+    session["session_id"] = state.session_id
+    session_start = time.perf_counter()
+
+    try:
+        for user_input in script["turns"]:
+            start = time.perf_counter()
+            response = engine.handle_user_message(state, user_input, lambda level, text: session["notices"].append(f"[{level}] {text}"))
+            session["turn_latencies"].append(time.perf_counter() - start)
+            session["turns"] += 1
+            if response and CRISIS_MARKER in response:
+                session["crisis_detected"] = True
+            if state.chat_state != "screening":
+                session["completed"] = True
+                session["predicted"] = list(state.diagnosis["possible_conditions"])
+                break
+    except Exception as e:
+        session["error"] = str(e)
+
+    session["session_latency"] = time.perf_counter() - session_start
+    return session
+
+# Function to get a percentile from a list of numbers (nearest rank)
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    # Nearest rank: the smallest value with at least pct% of the values at or below it
+    rank = min(len(ordered), max(1, math.ceil(pct / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+def mean(values):
+    return sum(values) / len(values) if values else None
+
+# Function to score the replayed sessions against their labels
+def summarize(sessions, wall_time, instruments=None):
+    instruments = instruments or get_content_store().current.instruments
+    screened = [s for s in sessions if not s["expects_crisis"]]
+    completed = [s for s in screened if s["completed"]]
+    crisis = [s for s in sessions if s["expects_crisis"]]
+    normal = condition_key("normal", instruments)
+
+    top1_correct = 0
+    exact_matches = 0
+    true_positives = 0
+    predicted_total = 0
+    label_total = 0
+    for session in screened:
+        predicted = list(dict.fromkeys(condition_key(condition, instruments) for condition in session["predicted"]))
+        predicted = [key for key in predicted if key != normal] or predicted
+        labels = {condition_key(label, instruments) for label in session["labels"]}
+        label_total += len(labels)
+        predicted_total += len(predicted)
+        true_positives += len(set(predicted) & labels)
+        if predicted and predicted[0] in labels:
+            top1_correct += 1
+        if set(predicted) == labels:
+            exact_matches += 1
+
+    precision = true_positives / predicted_total if predicted_total else 0.0
+    recall = true_positives / label_total if label_total else 0.0
+    latencies = [latency for s in sessions for latency in s["latencies"]]
+    turn_latencies = [latency for s in sessions for latency in s["turn_latencies"]]
+    tokens = [s["prompt_tokens"] + s["completion_tokens"] for s in sessions]
+
+    return {
+        "sessions": len(sessions),
+        "errors": sum(1 for s in sessions if s["error"]),
+        "completion_rate": len(completed) / len(screened) if screened else None,
+        "top1_accuracy": top1_correct / len(screened) if screened else None,
+        "exact_match_accuracy": exact_matches / len(screened) if screened else None,
+        "precision": precision,
+        "recall": recall,
+        "f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+        "crisis_detection_rate": sum(1 for s in crisis if s["crisis_detected"]) / len(crisis) if crisis else None,
+        "fallback_replies": sum(s["fallbacks"] for s in sessions),
+        "turns_to_completion_mean": mean([s["turns"] for s in completed]),
+        "turns_to_completion_p50": percentile([s["turns"] for s in completed], 50),
+        "tokens_per_session_mean": mean(tokens),
+        "tokens_per_session_p95": percentile(tokens, 95),
+        "prompt_tokens_per_session_mean": mean([s["prompt_tokens"] for s in sessions]),
+        "completion_tokens_per_session_mean": mean([s["completion_tokens"] for s in sessions]),
+        "call_latency_p50_ms": _ms(percentile(latencies, 50)),
+        "call_latency_p90_ms": _ms(percentile(latencies, 90)),
+        "call_latency_p95_ms": _ms(percentile(latencies, 95)),
+        "call_latency_p99_ms": _ms(percentile(latencies, 99)),
+        "turn_latency_p50_ms": _ms(percentile(turn_latencies, 50)),
+        "turn_latency_p95_ms": _ms(percentile(turn_latencies, 95)),
+        "session_latency_p50_ms": _ms(percentile([s["session_latency"] for s in sessions], 50)),
+        "session_latency_p95_ms": _ms(percentile([s["session_latency"] for s in sessions], 95)),
+        "wall_time_s": wall_time
+    }
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+# Function to replay the whole corpus with bounded concurrency. The engine's model calls go to the client
+# (through an upstream pool of just that client); model, if given, replaces the model the router picks
+def run_evaluation(client, model, scripts, concurrency=4, system_prompt=None):
+    import engine
+    from upstream_pool import Endpoint, UpstreamPool, set_upstream_pool
+
+    metered = MeteredClient(client, model)
+    set_upstream_pool(UpstreamPool([Endpoint("evaluate", client=metered)], health_check_seconds=0))
+    content = evaluation_content(system_prompt)
+    fallback_log = os.getenv("FALLBACK_LOG", "fallback_log.jsonl")
+    fallbacks_before = count_fallbacks(fallback_log)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        sessions = list(pool.map(lambda script: replay_script(engine, script, content), scripts))
+    wall_time = time.perf_counter() - start
+    fallbacks = count_fallbacks(fallback_log)
+    for session in sessions:
+        usage = metered.sessions.get(session["session_id"], {})
+        session["prompt_tokens"] = usage.get("prompt_tokens", 0)
+        session["completion_tokens"] = usage.get("completion_tokens", 0)
+        session["latencies"] = usage.get("latencies", [])
+        session["fallbacks"] = fallbacks.get(session["session_id"], 0) - fallbacks_before.get(session["session_id"], 0)
+    return sessions, summarize(sessions, wall_time, content.instruments)
+
+# Function to keep an evaluation's side effects out of the app's files: reports, captured transcripts,
+# analytics and the fallback log go to a scratch folder (the pre-classifier model is still used)
+def isolate():
+    scratch = tempfile.mkdtemp(prefix="evaluate-")
+    os.environ.update({
+        "REPORT_CACHE_DIR": os.path.join(scratch, "report_cache"),
+        "ANALYTICS": "0",
+        "CAPTURE_TRANSCRIPTS": "0",
+        "FALLBACK_LOG": os.path.join(scratch, "fallback_log.jsonl")
+    })
+    return scratch
+
+def print_report(label, summary, sessions):
+    print(f"Evaluation: {label}")
+    for key, value in summary.items():
+        if isinstance(value, float):
+            value = round(value, 4)
+        print(f"  {key}: {value}")
+    for session in sessions:
+        if session["error"]:
+            print(f"  [error] script {session['id']}: {session['error']}")
+        elif not session["expects_crisis"] and not session["completed"]:
+            print(f"  [incomplete] script {session['id']} after {session['turns']} turns")
+
+# Function to evaluate the fine-tuned models waiting in the registry and store each summary there
+def evaluate_registered(scripts, args, system_prompt):
+    from fine_tune_jobs import ModelRegistry
+
+    registry = ModelRegistry()
+    summaries = {}
+    pending = registry.pending_evaluation()
+    if not pending:
+        print(f"No models waiting for evaluation in {registry.path}")
+    for entry in pending:
+        client = create_client(entry["endpoint"], stand_in_latency=args.stand_in_latency)
+        sessions, summary = run_evaluation(client, entry["model"], scripts, args.concurrency, system_prompt)
+        label = f"{entry['model']} @ {entry['endpoint']}"
+        print_report(label, summary, sessions)
+        registry.record_evaluation(entry["model"], label, summary)
+        summaries[entry["model"]] = summary
+    return summaries
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay patient scripts through the screening agent and score the results.")
+    parser.add_argument("--corpus", default="eval_scripts.jsonl", help="JSONL file of patient scripts")
+    parser.add_argument("--endpoint", default="https://xiaoai.plus/v1", help="API base URL, or 'local' for the offline stand-in")
+    parser.add_argument("--model", help="Model to send every call to, e.g. a fine-tuned model from fine_tune.py (default: the models model_config.json routes to)")
+    parser.add_argument("--prompt-file", help="File with a screening system prompt to use instead of the built-in one")
+    parser.add_argument("--concurrency", type=int, default=4, help="Maximum sessions replayed at once")
+    parser.add_argument("--repeat", type=int, default=1, help="Replay the corpus this many times")
+    parser.add_argument("--stand-in-latency", type=float, default=0.0, help="Simulated seconds per call for the local stand-in")
+    parser.add_argument("--output", help="Write the summary and per-session results to this JSON file")
+    parser.add_argument("--registered", action="store_true", help="Evaluate every model registered by fine_tune_jobs.py that has not been evaluated, on its own endpoint")
+    args = parser.parse_args(argv)
+
+    dotenv.load_dotenv()
+    isolate()
+    system_prompt = None
+    if args.prompt_file:
+        with open(args.prompt_file, "r", encoding="utf-8") as f:
+            system_prompt = f.read()
+
+    scripts = load_corpus(args.corpus) * max(1, args.repeat)
+    if args.registered:
+        return evaluate_registered(scripts, args, system_prompt)
+    client = create_client(args.endpoint, stand_in_latency=args.stand_in_latency)
+    sessions, summary = run_evaluation(client, args.model, scripts, args.concurrency, system_prompt)
+
+    label = f"{args.model or 'routed models'} @ {args.endpoint}" + (f" with {args.prompt_file}" if args.prompt_file else "")
+    print_report(label, summary, sessions)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"label": label, "run_at": datetime.now().isoformat(), "summary": summary, "sessions": sessions}, f, indent=2)
+        print(f"Results saved to {args.output}")
+    return summary
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
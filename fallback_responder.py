@@ -0,0 +1,164 @@
+import json
+import os
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+
+from admission import current_context, is_crisis_message
+from condition_index import ConditionIndex
+from content_store import active_content
+from retrieval import BM25Index
+from transcript_capture import deidentify_text
+
+# Asked in turn when nothing in the corpus matches what the patient said; once all have been asked the screening is wrapped up
+GENERIC_QUESTIONS = [
+    "Thank you for telling me about that. Could you tell me a bit more about how it has been affecting your daily life, such as your sleep, appetite or energy?",
+    "How long have you been feeling this way, and has it been getting better, worse or staying about the same?",
+    "Has this been getting in the way of your work, studies or time with family and friends?",
+    "Is there anything else you have been going through lately that you would like me to know about?"
+]
+
+# Notes for a screening result written by the fallback instead of the model
+WRAP_UP_NOTES = "Screening finished by the local fallback while the model was unavailable; conditions are taken from the words the patient used."
+
+# Used for crisis messages if the screening prompt has no emergency example to answer with
+DEFAULT_CRISIS_RESPONSE = """***
+If you are in an immediately dangerous situation, please move to a safe place and call emergency services: 999, or go to your nearest emergency room/A&E department.
+
+**Are you currently in a safe location?**
+*** Do you want to keep going with the screening?"""
+
+# Few-shot turns in the screening prompt: 'User: "..."' / 'Assistant: "..."', each running until the next turn
+EXAMPLE_TURN_PATTERN = re.compile(r'^(User|Assistant): (.*?)(?=^User: |^Assistant: |^Example |^Remember:|\Z)', re.MULTILINE | re.DOTALL)
+
+# How many recent patient messages make up the search query
+QUERY_TURNS = 2
+
+# Function to read therapist questions and the patient message each one answered, from
+# training_data.jsonl-format files (screening results and other non-questions are left out)
+def load_corpus_turns(paths):
+    turns = []
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    messages = json.loads(line).get("messages", [])
+                except (ValueError, AttributeError):
+                    continue
+                last_user = ""
+                for message in messages:
+                    if message.get("role") == "user":
+                        last_user = message["content"]
+                    elif message.get("role") == "assistant" and last_user and "?" in message["content"] and not message["content"].lstrip().startswith("{"):
+                        turns.append({"context": last_user, "response": message["content"], "source": os.path.basename(path), "crisis": is_crisis_message(last_user)})
+    return turns
+
+# Function to read the example turns written into the screening prompt
+def example_turns(screening_prompt):
+    turns = []
+    last_user = ""
+    for role, text in EXAMPLE_TURN_PATTERN.findall(screening_prompt):
+        text = text.strip()
+        if len(text) >= 2 and text[0] == text[-1] == '"':
+            text = text[1:-1]
+        if role == "User":
+            last_user = text
+        elif last_user and "?" in text and not text.startswith("{"):
+            turns.append({"context": last_user, "response": text, "source": "screening prompt", "crisis": is_crisis_message(last_user)})
+    return turns
+
+# Local stand-in for the screening model: finds the stored therapist question whose patient
+# message is closest to what this patient just said
+class FallbackResponder:
+    def __init__(self, turns, instruments=None):
+        self.turns = turns
+        self.index = BM25Index([f"{turn['context']} {turn['response']}" for turn in turns])
+        self.crisis = {i for i, turn in enumerate(turns) if turn["crisis"]}
+        self.ordinary = set(range(len(turns))) - self.crisis
+        # The instruments' condition names, each indexed as itself, to find the ones the patient mentioned
+        instruments = instruments or {}
+        self.conditions = ConditionIndex({phrase: {"conditions": [phrase]} for data in instruments.values() for phrase in data.get("conditions", [])})
+        # Used when the patient named none of them: the main condition of each instrument
+        self.default_conditions = [data["conditions"][0] for data in instruments.values() if data.get("conditions")]
+
+    # Function to finish the screening once there is nothing left to ask: a screening_complete result
+    # with the conditions the patient's messages name
+    def wrap_up(self, patient_turns):
+        conditions = self.conditions.resolve_all(patient_turns) or self.default_conditions
+        return json.dumps({"screening_complete": True, "possible_conditions": conditions, "notes": WRAP_UP_NOTES})
+
+    # Function to pick a reply for a conversation: (text, the turn it came from, or None for a general question)
+    def respond(self, messages):
+        patient_turns = [message["content"] for message in messages if message["role"] == "user"]
+        query = " ".join(patient_turns[-QUERY_TURNS:])
+        crisis = bool(patient_turns) and is_crisis_message(patient_turns[-1])
+        # Questions already asked in this conversation are not asked again
+        asked = {message["content"] for message in messages if message["role"] == "assistant"}
+        allowed = {i for i in (self.crisis if crisis else self.ordinary) if self.turns[i]["response"] not in asked}
+        for document, score in self.index.search(query, k=1, allowed=allowed):
+            return self.turns[document]["response"], dict(self.turns[document], score=round(score, 3))
+        if crisis:
+            # Safety information always comes first, even if it has been given already
+            crisis_turns = [self.turns[i] for i in sorted(self.crisis)]
+            return (crisis_turns[0]["response"], crisis_turns[0]) if crisis_turns else (DEFAULT_CRISIS_RESPONSE, None)
+        for question in GENERIC_QUESTIONS:
+            if question not in asked:
+                return question, None
+        return self.wrap_up(patient_turns), {"source": "wrap-up"}
+
+_responder = None
+_responder_key = None
+_responder_lock = threading.Lock()
+_log_lock = threading.Lock()
+_stats = {"used": 0, "by_reason": {}}
+
+# Function to get the responder for the active content version, built from the screening prompt's
+# examples and the FALLBACK_CORPUS files (comma-separated, default training_data.jsonl)
+def get_fallback_responder():
+    global _responder, _responder_key
+    content = active_content()
+    paths = [path.strip() for path in os.getenv("FALLBACK_CORPUS", "training_data.jsonl").split(",") if path.strip()]
+    key = (content.version, tuple((path, os.path.getmtime(path) if os.path.exists(path) else None) for path in paths))
+    if key != _responder_key:
+        with _responder_lock:
+            if key != _responder_key:
+                _responder = FallbackResponder(example_turns(content.prompts["screening"]) + load_corpus_turns(paths), content.instruments)
+                _responder_key = key
+    return _responder
+
+# Function to answer without the model and record that it happened (FALLBACK_LOG, default fallback_log.jsonl)
+def fallback_reply(messages, agent, reason, error=None):
+    start = time.perf_counter()
+    text, match = get_fallback_responder().respond(messages)
+    patient_turns = [message["content"] for message in messages if message["role"] == "user"]
+    entry = {
+        "time": datetime.now().isoformat(),
+        "session_id": current_context().get("session_id"),
+        "agent": agent,
+        "reason": reason,
+        "error": error,
+        "patient_message": deidentify_text(patient_turns[-1]) if patient_turns else "",
+        "response": text,
+        "source": match["source"] if match else "default",
+        "score": match.get("score") if match else None,
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 3)
+    }
+    with _log_lock:
+        _stats["used"] += 1
+        _stats["by_reason"][reason] = _stats["by_reason"].get(reason, 0) + 1
+        try:
+            with open(os.getenv("FALLBACK_LOG", "fallback_log.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"[error] Could not record fallback reply: {e}", file=sys.stderr)
+    return text
+
+def fallback_snapshot():
+    with _log_lock:
+        return {"used": _stats["used"], "by_reason": dict(_stats["by_reason"])}
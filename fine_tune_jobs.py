@@ -0,0 +1,514 @@
+import argparse
+import asyncio
+import hashlib
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+
+# Job statuses after which a job is not polled again
+TERMINAL_STATUSES = {"succeeded", "failed", "cancelled"}
+
+# A job is polled soon after each change, then less and less often while nothing changes
+POLL_START_SECONDS = 10
+POLL_MAX_SECONDS = 300
+
+# Attempts at an upload or job creation before the run gives up on it
+CREATE_ATTEMPTS = 5
+
+DEFAULT_BASE_MODEL = "gpt-4o"
+DEFAULT_ENDPOINT = "https://xiaoai.plus/v1"
+
+# Function to get the status code of an API error (None for timeouts and connection errors)
+def get_status_code(error):
+    return getattr(error, "status_code", None)
+
+# Function to check a training file before it is uploaded; returns how many conversations it has
+def validate_training_file(path):
+    examples = 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                messages = json.loads(line)["messages"]
+            except (ValueError, KeyError, TypeError):
+                raise ValueError(f"{path} line {line_number}: expected {{\"messages\": [...]}}")
+            if not messages or any(not isinstance(m, dict) or "role" not in m or "content" not in m for m in messages):
+                raise ValueError(f"{path} line {line_number}: every message needs a role and content")
+            examples += 1
+    if not examples:
+        raise ValueError(f"{path} has no conversations")
+    return examples
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Function to list the sweep: every combination of the hyperparameter values given
+def sweep_grid(epochs, batch_sizes, learning_rates):
+    return [
+        {"n_epochs": n_epochs, "batch_size": batch_size, "learning_rate_multiplier": learning_rate}
+        for n_epochs, batch_size, learning_rate in itertools.product(epochs, batch_sizes, learning_rates)
+    ]
+
+# Function to name a job after its shard and hyperparameters, e.g. "shard-1-e3-b1-lr0.1"
+def job_key(path, hyperparameters):
+    name = os.path.splitext(os.path.basename(path))[0]
+    return f"{name}-e{hyperparameters['n_epochs']}-b{hyperparameters['batch_size']}-lr{hyperparameters['learning_rate_multiplier']:g}"
+
+# A run's state in <run folder>/state.json, rewritten whole after every change so a run can resume
+class RunState:
+    def __init__(self, directory, data):
+        self.directory = directory
+        self.path = os.path.join(directory, "state.json")
+        self.data = data
+
+    @classmethod
+    def create(cls, directory, endpoint, base_model, training_files, validation_file, grid):
+        if os.path.exists(os.path.join(directory, "state.json")):
+            raise ValueError(f"{directory} already has a run; use resume")
+        os.makedirs(directory, exist_ok=True)
+        files = {}
+        for path in training_files + ([validation_file] if validation_file else []):
+            files[path] = {"sha256": file_digest(path), "examples": validate_training_file(path), "file_id": None, "status": "pending"}
+        jobs = {}
+        for path in training_files:
+            for hyperparameters in grid:
+                jobs[job_key(path, hyperparameters)] = {
+                    "training_file": path,
+                    "hyperparameters": hyperparameters,
+                    "job_id": None,
+                    "status": "pending",
+                    "fine_tuned_model": None,
+                    "error": None,
+                    "polls": 0,
+                    "history": []
+                }
+        state = cls(directory, {
+            "created": time.time(),
+            "endpoint": endpoint,
+            "base_model": base_model,
+            "validation_file": validation_file,
+            "files": files,
+            "jobs": jobs
+        })
+        state.save()
+        return state
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, "state.json"), "r", encoding="utf-8") as f:
+            return cls(directory, json.load(f))
+
+    def save(self):
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=2)
+        os.replace(temp_path, self.path)
+
+    def counts(self):
+        counts = {}
+        for job in self.data["jobs"].values():
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+        return counts
+
+# Fine-tuned models waiting for (or done with) evaluation, in FINE_TUNED_MODELS (default fine_tuned_models.json)
+class ModelRegistry:
+    def __init__(self, path=None):
+        self.path = path or os.getenv("FINE_TUNED_MODELS", "fine_tuned_models.json")
+        self._lock = threading.Lock()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)["models"]
+
+    def _save(self, models):
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"models": models}, f, indent=2)
+        os.replace(temp_path, self.path)
+
+    # Function to add a model (registering the same model again changes nothing)
+    def register(self, model, **details):
+        with self._lock:
+            models = self.load()
+            if any(entry["model"] == model for entry in models):
+                return False
+            models.append({"model": model, "registered_at": datetime.now().isoformat(), **details, "evaluation": None})
+            self._save(models)
+            return True
+
+    # Function to store an evaluation summary against a model
+    def record_evaluation(self, model, label, summary):
+        with self._lock:
+            models = self.load()
+            for entry in models:
+                if entry["model"] == model:
+                    entry["evaluation"] = {"label": label, "run_at": datetime.now().isoformat(), "summary": summary}
+            self._save(models)
+
+    def pending_evaluation(self):
+        return [entry for entry in self.load() if entry["evaluation"] is None]
+
+# Uploads a run's shards and runs its jobs. Client calls block, so each runs on a worker thread while
+# the event loop keeps every other upload and poll going
+class FineTuneOrchestrator:
+    def __init__(self, client, state, registry=None, max_uploads=4, max_jobs=3, poll_start=POLL_START_SECONDS, poll_max=POLL_MAX_SECONDS, log=print):
+        self.client = client
+        self.state = state
+        self.registry = registry or ModelRegistry()
+        self.max_uploads = max(1, max_uploads)
+        self.max_jobs = max(1, max_jobs)
+        self.poll_start = poll_start
+        self.poll_max = poll_max
+        self.log = log
+
+    async def run(self):
+        self._upload_slots = asyncio.Semaphore(self.max_uploads)
+        self._job_slots = asyncio.Semaphore(self.max_jobs)
+        uploads = await asyncio.gather(*(self.upload(path) for path in self.state.data["files"]), return_exceptions=True)
+        for path, outcome in zip(self.state.data["files"], uploads):
+            if isinstance(outcome, Exception):
+                self.log(f"[error] Upload of {path} failed: {outcome}")
+        await asyncio.gather(*(self.run_job(key) for key in self.state.data["jobs"]))
+        return self.state.counts()
+
+    # Function to retry a client call with exponential backoff; errors other than 429 and server errors are final
+    async def _call(self, description, function, *args, **kwargs):
+        delay = 1.0
+        for attempt in range(1, CREATE_ATTEMPTS + 1):
+            try:
+                return await asyncio.to_thread(function, *args, **kwargs)
+            except Exception as e:
+                status = get_status_code(e)
+                if attempt == CREATE_ATTEMPTS or (status is not None and status != 429 and status < 500):
+                    raise
+                self.log(f"[retry] {description} ({e}); trying again in {delay:.0f} s")
+                await asyncio.sleep(delay * random.uniform(0.8, 1.2))
+                delay *= 2
+
+    def _create_file(self, path):
+        with open(path, "rb") as f:
+            return self.client.files.create(file=f, purpose="fine-tune")
+
+    async def upload(self, path):
+        entry = self.state.data["files"][path]
+        if entry["file_id"]:
+            return entry["file_id"]
+        if file_digest(path) != entry["sha256"]:
+            raise ValueError(f"{path} changed since the run was created")
+        async with self._upload_slots:
+            response = await self._call(f"uploading {path}", self._create_file, path)
+        entry["file_id"] = response.id
+        entry["status"] = "uploaded"
+        self.state.save()
+        self.log(f"Uploaded {path} ({entry['examples']} conversations) as {response.id}")
+        return response.id
+
+    # Function to find a job this run created but did not get to record (it stopped during the call)
+    def _find_created_job(self, training_file_id, hyperparameters):
+        for job in self.client.fine_tuning.jobs.list(limit=100).data:
+            if job.training_file != training_file_id or (job.created_at or 0) < self.state.data["created"] - 60:
+                continue
+            if all(getattr(job.hyperparameters, name, None) == value for name, value in hyperparameters.items()):
+                return job
+        return None
+
+    async def create_job(self, key):
+        job = self.state.data["jobs"][key]
+        training_file_id = self.state.data["files"][job["training_file"]]["file_id"]
+        if training_file_id is None:
+            job["status"] = "failed"
+            job["error"] = "training file was not uploaded"
+            self.state.save()
+            return
+        if job["status"] == "creating":
+            found = await asyncio.to_thread(self._find_created_job, training_file_id, job["hyperparameters"])
+            if found is not None:
+                job["job_id"] = found.id
+                self.state.save()
+                self.log(f"{key}: picked up {found.id}, created before the run stopped")
+                return
+        # Recorded before the call, so a resumed run looks for the job instead of starting a second one
+        job["status"] = "creating"
+        self.state.save()
+        validation_file = self.state.data["validation_file"]
+        request = {"training_file": training_file_id, "model": self.state.data["base_model"], "hyperparameters": job["hyperparameters"]}
+        if validation_file:
+            request["validation_file"] = self.state.data["files"][validation_file]["file_id"]
+        try:
+            response = await self._call(f"creating {key}", self.client.fine_tuning.jobs.create, **request)
+        except Exception as e:
+            job["status"] = "failed"
+            job["error"] = str(e)
+            self.state.save()
+            self.log(f"[error] {key}: could not create the job: {e}")
+            return
+        job["job_id"] = response.id
+        job["status"] = response.status
+        self.state.save()
+        self.log(f"{key}: created {response.id}")
+
+    async def run_job(self, key):
+        job = self.state.data["jobs"][key]
+        if job["status"] in TERMINAL_STATUSES:
+            self._register(key)
+            return
+        async with self._job_slots:
+            if not job["job_id"]:
+                await self.create_job(key)
+            if job["job_id"]:
+                await self.poll(key)
+        self._register(key)
+
+    # Function to poll one job until it finishes: the wait doubles while the status stays the same and
+    # starts over when it changes; errors also double it, or wait for the Retry-After the server gives
+    async def poll(self, key):
+        job = self.state.data["jobs"][key]
+        delay = self.poll_start
+        while True:
+            try:
+                response = await asyncio.to_thread(self.client.fine_tuning.jobs.retrieve, job["job_id"])
+            except Exception as e:
+                status = get_status_code(e)
+                if status is not None and status != 429 and status < 500:
+                    job["status"] = "failed"
+                    job["error"] = f"status check failed: {e}"
+                    self.state.save()
+                    self.log(f"[error] {key}: {job['error']}")
+                    return
+                retry_after = getattr(getattr(e, "response", None), "headers", {}).get("retry-after")
+                delay = float(retry_after) if retry_after else min(delay * 2, self.poll_max)
+                self.log(f"[retry] {key}: status check failed ({e}); next check in {delay:.1f} s")
+                await asyncio.sleep(delay)
+                continue
+            job["polls"] += 1
+            if response.status != job["status"]:
+                job["status"] = response.status
+                job["history"].append({"status": response.status, "at": time.time()})
+                job["fine_tuned_model"] = response.fine_tuned_model
+                error = getattr(response, "error", None)
+                job["error"] = getattr(error, "message", None) if error else None
+                job["trained_tokens"] = getattr(response, "trained_tokens", None)
+                self.state.save()
+                self.log(f"{key}: {response.status}" + (f" -> {response.fine_tuned_model}" if response.fine_tuned_model else ""))
+                delay = self.poll_start
+            else:
+                delay = min(delay * 2, self.poll_max)
+            if response.status in TERMINAL_STATUSES:
+                return
+            await asyncio.sleep(delay * random.uniform(0.9, 1.1))
+
+    def _register(self, key):
+        job = self.state.data["jobs"][key]
+        if job["status"] != "succeeded" or not job["fine_tuned_model"]:
+            return
+        added = self.registry.register(
+            job["fine_tuned_model"],
+            base_model=self.state.data["base_model"],
+            endpoint=self.state.data["endpoint"],
+            job_id=job["job_id"],
+            run=os.path.basename(os.path.normpath(self.state.directory)),
+            training_file=job["training_file"],
+            hyperparameters=job["hyperparameters"],
+            trained_tokens=job.get("trained_tokens")
+        )
+        if added:
+            self.log(f"{key}: registered {job['fine_tuned_model']} for evaluation")
+
+# Local stand-in for the files and fine-tuning endpoints. Jobs move through the real statuses on a clock
+# and are kept in a JSON file, so a run can be stopped and resumed against it
+class StandInFineTuningClient:
+    def __init__(self, path, step_seconds=0.5, latency=0.05, fail_rate=0.0, error_rate=0.0, seed=None):
+        self.path = path
+        self.step_seconds = step_seconds
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.files = SimpleNamespace(create=self._create_file)
+        self.fine_tuning = SimpleNamespace(jobs=SimpleNamespace(create=self._create_job, retrieve=self._retrieve_job, list=self._list_jobs))
+
+    def _table(self):
+        if not os.path.exists(self.path):
+            return {"files": {}, "jobs": {}}
+        with open(self.path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save(self, table):
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(table, f)
+
+    def _enter(self):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            failing = self.random.random() < self.error_rate
+        if failing:
+            error = RuntimeError("Stand-in rate limit")
+            error.status_code = 429
+            raise error
+
+    def _create_file(self, file, purpose):
+        self._enter()
+        content = file.read()
+        file_id = "file-" + hashlib.sha256(content).hexdigest()[:24]
+        with self._lock:
+            table = self._table()
+            table["files"][file_id] = {"bytes": len(content), "purpose": purpose}
+            self._save(table)
+        return SimpleNamespace(id=file_id, bytes=len(content), purpose=purpose)
+
+    def _create_job(self, training_file, model, hyperparameters=None, validation_file=None, **kwargs):
+        self._enter()
+        with self._lock:
+            table = self._table()
+            if training_file not in table["files"]:
+                error = RuntimeError(f"No such file: {training_file}")
+                error.status_code = 400
+                raise error
+            job_id = f"ftjob-local-{uuid.uuid4().hex[:12]}"
+            table["jobs"][job_id] = {
+                "model": model,
+                "training_file": training_file,
+                "validation_file": validation_file,
+                "hyperparameters": hyperparameters or {},
+                "created_at": time.time(),
+                "fails": self.random.random() < self.fail_rate
+            }
+            self._save(table)
+        return self._view(job_id, table["jobs"][job_id])
+
+    # Function to work out where a job is: validating, queued, one step per epoch running, then done
+    def _view(self, job_id, job):
+        steps = (time.time() - job["created_at"]) / self.step_seconds
+        epochs = job["hyperparameters"].get("n_epochs", 3)
+        fine_tuned_model = None
+        error = None
+        if steps < 1:
+            status = "validating_files"
+        elif steps < 2:
+            status = "queued"
+        elif steps < 2 + epochs:
+            status = "running"
+        elif job["fails"]:
+            status = "failed"
+            error = SimpleNamespace(message="Stand-in training failure")
+        else:
+            status = "succeeded"
+            fine_tuned_model = f"ft:{job['model']}:stand-in::{job_id[-8:]}"
+        return SimpleNamespace(
+            id=job_id,
+            status=status,
+            model=job["model"],
+            training_file=job["training_file"],
+            created_at=job["created_at"],
+            hyperparameters=SimpleNamespace(**job["hyperparameters"]),
+            fine_tuned_model=fine_tuned_model,
+            trained_tokens=1000 * epochs if status == "succeeded" else None,
+            error=error
+        )
+
+    def _retrieve_job(self, job_id):
+        self._enter()
+        with self._lock:
+            job = self._table()["jobs"].get(job_id)
+        if job is None:
+            error = RuntimeError(f"No such job: {job_id}")
+            error.status_code = 404
+            raise error
+        return self._view(job_id, job)
+
+    def _list_jobs(self, limit=20):
+        self._enter()
+        with self._lock:
+            jobs = self._table()["jobs"]
+        return SimpleNamespace(data=[self._view(job_id, job) for job_id, job in list(jobs.items())[-limit:]])
+
+# Function to create a client for the endpoint ("local" for the stand-in, kept in the run folder)
+def create_client(endpoint, run_directory, stand_in=None):
+    if endpoint == "local":
+        return StandInFineTuningClient(os.path.join(run_directory, "stand_in.json"), **(stand_in or {}))
+    from openai import OpenAI
+    return OpenAI(api_key=os.getenv("API_KEY"), base_url=endpoint)
+
+def print_status(state):
+    print(f"{'job':<32} {'status':<18} {'polls':>5}  model")
+    for key, job in state.data["jobs"].items():
+        print(f"{key:<32} {job['status']:<18} {job['polls']:>5}  {job['fine_tuned_model'] or job['error'] or '-'}")
+    print(", ".join(f"{count} {status}" for status, count in sorted(state.counts().items())))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Upload training shards and run a fine-tuning sweep, resumably.")
+    parser.add_argument("--runs-dir", default="fine_tune_runs", help="Folder that holds each run's state")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Start a new run")
+    run_parser.add_argument("name", help="Run name (its folder under --runs-dir)")
+    run_parser.add_argument("--training", nargs="+", required=True, help="Training shards in the training_data.jsonl format; each gets every sweep job")
+    run_parser.add_argument("--validation", help="Validation file shared by every job")
+    run_parser.add_argument("--model", default=DEFAULT_BASE_MODEL, help="Base model to fine-tune")
+    run_parser.add_argument("--epochs", type=int, nargs="+", default=[3])
+    run_parser.add_argument("--batch-size", type=int, nargs="+", default=[1])
+    run_parser.add_argument("--learning-rate", type=float, nargs="+", default=[0.1], help="Learning rate multipliers")
+    run_parser.add_argument("--endpoint", default=DEFAULT_ENDPOINT, help="API base URL, or 'local' for the offline stand-in")
+
+    for name, text in [("resume", "Carry on with a run that stopped"), ("status", "Show a run's jobs")]:
+        sub = subparsers.add_parser(name, help=text)
+        sub.add_argument("name")
+    for sub in [run_parser, subparsers.choices["resume"]]:
+        sub.add_argument("--max-uploads", type=int, default=4, help="Uploads at once")
+        sub.add_argument("--max-jobs", type=int, default=3, help="Jobs created and in progress at once")
+        sub.add_argument("--poll-start", type=float, default=POLL_START_SECONDS, help="Seconds before the first status check")
+        sub.add_argument("--poll-max", type=float, default=POLL_MAX_SECONDS, help="Longest wait between status checks")
+        sub.add_argument("--stand-in-step", type=float, default=0.5, help="Seconds per stage (and per epoch) for the local stand-in")
+        sub.add_argument("--stand-in-fail-rate", type=float, default=0.0, help="Share of stand-in jobs that fail")
+        sub.add_argument("--stand-in-error-rate", type=float, default=0.0, help="Share of stand-in calls answered with 429")
+    args = parser.parse_args(argv)
+
+    import dotenv
+    dotenv.load_dotenv()
+    directory = os.path.join(args.runs_dir, args.name)
+    if args.command == "status":
+        print_status(RunState.load(directory))
+        return
+
+    try:
+        if args.command == "run":
+            grid = sweep_grid(args.epochs, args.batch_size, args.learning_rate)
+            state = RunState.create(directory, args.endpoint, args.model, args.training, args.validation, grid)
+            print(f"Run {args.name}: {len(args.training)} shards x {len(grid)} settings = {len(state.data['jobs'])} jobs")
+        else:
+            state = RunState.load(directory)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    stand_in = {"step_seconds": args.stand_in_step, "fail_rate": args.stand_in_fail_rate, "error_rate": args.stand_in_error_rate}
+    client = create_client(state.data["endpoint"], directory, stand_in)
+    orchestrator = FineTuneOrchestrator(client, state, max_uploads=args.max_uploads, max_jobs=args.max_jobs, poll_start=args.poll_start, poll_max=args.poll_max)
+    start = time.perf_counter()
+    try:
+        asyncio.run(orchestrator.run())
+    except KeyboardInterrupt:
+        print(f"Stopped; carry on with: python fine_tune_jobs.py resume {args.name}", file=sys.stderr)
+        sys.exit(130)
+    print(f"Finished in {time.perf_counter() - start:.1f} s")
+    print_status(state)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,86 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Modules that scoring tools and workers import; none of them may load a heavy dependency at import time
+CORE_MODULES = [
+    "scoring", "condition_index", "prompts", "content_store", "rate_limit", "report_store", "report_export",
+    "preclassifier", "admission", "singleflight", "model_router", "transcript_capture", "retrieval", "fallback_responder",
+    "knowledge", "cassette", "upstream_pool", "analytics_store", "norms", "item_planner", "engine", "batch_reports", "score"
+]
+
+# Packages that are only imported on first use (the model client, the UI and .env loading)
+HEAVY_MODULES = ["openai", "httpx", "pydantic", "streamlit", "dotenv", "pandas", "numpy"]
+
+# Each import runs in a fresh interpreter, so the time is what a new process pays
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "heavy": [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+# Function to time importing one module in a new interpreter: (milliseconds, heavy modules it loaded)
+def measure(module, python=sys.executable):
+    # Bytecode is always written, so the times are those of a deployed process rather than of compiling
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    output = subprocess.run(
+        [python, "-c", PROBE.format(module=module, heavy=HEAVY_MODULES)],
+        capture_output=True, text=True, check=True, env=env
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    return result["ms"], result["heavy"]
+
+# Function to measure every module several times, taking the median
+def run_benchmark(modules, runs=5, budget_ms=50.0):
+    results = []
+    for module in modules:
+        # The first import compiles the bytecode and is not counted
+        _, heavy = measure(module)
+        times = []
+        for _ in range(runs):
+            ms, heavy = measure(module)
+            times.append(ms)
+        median = statistics.median(times)
+        results.append({
+            "module": module,
+            "median_ms": round(median, 1),
+            "max_ms": round(max(times), 1),
+            "heavy": heavy,
+            "ok": median <= budget_ms and not heavy
+        })
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that the core modules import quickly and without the model client or UI packages.")
+    parser.add_argument("modules", nargs="*", default=CORE_MODULES, help="Modules to time (default: the core modules)")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per module; the median is reported")
+    parser.add_argument("--budget-ms", type=float, default=50.0, help="Slowest acceptable median import time")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        results = run_benchmark(args.modules, args.runs, args.budget_ms)
+    except subprocess.CalledProcessError as e:
+        print(f"Import failed:\n{e.stderr}", file=sys.stderr)
+        sys.exit(2)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'module':<20} {'median ms':>10} {'max ms':>8}  heavy imports")
+        for result in results:
+            flag = "" if result["ok"] else "  <-- over budget" if not result["heavy"] else "  <-- loads heavy packages"
+            print(f"{result['module']:<20} {result['median_ms']:>10} {result['max_ms']:>8}  {', '.join(result['heavy']) or '-'}{flag}")
+    failures = [result["module"] for result in results if not result["ok"]]
+    if failures:
+        print(f"Failed ({args.budget_ms:g} ms budget, no heavy imports): {', '.join(failures)}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,69 @@
+import argparse
+import sys
+
+# Items of one questionnaire that are answered from an item of another, as declared in the receiving
+# instrument's "shared_items": [{"item", "from", "from_item", "score_map", "source"}]. score_map[k] is the
+# score the item gets when the "from" item scored k, so differing response scales and reverse scoring are
+# settled in the content, where the validated mapping is cited
+class ItemLinks:
+    def __init__(self, instruments):
+        # {(from instrument, from item): [(instrument, item, score_map), ...]}
+        self.targets = {}
+        for name, data in instruments.items():
+            for link in data.get("shared_items", []):
+                self.targets.setdefault((link["from"], link["from_item"]), []).append((name, link["item"], link["score_map"]))
+
+    def __bool__(self):
+        return bool(self.targets)
+
+    # Function to get the answers an item's score carries to other questionnaires: [(instrument, item, score)]
+    def carried(self, instrument, item, score):
+        return [(target, target_item, score_map[score]) for target, target_item, score_map in self.targets.get((instrument, item), [])]
+
+# Function to find the next item still to be asked, from start on (len(responses) when there is none)
+def next_open_index(responses, start=0):
+    for index in range(start, len(responses)):
+        if responses[index] is None:
+            return index
+    return len(responses)
+
+# Function to build the merged item schedule for questionnaires given in the order queued: {"asked":
+# [(instrument, item)], "carried": [(instrument, item, from instrument, from item)]}. An item is carried
+# when a questionnaire earlier in the queue asks an item it is linked to
+def plan_items(instruments, queue, links):
+    asked = []
+    carried = []
+    covered = {}
+    for name in queue:
+        for index in range(len(instruments[name]["questions"])):
+            if (name, index) in covered:
+                carried.append((name, index) + covered[(name, index)])
+                continue
+            asked.append((name, index))
+            for target, target_item, _ in links.targets.get((name, index), []):
+                covered.setdefault((target, target_item), (name, index))
+    return {"asked": asked, "carried": carried}
+
+def main(argv=None):
+    from content_store import load_content
+
+    parser = argparse.ArgumentParser(description="Show the merged item schedule for questionnaires given one after another.")
+    parser.add_argument("assessments", nargs="+", help="Questionnaires in the order they are queued, e.g. DASS-21 PCL-5")
+    parser.add_argument("--content", default="content", help="Content folder")
+    args = parser.parse_args(argv)
+
+    content = load_content(args.content)
+    missing = [name for name in args.assessments if name not in content.instruments]
+    if missing:
+        parser.error(f"unknown questionnaires: {', '.join(missing)} (known: {', '.join(content.instruments)})")
+    plan = plan_items(content.instruments, args.assessments, content.item_links)
+    total = len(plan["asked"]) + len(plan["carried"])
+    print(f"{len(plan['asked'])} of {total} items asked, {len(plan['carried'])} carried from an earlier answer")
+    for name, index, from_name, from_index in plan["carried"]:
+        link = next(link for link in content.instruments[name]["shared_items"] if link["item"] == index and link["from"] == from_name)
+        print(f"  {name} Q{index + 1} <- {from_name} Q{from_index + 1} ({link['source']})")
+    if not content.item_links:
+        print("No instrument declares shared items; see \"shared_items\" in the README")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,148 @@
+import argparse
+import re
+import sys
+import threading
+import time
+
+from content_store import active_content
+from retrieval import BM25Index
+
+# Passages sent with each follow-up question: reference material, and sections of the patient's own report
+KNOWLEDGE_PASSAGES = 3
+REPORT_PASSAGES = 2
+
+# Advice shown with questionnaire results, by instrument, subscale and band
+HEALTHCARE_RECOMMENDATIONS = {
+    "DASS-21": {
+        "depression": {
+            "Normal": "Your depression symptoms appear to be within normal range. Continue practicing self-care and maintaining healthy habits. If you notice any changes in your mood or symptoms, consider speaking with a healthcare provider.",
+            "Mild": "You're experiencing mild depression symptoms. Consider implementing self-care strategies and monitoring your symptoms. If they persist or worsen, it may be helpful to speak with a healthcare provider.",
+            "Moderate": "Your responses suggest moderate depression symptoms. It's recommended that you speak with a healthcare provider to discuss your symptoms and explore appropriate support options.",
+            "Severe": "Your responses indicate severe depression symptoms. It's strongly recommended that you speak with a healthcare provider as soon as possible to discuss your symptoms and treatment options.",
+            "Extremely Severe": "Your responses suggest extremely severe depression symptoms. Please seek immediate support from a healthcare provider or mental health professional. If you're having thoughts of self-harm, please contact emergency services or a crisis helpline immediately."
+        },
+        "anxiety": {
+            "Normal": "Your anxiety symptoms appear to be within normal range. Continue practicing stress management techniques and maintaining healthy habits. If you notice any changes in your symptoms, consider speaking with a healthcare provider.",
+            "Mild": "You're experiencing mild anxiety symptoms. Consider implementing stress management techniques and monitoring your symptoms. If they persist or worsen, it may be helpful to speak with a healthcare provider.",
+            "Moderate": "Your responses suggest moderate anxiety symptoms. It's recommended that you speak with a healthcare provider to discuss your symptoms and explore appropriate support options.",
+            "Severe": "Your responses indicate severe anxiety symptoms. It's strongly recommended that you speak with a healthcare provider as soon as possible to discuss your symptoms and treatment options.",
+            "Extremely Severe": "Your responses suggest extremely severe anxiety symptoms. Please seek immediate support from a healthcare provider or mental health professional. If you're experiencing a panic attack or severe distress, please contact emergency services or a crisis helpline immediately."
+        },
+        "stress": {
+            "Normal": "Your stress levels appear to be within normal range. Continue practicing stress management techniques and maintaining healthy habits. If you notice any changes in your stress levels, consider speaking with a healthcare provider.",
+            "Mild": "You're experiencing mild stress. Consider implementing stress management techniques and monitoring your stress levels. If they persist or worsen, it may be helpful to speak with a healthcare provider.",
+            "Moderate": "Your responses suggest moderate stress levels. It's recommended that you speak with a healthcare provider to discuss your stress management strategies and explore appropriate support options.",
+            "Severe": "Your responses indicate severe stress levels. It's strongly recommended that you speak with a healthcare provider as soon as possible to discuss your symptoms and treatment options.",
+            "Extremely Severe": "Your responses suggest extremely severe stress levels. Please seek immediate support from a healthcare provider or mental health professional. If you're experiencing severe distress, please contact emergency services or a crisis helpline immediately."
+        }
+    },
+    "PCL-5": {
+        "Below threshold for PTSD": "Your responses suggest that you are below the threshold for PTSD. However, if you're experiencing distress related to a traumatic event, speaking with a mental health professional can still be beneficial.",
+        "Probable PTSD - clinical assessment recommended": "Your responses suggest you may be experiencing significant PTSD symptoms. It's strongly recommended that you speak with a mental health professional specializing in trauma for proper evaluation and support."
+    }
+}
+
+# Function to split markdown into passages at its headings: [{"title", "text", "source"}]
+def split_sections(text, source):
+    passages = []
+    title = ""
+    lines = []
+    for line in text.splitlines() + ["#"]:
+        if line.startswith("#"):
+            body = "\n".join(lines).strip()
+            if body:
+                passages.append({"title": title, "text": body, "source": source})
+            title = line.lstrip("#").strip() or title
+            lines = []
+        else:
+            lines.append(line)
+    return passages
+
+# Function to describe each questionnaire and its result bands
+def instrument_passages(instruments):
+    passages = []
+    for name, data in instruments.items():
+        bands = data["interpretation"]
+        if "subscales" in data:
+            band_text = " ".join(
+                f"{subscale.capitalize()}: " + ", ".join(f"{range_str} {label}" for range_str, label in bands[subscale].items()) + "."
+                for subscale in data["subscales"]
+            )
+        else:
+            band_text = "Total score: " + ", ".join(f"{range_str} {label}" for range_str, label in bands.items()) + "."
+        text = f"{data['name']} ({name}): {data['description']}. {len(data['questions'])} questions, answered {', '.join(data['options'])}. Result bands: {band_text}"
+        passages.append({"title": f"{name} scoring", "text": text, "source": f"instruments/{name}"})
+    return passages
+
+# Function to turn the result advice into one passage per band
+def recommendation_passages():
+    passages = []
+    for name, advice in HEALTHCARE_RECOMMENDATIONS.items():
+        for key, value in advice.items():
+            # DASS-21 advice is given per subscale, the others by band only
+            if isinstance(value, dict):
+                for band, text in value.items():
+                    passages.append({"title": f"{name} {key}: {band}", "text": text, "source": "recommendations"})
+            else:
+                passages.append({"title": f"{name}: {key}", "text": value, "source": "recommendations"})
+    return passages
+
+# BM25 index over the reference passages for one content version
+class KnowledgeBase:
+    def __init__(self, passages):
+        self.passages = passages
+        self.index = BM25Index([f"{passage['title']} {passage['text']}" for passage in passages])
+
+    # Function to get the passages that best match a question, best first, each with its score
+    def search(self, query, k=KNOWLEDGE_PASSAGES):
+        return [dict(self.passages[document], score=round(score, 3)) for document, score in self.index.search(query, k)]
+
+_knowledge = None
+_knowledge_version = None
+_knowledge_lock = threading.Lock()
+
+# Function to get the knowledge base for the active content version (content/knowledge/*.md,
+# the questionnaires and the result advice), built once per version
+def get_knowledge_base():
+    global _knowledge, _knowledge_version
+    content = active_content()
+    if content.version != _knowledge_version:
+        with _knowledge_lock:
+            if content.version != _knowledge_version:
+                passages = []
+                for file_name, text in content.knowledge.items():
+                    passages.extend(split_sections(text, file_name))
+                passages.extend(instrument_passages(content.instruments))
+                passages.extend(recommendation_passages())
+                _knowledge = KnowledgeBase(passages)
+                _knowledge_version = content.version
+    return _knowledge
+
+# Function to get the sections of a patient's report that best match a question
+def search_report(report, query, k=REPORT_PASSAGES):
+    sections = split_sections(report, "report")
+    if len(sections) <= 1:
+        # A report without headings is split into paragraphs instead
+        sections = [{"title": "", "text": paragraph.strip(), "source": "report"} for paragraph in re.split(r'\n\s*\n', report) if paragraph.strip()]
+    return KnowledgeBase(sections).search(query, k)
+
+# Function to format passages for the prompt
+def format_passages(passages):
+    return "\n\n".join(f"[{i}] {passage['title']}\n{passage['text']}" if passage["title"] else f"[{i}] {passage['text']}" for i, passage in enumerate(passages, 1))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Search the reference material that follow-up answers are grounded in.")
+    parser.add_argument("question")
+    parser.add_argument("-k", type=int, default=KNOWLEDGE_PASSAGES, help="Passages to show")
+    args = parser.parse_args(argv)
+
+    knowledge = get_knowledge_base()
+    start = time.perf_counter()
+    passages = knowledge.search(args.question, args.k)
+    elapsed = time.perf_counter() - start
+    for passage in passages:
+        print(f"{passage['score']:>7}  {passage['source']} / {passage['title']}\n         {passage['text'][:200]}")
+    print(f"{len(knowledge.passages)} passages searched in {elapsed * 1000:.3f} ms")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,156 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from prompts import estimate_message_tokens
+
+# Settings used when there is no model_config.json (same as the values app.py used before routing)
+DEFAULT_MODEL_CONFIG = {
+    "models": {
+        "gpt-3.5-turbo": {"context_window": 16385},
+        "gpt-4o": {"context_window": 128000},
+        "gpt-4o-mini": {"context_window": 128000}
+    },
+    "agents": {
+        "screening": {"models": ["gpt-3.5-turbo"], "max_tokens": 1000, "temperature": 0.7, "latency_budget_ms": 8000, "deadline_ms": 20000},
+        "follow_up": {"models": ["gpt-3.5-turbo"], "max_tokens": 1000, "temperature": 0.7, "latency_budget_ms": 10000, "deadline_ms": 30000},
+        "report": {"models": ["gpt-3.5-turbo"], "max_tokens": 2000, "temperature": 0.5, "latency_budget_ms": 60000}
+    }
+}
+
+# Number of recent calls kept per model, how many are needed before p95 is trusted,
+# and how old a sample may get (so a slow model is tried again once its samples expire)
+LATENCY_WINDOW = 50
+MIN_LATENCY_SAMPLES = 5
+LATENCY_MAX_AGE_SECONDS = 300
+
+# Consecutive failed calls that open a model's circuit, and how long it stays open; after that
+# calls are let through again and the next failure opens it straight away
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_OPEN_SECONDS = 30
+
+_config = None
+_config_lock = threading.Lock()
+_latencies = {}
+_latency_lock = threading.Lock()
+_circuits = {}
+_circuit_lock = threading.Lock()
+
+class CircuitOpenError(Exception):
+    pass
+
+# Function to load the routing configuration (MODEL_CONFIG env var or model_config.json)
+def load_model_config(path=None, reload=False):
+    global _config
+    if _config is not None and not reload and path is None:
+        return _config
+    with _config_lock:
+        path = path or os.getenv("MODEL_CONFIG", "model_config.json")
+        config = json.loads(json.dumps(DEFAULT_MODEL_CONFIG))
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                user_config = json.load(f)
+            config["models"].update(user_config.get("models", {}))
+            for agent, settings in user_config.get("agents", {}).items():
+                config["agents"].setdefault(agent, {}).update(settings)
+        _config = config
+    return _config
+
+# Function to record how long a call to a model took
+def record_latency(model, seconds):
+    with _latency_lock:
+        if model not in _latencies:
+            _latencies[model] = deque(maxlen=LATENCY_WINDOW)
+        _latencies[model].append((time.monotonic(), seconds))
+
+# Function to record whether a call reached the model (timeouts, connection errors and 5xx count as failures)
+def record_outcome(model, ok):
+    with _circuit_lock:
+        circuit = _circuits.setdefault(model, {"failures": 0, "opened_at": None})
+        if ok:
+            circuit["failures"] = 0
+            circuit["opened_at"] = None
+            return
+        circuit["failures"] += 1
+        if circuit["failures"] >= CIRCUIT_FAILURE_THRESHOLD:
+            circuit["opened_at"] = time.monotonic()
+
+def _is_open(circuit):
+    return circuit["opened_at"] is not None and time.monotonic() - circuit["opened_at"] < CIRCUIT_OPEN_SECONDS
+
+# Function to check whether a model's circuit is open, i.e. calls to it should not be made
+def circuit_open(model):
+    with _circuit_lock:
+        circuit = _circuits.get(model)
+        return circuit is not None and _is_open(circuit)
+
+def circuit_snapshot():
+    with _circuit_lock:
+        return {model: {"failures": circuit["failures"], "open": _is_open(circuit)} for model, circuit in _circuits.items()}
+
+# Function to get a model's recent p95 latency in milliseconds (None until enough calls are seen)
+def recent_p95_ms(model):
+    cutoff = time.monotonic() - LATENCY_MAX_AGE_SECONDS
+    with _latency_lock:
+        samples = sorted(seconds for recorded_at, seconds in _latencies.get(model, ()) if recorded_at >= cutoff)
+    if len(samples) < MIN_LATENCY_SAMPLES:
+        return None
+    index = min(len(samples) - 1, int(0.95 * len(samples)))
+    return samples[index] * 1000
+
+# Function to pick the model and settings for one agent call
+def route(agent, messages):
+    config = load_model_config()
+    settings = config["agents"].get(agent) or config["agents"]["screening"]
+    budget = settings.get("latency_budget_ms")
+    max_tokens = settings.get("max_tokens", 1000)
+    prompt_tokens = estimate_message_tokens(messages)
+
+    # Candidates are listed in order of preference; each may be a name or {"model": ..., "max_prompt_tokens": ...}
+    candidates = []
+    for candidate in settings.get("models", []):
+        if isinstance(candidate, str):
+            candidate = {"model": candidate}
+        context_window = config["models"].get(candidate["model"], {}).get("context_window")
+        if context_window and prompt_tokens + max_tokens > context_window:
+            continue
+        if candidate.get("max_prompt_tokens") and prompt_tokens > candidate["max_prompt_tokens"]:
+            continue
+        candidates.append(candidate["model"])
+
+    if not candidates:
+        # Nothing fits, so use the model with the largest context window
+        candidates = [max(config["models"], key=lambda name: config["models"][name].get("context_window", 0))]
+
+    # Models whose circuit is open are skipped; with none left the caller has to do without the model
+    primary = candidates[0]
+    candidates = [model for model in candidates if not circuit_open(model)]
+    if not candidates:
+        raise CircuitOpenError(f"The {agent} model is not responding; calls are paused for up to {CIRCUIT_OPEN_SECONDS} seconds")
+
+    chosen = None
+    reason = "primary"
+    for model in candidates:
+        p95 = recent_p95_ms(model)
+        if budget is None or p95 is None or p95 <= budget:
+            chosen = model
+            break
+    if chosen is None:
+        # Every candidate is over budget recently, so fall back to the fastest one
+        chosen = min(candidates, key=lambda model: recent_p95_ms(model) or 0)
+        reason = "over_budget"
+    elif chosen != primary:
+        reason = "fallback"
+
+    return {
+        "agent": agent,
+        "model": chosen,
+        "max_tokens": max_tokens,
+        "temperature": settings.get("temperature", 0.7),
+        "latency_budget_ms": budget,
+        "deadline_ms": settings.get("deadline_ms"),
+        "prompt_tokens": prompt_tokens,
+        "reason": reason
+    }
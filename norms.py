@@ -0,0 +1,172 @@
+import argparse
+import os
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+
+from analytics_store import Segment
+
+# Fewest recorded results a scale needs before percentiles are given for it
+NORMS_MIN_SAMPLE = 50
+
+# How often the background thread picks up newly recorded results
+NORMS_REFRESH_SECONDS = 60
+
+# Longest a report waits for a process's first load of the norms (without them it has no percentiles)
+NORMS_FIRST_LOAD_SECONDS = 5
+
+# Function to write a whole number as an ordinal: 1st, 2nd, 3rd, 11th, 42nd
+def ordinal(number):
+    suffix = "th" if 10 <= number % 100 <= 20 else {1: "st", 2: "nd", 3: "rd"}.get(number % 10, "th")
+    return f"{number}{suffix}"
+
+# Score distributions of our own patients, per questionnaire and scale, built from the analytics store.
+# Each scale keeps a count per score and a sorted array of every score, so a percentile is two binary searches
+class PopulationNorms:
+    def __init__(self, directory, min_sample=NORMS_MIN_SAMPLE):
+        self.directory = directory
+        self.min_sample = min_sample
+        self.segments = {}
+        self.rows_read = {}
+        self.counts = {}
+        self.sorted = {}
+        self.refreshed = None
+        self.ready = threading.Event()
+        self._lock = threading.Lock()
+        self._refresher = None
+
+    # Function to add the results recorded since the last refresh; returns how many were added
+    def refresh(self):
+        names = sorted(os.listdir(self.directory)) if os.path.isdir(self.directory) else []
+        new_counts = {}
+        for name in names:
+            if not name.startswith("segment-"):
+                continue
+            segment = self.segments.setdefault(name, Segment(os.path.join(self.directory, name)))
+            segment.load_dictionary()
+            start = self.rows_read.get(name, 0)
+            stop = segment.rows("results")
+            if stop <= start:
+                continue
+            columns = [segment.column("results", column, start, stop) for column in ("instrument", "subscale", "mode", "score")]
+            for (instrument, subscale, mode, score), count in Counter(zip(*columns)).items():
+                # Adaptive administrations count skipped items as 0, so only full ones set the norms
+                if segment.values.get(("mode", mode)) != "full":
+                    continue
+                key = (segment.values.get(("instrument", instrument)), segment.values.get(("subscale", subscale)))
+                new_counts.setdefault(key, Counter())[score] += count
+            self.rows_read[name] = stop
+
+        added = 0
+        for key, scores in new_counts.items():
+            counts = self.counts.get(key, Counter()) + scores
+            # Rebuilt from the counts, which are few (one per possible score), so this runs at C speed
+            values = array("h")
+            for score in sorted(counts):
+                values.extend(array("h", [score]) * counts[score])
+            with self._lock:
+                self.counts[key] = counts
+                self.sorted[key] = values
+            added += sum(scores.values())
+        self.refreshed = time.time()
+        return added
+
+    def start_refreshing(self, interval=NORMS_REFRESH_SECONDS):
+        if self._refresher is None:
+            self._refresher = threading.Thread(target=self._refresh_loop, args=(interval,), name="norms-refresh", daemon=True)
+            self._refresher.start()
+
+    def _refresh_loop(self, interval):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"[error] Refreshing population norms: {e}", file=sys.stderr)
+            self.ready.set()
+            time.sleep(interval)
+
+    # Function to get a score's percentile rank (0-100, ties counted as half below) and the sample size,
+    # or None while the scale has fewer than min_sample results
+    def percentile(self, instrument, subscale, score):
+        with self._lock:
+            values = self.sorted.get((instrument, subscale))
+        if values is None or len(values) < self.min_sample:
+            return None
+        below = bisect_left(values, score)
+        equal = bisect_right(values, score) - below
+        return 100 * (below + equal / 2) / len(values), len(values)
+
+    # Function to get the percentile of each scale of a result: {scale: {"percentile", "sample"}}. Adaptive
+    # results are left out where skipped items leave the exact score open
+    def result_percentiles(self, instrument, result):
+        scores = result["scores"] if "scores" in result else {"total": result["score"]}
+        ranges = result.get("administration", {}).get("score_ranges", {})
+        percentiles = {}
+        for subscale, score in scores.items():
+            low, high = ranges.get(subscale, (score, score))
+            if low != high:
+                continue
+            found = self.percentile(instrument, subscale, score)
+            if found is not None:
+                # Kept within 1-99, as a rank of 0 or 100 reads as beyond the whole sample
+                percentiles[subscale] = {"percentile": min(99, max(1, round(found[0]))), "sample": found[1]}
+        return percentiles
+
+    # Function to describe each scale's sample: {(instrument, scale): {"sample", "p25", "median", "p75"}}
+    def summary(self):
+        with self._lock:
+            items = list(self.sorted.items())
+        return {
+            key: {
+                "sample": len(values),
+                "p25": values[len(values) // 4],
+                "median": values[len(values) // 2],
+                "p75": values[3 * len(values) // 4]
+            }
+            for key, values in items if values
+        }
+
+_norms = None
+_norms_lock = threading.Lock()
+
+# Function to get the shared norms over ANALYTICS_DIR, loaded and refreshed in the background so lookups
+# never read the store
+def get_population_norms():
+    global _norms
+    if _norms is None:
+        with _norms_lock:
+            if _norms is None:
+                _norms = PopulationNorms(os.getenv("ANALYTICS_DIR", "analytics"))
+                _norms.start_refreshing()
+    return _norms
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Show the population norms, or the percentile of one score.")
+    parser.add_argument("assessment", nargs="?", help="Questionnaire, e.g. DASS-21")
+    parser.add_argument("subscale", nargs="?", help="Scale, e.g. depression (total for a single score)")
+    parser.add_argument("score", nargs="?", type=int)
+    parser.add_argument("--dir", default=os.getenv("ANALYTICS_DIR", "analytics"))
+    args = parser.parse_args(argv)
+
+    norms = PopulationNorms(args.dir)
+    start = time.perf_counter()
+    added = norms.refresh()
+    print(f"Loaded {added:,} full-administration results in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    if args.score is not None:
+        start = time.perf_counter()
+        found = norms.percentile(args.assessment, args.subscale, args.score)
+        elapsed = (time.perf_counter() - start) * 1e6
+        if found is None:
+            print(f"Fewer than {norms.min_sample} results for {args.assessment} {args.subscale}")
+            sys.exit(1)
+        print(f"{args.assessment} {args.subscale} {args.score}: {ordinal(round(found[0]))} percentile of {found[1]:,} ({elapsed:.0f} µs)")
+        return
+    for (instrument, subscale), stats in sorted(norms.summary().items()):
+        print(f"{instrument:<10} {subscale:<12} n={stats['sample']:<10,} p25={stats['p25']:<4} median={stats['median']:<4} p75={stats['p75']}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
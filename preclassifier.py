@@ -0,0 +1,202 @@
+import argparse
+import json
+import math
+import os
+import sys
+import threading
+import time
+
+from condition_index import ConditionIndex, normalize
+from prompts import parse_screening_result
+
+# Conditions the classifier scores, with the screening labels that count as each one
+LABELS = {
+    "depression": ["depression", "depressive", "major depressive disorder", "low mood", "sadness", "hopelessness", "dysthymia", "anhedonia"],
+    "anxiety": ["anxiety", "generalized anxiety disorder", "gad", "panic", "panic disorder", "worry", "social anxiety", "health anxiety", "phobia"],
+    "stress": ["stress", "burnout", "overwhelmed", "adjustment disorder"],
+    "ptsd": ["ptsd", "post-traumatic stress", "post-traumatic stress disorder", "posttraumatic stress disorder", "trauma", "complex ptsd"]
+}
+
+# A label needs this many positive and negative examples before the classifier scores it
+MIN_EXAMPLES_PER_LABEL = 5
+
+# Laplace smoothing and the smallest weight worth keeping in the model file
+SMOOTHING = 1.0
+MIN_WEIGHT = 0.05
+
+_label_index = ConditionIndex({label: {"conditions": phrases} for label, phrases in LABELS.items()})
+
+# Function to turn text into features: stemmed words and word pairs
+def features(text):
+    tokens = normalize(text)
+    return set(tokens) | {f"{a} {b}" for a, b in zip(tokens, tokens[1:])}
+
+# Function to map the conditions of a screening result to classifier labels
+def to_labels(conditions):
+    return set(_label_index.resolve_all(conditions))
+
+# Function to read labelled examples: (patient text, labels), from training_data.jsonl records
+# (the final assistant message holds the screening result) or eval_scripts.jsonl scripts
+def load_examples(paths):
+    examples = []
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if "turns" in record:
+                    examples.append((" ".join(record["turns"]), to_labels(record.get("labels", []))))
+                    continue
+                messages = record.get("messages", [])
+                result = parse_screening_result(messages[-1]["content"]) if messages else None
+                if not result or not result.get("screening_complete"):
+                    continue
+                text = " ".join(message["content"] for message in messages if message["role"] == "user")
+                examples.append((text, to_labels(result.get("possible_conditions", []))))
+    return examples
+
+# One-vs-rest naive Bayes: for each label, a prior and a log-likelihood ratio per feature
+class ConditionClassifier:
+    def __init__(self, model, threshold=0.9, min_turns=2):
+        self.priors = model["priors"]
+        self.weights = model["weights"]
+        self.trained_on = model.get("trained_on", 0)
+        self.threshold = threshold
+        self.min_turns = min_turns
+
+    @classmethod
+    def train(cls, examples, threshold=0.9, min_turns=2):
+        documents = [(features(text), labels) for text, labels in examples]
+        vocabulary = set().union(*(document for document, _ in documents)) if documents else set()
+        priors = {}
+        weights = {}
+        for label in LABELS:
+            positive = [document for document, labels in documents if label in labels]
+            negative = [document for document, labels in documents if label not in labels]
+            if len(positive) < MIN_EXAMPLES_PER_LABEL or len(negative) < MIN_EXAMPLES_PER_LABEL:
+                continue
+            positive_counts = count_features(positive)
+            negative_counts = count_features(negative)
+            positive_total = sum(positive_counts.values()) + SMOOTHING * len(vocabulary)
+            negative_total = sum(negative_counts.values()) + SMOOTHING * len(vocabulary)
+            label_weights = {}
+            for feature in vocabulary:
+                weight = math.log((positive_counts.get(feature, 0) + SMOOTHING) / positive_total) - math.log((negative_counts.get(feature, 0) + SMOOTHING) / negative_total)
+                if abs(weight) >= MIN_WEIGHT:
+                    label_weights[feature] = round(weight, 4)
+            priors[label] = math.log(len(positive) / len(negative))
+            weights[label] = label_weights
+        return cls({"priors": priors, "weights": weights, "trained_on": len(documents)}, threshold, min_turns)
+
+    def to_dict(self):
+        return {"version": 1, "trained_on": self.trained_on, "priors": self.priors, "weights": self.weights}
+
+    # Function to get the probability of each label for the patient's text so far
+    def score(self, text):
+        found = features(text)
+        scores = {}
+        for label, prior in self.priors.items():
+            label_weights = self.weights[label]
+            z = prior + sum(label_weights[feature] for feature in found if feature in label_weights)
+            scores[label] = 1 / (1 + math.exp(-max(-50.0, min(50.0, z))))
+        return scores
+
+    # Function to get the labels the classifier is confident about, strongest first (empty before min_turns)
+    def confident_labels(self, patient_turns):
+        if len(patient_turns) < self.min_turns:
+            return []
+        scores = self.score(" ".join(patient_turns))
+        return sorted((label for label, p in scores.items() if p >= self.threshold), key=lambda label: -scores[label])
+
+def count_features(documents):
+    counts = {}
+    for document in documents:
+        for feature in document:
+            counts[feature] = counts.get(feature, 0) + 1
+    return counts
+
+_classifier = None
+_classifier_key = None
+_classifier_lock = threading.Lock()
+
+# Function to get the trained classifier (PRECLASSIFIER_MODEL, default preclassifier_model.json);
+# None when no model has been trained, which leaves screening as it was
+def get_preclassifier():
+    global _classifier, _classifier_key
+    path = os.getenv("PRECLASSIFIER_MODEL", "preclassifier_model.json")
+    try:
+        key = (path, os.path.getmtime(path))
+    except OSError:
+        return None
+    if key != _classifier_key:
+        with _classifier_lock:
+            if key != _classifier_key:
+                with open(path, "r", encoding="utf-8") as f:
+                    model = json.load(f)
+                _classifier = ConditionClassifier(
+                    model,
+                    threshold=float(os.getenv("PRECLASSIFIER_THRESHOLD", "0.9")),
+                    min_turns=int(os.getenv("PRECLASSIFIER_MIN_TURNS", "2"))
+                )
+                _classifier_key = key
+    return _classifier
+
+# Function to replay scripts turn by turn and report how early the classifier becomes confident
+def evaluate(classifier, scripts):
+    correct = 0
+    confident = 0
+    turns_saved = 0
+    start = time.perf_counter()
+    scored_turns = 0
+    for script in scripts:
+        labels = to_labels(script.get("labels", []))
+        if script.get("crisis"):
+            continue
+        for turn in range(1, len(script["turns"]) + 1):
+            scored_turns += 1
+            predicted = classifier.confident_labels(script["turns"][:turn])
+            if predicted:
+                confident += 1
+                correct += int(set(predicted) <= labels)
+                turns_saved += len(script["turns"]) - turn
+                break
+    elapsed = time.perf_counter() - start
+    return {
+        "scripts": len(scripts),
+        "confident": confident,
+        "precision": correct / confident if confident else None,
+        "turns_saved": turns_saved,
+        "microseconds_per_turn": elapsed / scored_turns * 1e6 if scored_turns else None
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train or check the local condition pre-classifier used during screening.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    train_parser = subparsers.add_parser("train", help="Train from training_data.jsonl-format files (and eval_scripts.jsonl-format scripts)")
+    train_parser.add_argument("files", nargs="+")
+    train_parser.add_argument("--output", default="preclassifier_model.json")
+    evaluate_parser = subparsers.add_parser("evaluate", help="Replay eval_scripts.jsonl-format scripts and report how early the classifier is confident")
+    evaluate_parser.add_argument("scripts", nargs="?", default="eval_scripts.jsonl")
+    evaluate_parser.add_argument("--model", default="preclassifier_model.json")
+    evaluate_parser.add_argument("--threshold", type=float, default=0.9)
+    evaluate_parser.add_argument("--min-turns", type=int, default=2)
+    args = parser.parse_args(argv)
+
+    if args.command == "train":
+        examples = load_examples(args.files)
+        classifier = ConditionClassifier.train(examples)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(classifier.to_dict(), f)
+        print(f"Trained on {len(examples)} transcripts; scoring {', '.join(classifier.priors) or 'no conditions'} (each needs {MIN_EXAMPLES_PER_LABEL} examples with and without it)")
+        print(f"Model saved to {args.output}")
+    else:
+        with open(args.model, "r", encoding="utf-8") as f:
+            classifier = ConditionClassifier(json.load(f), args.threshold, args.min_turns)
+        with open(args.scripts, "r", encoding="utf-8") as f:
+            scripts = [json.loads(line) for line in f if line.strip()]
+        for key, value in evaluate(classifier, scripts).items():
+            print(f"  {key}: {round(value, 3) if isinstance(value, float) else value}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,216 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+from prompts import estimate_message_tokens, estimate_tokens
+
+# Follow-up questions asked after each canonical report; enough of them to see whether history keeps growing
+FOLLOW_UP_QUESTIONS = [
+    "What does my depression score mean?",
+    "What can I do to sleep better?",
+    "Should I see a doctor about this?",
+    "Can you explain the anxiety result again?",
+    "Is it normal to feel worse in the evening?",
+    "What should I tell my family?"
+]
+
+# Fixed stand-ins for the model's answers after screening, so the prompts depend only on our code and content
+CANNED_REPORT = """# Mental Health Assessment Report
+## Date: January 1, 2025
+
+### Patient Information
+Adult patient who completed an online screening.
+
+### Presenting Symptoms
+- Low mood, poor sleep and reduced appetite
+- Ongoing worry and tension
+
+### Assessment Results
+See the questionnaire scores below.
+
+### Diagnosis
+The results suggest symptoms of depression and anxiety that should be assessed by a professional.
+
+### Recommendations
+- Book an appointment with a family doctor
+- Keep a regular sleep routine
+
+### Disclaimer
+This report is not a clinical diagnosis."""
+CANNED_FOLLOW_UP = "About \"{question}\": your results suggest it is worth talking this through with a professional."
+
+DEFAULT_BASELINES = "prompt_baselines.json"
+
+# Answer option chosen for every questionnaire item
+ANSWER_OPTION = 1
+
+# Chat client that records every request and answers with whatever the benchmark queued up
+class RecordingClient:
+    def __init__(self):
+        self.calls = []
+        self.reply = ""
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages, **kwargs):
+        self.calls.append([dict(message) for message in messages])
+        prompt_tokens = estimate_message_tokens(messages)
+        usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=estimate_tokens(self.reply), total_tokens=prompt_tokens + estimate_tokens(self.reply))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.reply))], usage=usage)
+
+# Function to load the canonical sessions: each training_data.jsonl conversation as (patient turn, scripted reply) pairs
+def load_sessions(path):
+    sessions = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for number, line in enumerate((line for line in f if line.strip()), 1):
+            turns = []
+            for message in json.loads(line)["messages"]:
+                if message["role"] == "user":
+                    turns.append([message["content"], []])
+                elif message["role"] == "assistant" and turns:
+                    turns[-1][1].append(message["content"])
+            sessions[f"conversation-{number}"] = [(patient, "\n".join(replies)) for patient, replies in turns]
+    return sessions
+
+# Function to describe the prompts sent during one step; "repeated" counts messages identical to an
+# earlier one in the same call, such as a system prompt or patient message sent twice
+def measure_calls(calls):
+    return {
+        "calls": len(calls),
+        "messages": sum(len(call) for call in calls),
+        "system_tokens": sum(estimate_tokens(message["content"]) for call in calls for message in call if message["role"] == "system"),
+        "input_tokens": sum(estimate_message_tokens(call) for call in calls),
+        "repeated": sum(len(call) - len({(message["role"], message["content"]) for message in call}) for call in calls)
+    }
+
+# Function to replay one session through the engine: screening turns, every questionnaire item, the
+# report and the follow-up questions. Returns [(step, agent, measurements)]
+def replay_session(engine, client, turns, follow_up_questions=FOLLOW_UP_QUESTIONS):
+    state = engine.Session(session_id="prompt-benchmark")
+    engine.start_conversation(state)
+    steps = []
+
+    def run(step, agent, reply, action):
+        client.calls = []
+        client.reply = reply
+        action()
+        if client.calls:
+            steps.append((step, agent, measure_calls(client.calls)))
+
+    for number, (patient, reply) in enumerate(turns, 1):
+        if state.chat_state != "screening":
+            break
+        run(f"screening {number}", "screening", reply, lambda: engine.handle_user_message(state, patient))
+    while state.chat_state == "assessment" and engine.current_question(state) is not None:
+        question = engine.current_question(state)
+        run(f"{question['assessment']} item {question['number']}", "assessment", "", lambda: engine.answer_item(state, ANSWER_OPTION))
+    if state.chat_state == "awaiting_report":
+        run("report", "report", CANNED_REPORT, lambda: engine.generate_report(state))
+    if state.chat_state == "follow_up":
+        for number, question in enumerate(follow_up_questions, 1):
+            run(f"follow-up {number}", "follow_up", CANNED_FOLLOW_UP.format(question=question), lambda: engine.handle_user_message(state, question))
+    return steps
+
+# Function to replay every session with the engine pointed at a recording client and everything that
+# could make the prompts depend on local state (report cache, analytics, classifier, captures) switched off
+def run_benchmark(sessions_path):
+    scratch = tempfile.mkdtemp(prefix="prompt-benchmark-")
+    os.environ.update({
+        "REPORT_CACHE_DIR": os.path.join(scratch, "report_cache"),
+        "ANALYTICS": "0",
+        "ANALYTICS_DIR": os.path.join(scratch, "analytics"),
+        "CAPTURE_TRANSCRIPTS": "0",
+        "FALLBACK_LOG": os.path.join(scratch, "fallback_log.jsonl"),
+        "PRECLASSIFIER_MODEL": os.path.join(scratch, "no_preclassifier.json")
+    })
+    import engine
+    from upstream_pool import Endpoint, UpstreamPool, set_upstream_pool
+
+    client = RecordingClient()
+    set_upstream_pool(UpstreamPool([Endpoint("prompt-benchmark", client=client)], health_check_seconds=0))
+    results = {}
+    for name, turns in load_sessions(sessions_path).items():
+        results[name] = replay_session(engine, client, turns)
+    return results
+
+# Function to compare the measurements with the baselines: [(session, step, agent, measured, baseline, status)].
+# A step is "over" or "under" when it moved by more than the tolerance, "new" or "missing" when only one side has it
+def compare(results, baselines, tolerance):
+    rows = []
+    for name, steps in results.items():
+        stored = baselines.get(name, {})
+        for step, agent, measured in steps:
+            baseline = stored.get(step)
+            if baseline is None:
+                status = "new"
+            elif measured["input_tokens"] > baseline * (1 + tolerance):
+                status = "over"
+            elif measured["input_tokens"] < baseline * (1 - tolerance):
+                status = "under"
+            else:
+                status = "ok"
+            rows.append((name, step, agent, measured, baseline, status))
+        for step in stored:
+            if step not in {step for step, _, _ in steps}:
+                rows.append((name, step, "-", None, stored[step], "missing"))
+    return rows
+
+def print_report(rows):
+    print(f"{'session':<16} {'step':<18} {'agent':<10} {'calls':>5} {'msgs':>5} {'system':>7} {'input':>7} {'baseline':>9} {'change':>8}  status")
+    for name, step, agent, measured, baseline, status in rows:
+        if measured is None:
+            print(f"{name:<16} {step:<18} {agent:<10} {'':>5} {'':>5} {'':>7} {'':>7} {baseline:>9} {'':>8}  {status}")
+            continue
+        change = f"{(measured['input_tokens'] - baseline) / baseline:+.1%}" if baseline else "-"
+        note = f" ({measured['repeated']} repeated messages)" if measured["repeated"] else ""
+        print(f"{name:<16} {step:<18} {agent:<10} {measured['calls']:>5} {measured['messages']:>5} {measured['system_tokens']:>7} {measured['input_tokens']:>7} {baseline if baseline is not None else '-':>9} {change:>8}  {status}{note}")
+    agents = {}
+    for _, _, agent, measured, baseline, _ in rows:
+        if measured:
+            totals = agents.setdefault(agent, [0, 0, 0])
+            totals[0] += 1
+            totals[1] += measured["input_tokens"]
+            totals[2] += baseline or 0
+    for agent, (steps, total, base_total) in agents.items():
+        print(f"{agent}: {total:,} input tokens over {steps} calls, {total // steps:,} per call (baseline {base_total:,})")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay canonical sessions without a model and check the prompt tokens sent at each step against stored baselines.")
+    parser.add_argument("--sessions", default="training_data.jsonl", help="Conversations in the training_data.jsonl format")
+    parser.add_argument("--baselines", default=DEFAULT_BASELINES, help="Stored input tokens per session and step")
+    parser.add_argument("--tolerance", type=float, default=0.02, help="Allowed growth over a baseline (0.02 = 2%%)")
+    parser.add_argument("--update", action="store_true", help="Store the measured tokens as the new baselines")
+    parser.add_argument("--json", action="store_true", help="Print the measurements as JSON")
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.sessions)
+    if args.update:
+        baselines = {name: {step: measured["input_tokens"] for step, _, measured in steps} for name, steps in results.items()}
+        with open(args.baselines, "w", encoding="utf-8") as f:
+            json.dump(baselines, f, indent=2)
+            f.write("\n")
+        print(f"Baselines for {sum(len(steps) for steps in baselines.values())} steps saved to {args.baselines}")
+        return
+
+    baselines = {}
+    if os.path.exists(args.baselines):
+        with open(args.baselines, "r", encoding="utf-8") as f:
+            baselines = json.load(f)
+    rows = compare(results, baselines, args.tolerance)
+    if args.json:
+        print(json.dumps([
+            {"session": name, "step": step, "agent": agent, **(measured or {}), "baseline": baseline, "status": status}
+            for name, step, agent, measured, baseline, status in rows
+        ], indent=2))
+    else:
+        print_report(rows)
+    failures = [row for row in rows if row[5] not in ["ok", "under"]]
+    if failures:
+        print(f"{len(failures)} steps over their baseline by more than {args.tolerance:.0%}, or without one; "
+              f"if the change is intended, run: python prompt_benchmark.py --update", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
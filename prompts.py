@@ -0,0 +1,38 @@
+import json
+import re
+
+# The prompt texts and welcome messages live in content/ and are loaded by content_store.py
+
+# Function to estimate the token count of a text (about 4 characters per token)
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+# Function to estimate the token count of a list of chat messages
+def estimate_message_tokens(messages):
+    return sum(estimate_tokens(message["content"]) + 4 for message in messages)
+
+# Function to add a system prompt in front of a request (chat_with_gpt uses the screening prompt)
+def add_chat_system_prompt(messages, system_prompt):
+    enhanced_messages = [{"role": "system", "content": system_prompt}]
+    enhanced_messages.extend(messages)
+    return enhanced_messages
+
+# Function to build the screening prompt from the chat history and the latest user input
+def build_screening_prompt(history, user_input, system_prompt):
+    screening_prompt = [{"role": "system", "content": system_prompt}]
+    
+    # Add chat history
+    for message in history:
+        if message["role"] in ["user", "assistant"]:
+            screening_prompt.append(message)
+    
+    # Add current user input
+    screening_prompt.append({"role": "user", "content": user_input})
+    return screening_prompt
+
+# Function to pull the screening_complete JSON out of a model response (None if there is none)
+def parse_screening_result(response):
+    json_match = re.search(r'({.*})', response.replace('\n', ' '))
+    if json_match:
+        return json.loads(json_match.group(1))
+    return None
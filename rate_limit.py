@@ -0,0 +1,61 @@
+import threading
+import time
+
+# Token bucket: holds up to `capacity` tokens and refills at `rate` tokens per second
+class TokenBucket:
+    def __init__(self, capacity, rate):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._condition = threading.Condition()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Function to see how many tokens are in the bucket right now
+    def available(self):
+        with self._condition:
+            self._refill()
+            return self.tokens
+
+    # Function to take tokens without waiting; returns False when there are not enough
+    def try_acquire(self, amount):
+        with self._condition:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return True
+            return False
+
+    # Function to wait until the tokens are available and take them (False if `timeout` runs out first)
+    def acquire(self, amount, timeout=None):
+        # A request bigger than the bucket would never fit, so it waits for a full bucket instead
+        amount = min(amount, self.capacity)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return True
+                wait = (amount - self.tokens) / self.rate
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    wait = min(wait, remaining)
+                self._condition.wait(wait)
+
+    # Function to give back tokens that were reserved but not used (a negative amount charges extra use)
+    def refund(self, amount):
+        with self._condition:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+            self._condition.notify_all()
+
+# Function to make a bucket for a tokens-per-minute ceiling
+def per_minute(tokens_per_minute):
+    return TokenBucket(tokens_per_minute, tokens_per_minute / 60.0)
@@ -0,0 +1,383 @@
+import argparse
+import hashlib
+import html
+import json
+import re
+import sys
+import textwrap
+import threading
+import time
+import unicodedata
+import zlib
+from collections import OrderedDict
+from datetime import datetime
+
+from scoring import format_score
+
+# Bump when the output changes so cached exports are rendered again
+RENDERER_VERSION = "3"
+
+# Rendered files kept in memory, keyed by report hash and format
+EXPORT_CACHE_SIZE = 128
+
+EXPORT_FORMATS = {
+    "html": "text/html",
+    "pdf": "application/pdf"
+}
+
+HTML_STYLE = """
+body { font-family: Helvetica, Arial, sans-serif; color: #222; max-width: 760px; margin: 40px auto; padding: 0 24px; line-height: 1.5; }
+h1, h2, h3, h4 { color: #1f3b57; margin: 1.2em 0 0.4em; }
+table { border-collapse: collapse; width: 100%; margin: 0.6em 0 1.2em; }
+th, td { border: 1px solid #ccd; padding: 6px 10px; text-align: left; }
+th { background: #eef2f7; }
+.meta { color: #666; font-size: 0.9em; }
+.disclaimer { border-top: 1px solid #ccd; margin-top: 2em; padding-top: 0.8em; color: #666; font-size: 0.9em; }
+"""
+
+# Characters the PDF fonts lack, written the way a typewriter would
+PDF_SUBSTITUTES = {
+    "≥": ">=", "≤": "<=", "≠": "!=", "≈": "~", "→": "->", "←": "<-", "−": "-", "‐": "-", "‑": "-",
+    "✓": "v", "✔": "v", "✗": "x", "✘": "x", "★": "*", "\u200b": "", "\u200d": "", "\ufe0f": ""
+}
+
+# Shown in the PDF for text its fonts cannot show (Chinese, emoji), with a note pointing to the HTML export
+PDF_MISSING_MARKER = "[?]"
+PDF_MISSING_NOTE = "Some characters could not be shown in this PDF and are marked [?]. The HTML download shows the full text."
+
+DISCLAIMER = "This report is not a substitute for professional psychiatric evaluation. Please consult with a mental health professional for a comprehensive assessment."
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+# Function to split the report markdown into blocks: (kind, level, text)
+def parse_blocks(markdown):
+    # The fallback report is written as an indented string
+    lines = textwrap.dedent(markdown.strip("\n")).split("\n")
+    blocks = []
+    paragraph = []
+
+    def end_paragraph():
+        if paragraph:
+            blocks.append(("paragraph", 0, " ".join(paragraph)))
+            paragraph.clear()
+
+    for line in lines:
+        stripped = line.strip()
+        indent = (len(line) - len(line.lstrip())) // 2
+        heading = re.match(r'^(#{1,6})\s+(.*)$', stripped)
+        bullet = re.match(r'^[-*+•]\s+(.*)$', stripped)
+        numbered = re.match(r'^(\d+)[.)]\s+(.*)$', stripped)
+        if not stripped:
+            end_paragraph()
+        elif re.match(r'^(-{3,}|\*{3,}|_{3,})$', stripped):
+            end_paragraph()
+            blocks.append(("rule", 0, ""))
+        elif heading:
+            end_paragraph()
+            blocks.append(("heading", len(heading.group(1)), heading.group(2).strip("# ")))
+        elif bullet:
+            end_paragraph()
+            blocks.append(("bullet", indent, bullet.group(1)))
+        elif numbered:
+            end_paragraph()
+            blocks.append(("numbered", indent, f"{numbered.group(1)}. {numbered.group(2)}"))
+        else:
+            paragraph.append(stripped)
+    end_paragraph()
+    return blocks
+
+# Function to turn **bold**, *italic* and `code` into HTML
+def inline_html(text):
+    text = html.escape(text, quote=False)
+    text = re.sub(r'\*\*(.+?)\*\*', r'<strong>\1</strong>', text)
+    text = re.sub(r'(?<![\w*])[*_](?!\s)(.+?)(?<!\s)[*_](?![\w*])', r'<em>\1</em>', text)
+    text = re.sub(r'`(.+?)`', r'<code>\1</code>', text)
+    return text
+
+# Function to drop inline markdown markers for plain-text output
+def inline_plain(text):
+    text = re.sub(r'\*\*(.+?)\*\*', r'\1', text)
+    text = re.sub(r'(?<![\w*])[*_](?!\s)(.+?)(?<!\s)[*_](?![\w*])', r'\1', text)
+    return text.replace("`", "")
+
+# Function to list the structured results: (instrument, scale, score, interpretation)
+def result_rows(diagnosis, assessments=None):
+    assessments = assessments or {}
+    rows = []
+    for assessment, result in diagnosis.get("assessment_results", {}).items():
+        name = assessments.get(assessment, {}).get("name", assessment)
+        if "scores" in result:
+            for category in result["scores"]:
+                rows.append((name, category.capitalize(), format_score(result, category), result["interpretations"][category]))
+        else:
+            rows.append((name, "Total", format_score(result), result["interpretation"]))
+    return rows
+
+# Function to render the report and its results as a standalone HTML page
+def render_html(report, diagnosis, assessments=None, report_id=None):
+    parts = [
+        "<!DOCTYPE html>",
+        "<html lang=\"en\"><head><meta charset=\"utf-8\">",
+        "<title>Mental Health Report</title>",
+        f"<style>{HTML_STYLE}</style>",
+        "</head><body>"
+    ]
+    generated = datetime.now().strftime('%B %d, %Y')
+    parts.append(f"<p class=\"meta\">Exported {generated}" + (f" &middot; Report {html.escape(report_id[:12])}" if report_id else "") + "</p>")
+
+    list_tag = None
+    for kind, level, text in parse_blocks(report):
+        wanted = {"bullet": "ul", "numbered": "ol"}.get(kind)
+        if list_tag and wanted != list_tag:
+            parts.append(f"</{list_tag}>")
+            list_tag = None
+        if wanted and not list_tag:
+            parts.append(f"<{wanted}>")
+            list_tag = wanted
+        if kind == "heading":
+            parts.append(f"<h{level}>{inline_html(text)}</h{level}>")
+        elif kind == "paragraph":
+            parts.append(f"<p>{inline_html(text)}</p>")
+        elif kind == "rule":
+            parts.append("<hr>")
+        else:
+            if kind == "numbered":
+                text = text.split(". ", 1)[1]
+            style = f" style=\"margin-left: {level * 1.5}em\"" if level else ""
+            parts.append(f"<li{style}>{inline_html(text)}</li>")
+    if list_tag:
+        parts.append(f"</{list_tag}>")
+
+    rows = result_rows(diagnosis, assessments)
+    if rows:
+        parts.append("<h2>Questionnaire Scores</h2>")
+        parts.append("<table><tr><th>Questionnaire</th><th>Scale</th><th>Score</th><th>Interpretation</th></tr>")
+        for row in rows:
+            parts.append("<tr>" + "".join(f"<td>{html.escape(str(cell))}</td>" for cell in row) + "</tr>")
+        parts.append("</table>")
+    conditions = diagnosis.get("possible_conditions") or []
+    if conditions:
+        parts.append(f"<p><strong>Possible conditions identified during screening:</strong> {html.escape(', '.join(conditions))}</p>")
+
+    parts.append(f"<p class=\"disclaimer\">{DISCLAIMER}</p>")
+    parts.append("</body></html>")
+    return "\n".join(parts).encode("utf-8")
+
+# Helvetica character widths (1/1000 em) for ASCII 32-126, used to wrap PDF lines
+HELVETICA_WIDTHS = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584
+]
+
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+MARGIN = 60
+FONT_SIZES = {"heading1": 18, "heading2": 15, "heading3": 13, "heading": 12, "body": 11, "small": 9}
+
+# Function to measure a line of text in points
+def text_width(text, size, bold=False):
+    width = sum(HELVETICA_WIDTHS[ord(c) - 32] if 32 <= ord(c) <= 126 else 556 for c in text)
+    # Helvetica-Bold is slightly wider; this keeps bold lines inside the margin
+    return width * size / 1000 * (1.08 if bold else 1.0)
+
+# Function to wrap text to a width in points
+def wrap_text(text, size, width, bold=False):
+    lines = []
+    current = ""
+    for word in text.split():
+        candidate = f"{current} {word}" if current else word
+        if current and text_width(candidate, size, bold) > width:
+            lines.append(current)
+            current = word
+        else:
+            current = candidate
+    if current:
+        lines.append(current)
+    return lines or [""]
+
+# Function to fit text to the WinAnsi characters of the standard fonts: symbols such as "≥" are spelled out,
+# accents the fonts lack are dropped ("ő" becomes "o"), and each run of anything else becomes one marker.
+# Returns (text, whether a marker was used)
+def winansi_text(text):
+    parts = []
+    missing = False
+    in_missing_run = False
+    for char in text:
+        char = PDF_SUBSTITUTES.get(char, char)
+        if not fits_winansi(char):
+            char = "".join(c for c in unicodedata.normalize("NFKD", char) if not unicodedata.combining(c))
+        if fits_winansi(char):
+            parts.append(char)
+            in_missing_run = False
+        elif not in_missing_run:
+            parts.append(PDF_MISSING_MARKER)
+            missing = in_missing_run = True
+    return "".join(parts), missing
+
+# Function to check that the standard fonts can show every character of a string
+def fits_winansi(text):
+    return text.encode("cp1252", errors="ignore").decode("cp1252") == text
+
+# Function to escape text for a PDF string in WinAnsi encoding
+def pdf_string(text):
+    data = winansi_text(text)[0].encode("cp1252")
+    return b"(" + data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+# Function to lay the report out as PDF pages of (font, size, x, y, text) lines
+def layout_pdf(report, diagnosis, assessments=None):
+    pages = [[]]
+    y = PAGE_HEIGHT - MARGIN
+    usable = PAGE_WIDTH - 2 * MARGIN
+    missing = False
+
+    def add_line(text, size, bold=False, indent=0, space_before=0):
+        nonlocal y
+        leading = size * 1.35
+        y -= space_before
+        if y - leading < MARGIN:
+            pages.append([])
+            y = PAGE_HEIGHT - MARGIN
+        y -= leading
+        pages[-1].append(("F2" if bold else "F1", size, MARGIN + indent, y, text))
+
+    def add_wrapped(text, size, bold=False, indent=0, space_before=0, hanging=""):
+        nonlocal missing
+        text, marked = winansi_text(text)
+        missing = missing or marked
+        lines = wrap_text(text, size, usable - indent - text_width(hanging, size), bold)
+        for i, line in enumerate(lines):
+            prefix = hanging if i == 0 else ""
+            offset = 0 if i == 0 else text_width(hanging, size)
+            add_line(prefix + line, size, bold, indent + offset, space_before if i == 0 else 0)
+
+    for kind, level, text in parse_blocks(report):
+        text = inline_plain(text)
+        if kind == "heading":
+            size = FONT_SIZES.get(f"heading{level}", FONT_SIZES["heading"])
+            add_wrapped(text, size, bold=True, space_before=size * 0.6)
+        elif kind == "paragraph":
+            add_wrapped(text, FONT_SIZES["body"], space_before=4)
+        elif kind == "bullet":
+            add_wrapped(text, FONT_SIZES["body"], indent=14 + level * 14, hanging="•  ")
+        elif kind == "numbered":
+            number, rest = text.split(" ", 1)
+            add_wrapped(rest, FONT_SIZES["body"], indent=14 + level * 14, hanging=number + "  ")
+        elif kind == "rule":
+            add_line("", FONT_SIZES["small"])
+
+    rows = result_rows(diagnosis, assessments)
+    if rows:
+        add_wrapped("Questionnaire Scores", FONT_SIZES["heading2"], bold=True, space_before=12)
+        for name, scale, score, interpretation in rows:
+            add_wrapped(f"{name} - {scale}: {score} ({interpretation})", FONT_SIZES["body"], indent=14, hanging="•  ")
+    conditions = diagnosis.get("possible_conditions") or []
+    if conditions:
+        add_wrapped("Possible conditions identified during screening: " + ", ".join(conditions), FONT_SIZES["body"], space_before=6)
+    if missing:
+        add_wrapped(PDF_MISSING_NOTE, FONT_SIZES["small"], space_before=14)
+    add_wrapped(DISCLAIMER, FONT_SIZES["small"], space_before=14)
+    return pages
+
+# Function to render the report as a PDF using only the standard Helvetica fonts (nothing is embedded)
+def render_pdf(report, diagnosis, assessments=None, report_id=None):
+    pages = layout_pdf(report, diagnosis, assessments)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>"
+    ]
+    page_ids = []
+    for number, lines in enumerate(pages, 1):
+        stream = [b"BT"]
+        for font, size, x, y, text in lines:
+            stream.append(f"/{font} {size} Tf 1 0 0 1 {x:.2f} {y:.2f} Tm ".encode("ascii") + pdf_string(text) + b" Tj")
+        footer = f"Page {number} of {len(pages)}" + (f" - Report {report_id[:12]}" if report_id else "")
+        stream.append(f"/F1 {FONT_SIZES['small']} Tf 1 0 0 1 {MARGIN} {MARGIN / 2:.2f} Tm ".encode("ascii") + pdf_string(footer) + b" Tj")
+        stream.append(b"ET")
+        content = zlib.compress(b"\n".join(stream))
+        objects.append(f"<< /Length {len(content)} /Filter /FlateDecode >>\nstream\n".encode("ascii") + content + b"\nendstream")
+        content_id = len(objects)
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] /Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents {content_id} 0 R >>".encode("ascii"))
+        page_ids.append(len(objects))
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>".encode("ascii")
+
+    output = bytearray(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for i, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += f"{i} 0 obj\n".encode("ascii") + body + b"\nendobj\n"
+    xref = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("ascii")
+    for offset in offsets:
+        output += f"{offset:010d} 00000 n \n".encode("ascii")
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("ascii")
+    return bytes(output)
+
+RENDERERS = {
+    "html": render_html,
+    "pdf": render_pdf
+}
+
+# Function to get the hash that identifies an export: the report text and the results shown with it
+def export_key(report, diagnosis, fmt):
+    material = {
+        "renderer": RENDERER_VERSION,
+        "format": fmt,
+        "report": report,
+        "possible_conditions": diagnosis.get("possible_conditions", []),
+        "assessment_results": diagnosis.get("assessment_results", {})
+    }
+    return hashlib.sha256(json.dumps(material, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+# Function to get a rendered export (data, mime type, file name), rendering only on the first request
+def export_report(report, diagnosis, fmt="pdf", assessments=None):
+    if fmt not in RENDERERS:
+        raise ValueError(f"Unknown export format: {fmt} (use one of {', '.join(RENDERERS)})")
+    key = export_key(report, diagnosis, fmt)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    report_id = diagnosis.get("report_id")
+    data = RENDERERS[fmt](report, diagnosis, assessments, report_id)
+    file_name = f"mental-health-report-{datetime.now().strftime('%Y-%m-%d')}-{(report_id or key)[:8]}.{fmt}"
+    export = (data, EXPORT_FORMATS[fmt], file_name)
+    with _cache_lock:
+        _cache[key] = export
+        while len(_cache) > EXPORT_CACHE_SIZE:
+            _cache.popitem(last=False)
+    return export
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a markdown report to HTML or PDF and time the render.")
+    parser.add_argument("report", help="Markdown report file")
+    parser.add_argument("--format", choices=sorted(RENDERERS), default="pdf")
+    parser.add_argument("--diagnosis", help="JSON file with the session's diagnosis data")
+    parser.add_argument("--output", help="Where to write the rendered file")
+    args = parser.parse_args(argv)
+
+    with open(args.report, "r", encoding="utf-8") as f:
+        report = f.read()
+    diagnosis = {}
+    if args.diagnosis:
+        with open(args.diagnosis, "r", encoding="utf-8") as f:
+            diagnosis = json.load(f)
+
+    start = time.perf_counter()
+    data = RENDERERS[args.format](report, diagnosis)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"Rendered {len(data)} bytes of {args.format} in {elapsed_ms:.1f} ms")
+    if args.output:
+        with open(args.output, "wb") as f:
+            f.write(data)
+        print(f"Saved to {args.output}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
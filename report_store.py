@@ -0,0 +1,128 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from content_store import active_content
+
+# Function to get the template version: a hash of the report prompt, so editing it invalidates old reports
+def report_template_version(template=None):
+    if template is None:
+        template = active_content().prompts["report"]
+    return hashlib.sha256(template.encode("utf-8")).hexdigest()[:16]
+
+# Function to build the cache key for a report from everything that goes into it: the results, the
+# conversation sent with them (messages) and the date written in its header
+def report_cache_key(diagnosis, template=None, messages=(), date=None):
+    results = {}
+    for assessment, result in diagnosis.get("assessment_results", {}).items():
+        # Administration details do not change the report, only the scores and bands do
+        results[assessment] = {key: value for key, value in result.items() if key != "administration"}
+    material = {
+        "template_version": report_template_version(template),
+        "screening_notes": diagnosis.get("screening_notes", ""),
+        "possible_conditions": diagnosis.get("possible_conditions", []),
+        "assessment_results": results,
+        # Percentile ranks are written into the report, so a report is only reused while they are unchanged
+        "norms": diagnosis.get("norms", {}),
+        # The report quotes the conversation, so only the same conversation on the same day gets the same report
+        "transcript": hashlib.sha256(json.dumps([[m["role"], m["content"]] for m in messages], separators=(",", ":")).encode("utf-8")).hexdigest(),
+        "date": date
+    }
+    canonical = json.dumps(material, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+# Reports stored on disk by content hash, evicting the least recently used ones past a size limit
+class ReportStore:
+    def __init__(self, directory, max_bytes=100 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.md")
+
+    # Scan the directory once so sizes and last-use times are known without touching disk again
+    def _load_entries(self):
+        if self._entries is None:
+            self._entries = {}
+            if os.path.isdir(self.directory):
+                for name in os.listdir(self.directory):
+                    if name.endswith(".md"):
+                        stat = os.stat(os.path.join(self.directory, name))
+                        self._entries[name[:-3]] = [stat.st_size, stat.st_mtime]
+        return self._entries
+
+    def get(self, key):
+        with self._lock:
+            entries = self._load_entries()
+            if key not in entries:
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(key), "r", encoding="utf-8") as f:
+                    report = f.read()
+            except OSError:
+                del entries[key]
+                self.misses += 1
+                return None
+            # Mark as recently used (the file time keeps the order across restarts)
+            now = time.time()
+            entries[key][1] = now
+            try:
+                os.utime(self._path(key), (now, now))
+            except OSError:
+                pass
+            self.hits += 1
+            return report
+
+    def contains(self, key):
+        with self._lock:
+            return key in self._load_entries()
+
+    def put(self, key, report):
+        data = report.encode("utf-8")
+        with self._lock:
+            entries = self._load_entries()
+            os.makedirs(self.directory, exist_ok=True)
+            temp_path = self._path(key) + f".{os.getpid()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, self._path(key))
+            entries[key] = [len(data), time.time()]
+            self._evict()
+
+    def _evict(self):
+        total = sum(size for size, _ in self._entries.values())
+        for key in sorted(self._entries, key=lambda k: self._entries[k][1]):
+            if total <= self.max_bytes:
+                break
+            total -= self._entries[key][0]
+            del self._entries[key]
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def total_bytes(self):
+        with self._lock:
+            return sum(size for size, _ in self._load_entries().values())
+
+_store = None
+_store_lock = threading.Lock()
+
+# Function to get the shared report store (REPORT_CACHE_DIR and REPORT_CACHE_MAX_MB configure it)
+def get_report_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ReportStore(
+                    os.getenv("REPORT_CACHE_DIR", "report_cache"),
+                    int(os.getenv("REPORT_CACHE_MAX_MB", "100")) * 1024 * 1024
+                )
+    return _store
@@ -0,0 +1,51 @@
+import heapq
+import math
+
+from condition_index import normalize, stem
+
+# Words too common to say anything about which passage fits, stemmed as the index stems them
+STOP_WORDS = {stem(word) for word in [
+    "a", "about", "am", "an", "and", "are", "as", "at", "be", "been", "but", "by", "can", "do", "for", "from",
+    "had", "has", "have", "i", "if", "in", "is", "it", "me", "my", "of", "on", "or", "so", "that", "the", "this",
+    "to", "was", "what", "with", "you", "your"
+]}
+
+# Function to turn text into the stemmed terms the index uses
+def tokenize(text):
+    return [term for term in normalize(text) if term not in STOP_WORDS]
+
+# In-memory BM25 index: an inverted list of (document, term count) per term, with the
+# per-document length normalisation worked out once when the index is built
+class BM25Index:
+    def __init__(self, texts, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.postings = {}
+        lengths = []
+        for document, text in enumerate(texts):
+            counts = {}
+            for term in tokenize(text):
+                counts[term] = counts.get(term, 0) + 1
+            lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                self.postings.setdefault(term, []).append((document, count))
+        self.size = len(lengths)
+        average = sum(lengths) / self.size if self.size and sum(lengths) else 1
+        self.norms = [k1 * (1 - b + b * length / average) for length in lengths]
+        self.idf = {
+            term: math.log(1 + (self.size - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    # Function to get the best documents for a query: [(document, score), ...], best first. Terms are
+    # added up in query order and ties go to the earlier document, so results do not vary between runs
+    def search(self, query, k=5, allowed=None):
+        scores = {}
+        for term in dict.fromkeys(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for document, count in self.postings[term]:
+                if allowed is not None and document not in allowed:
+                    continue
+                scores[document] = scores.get(document, 0.0) + idf * count * (self.k1 + 1) / (count + self.norms[document])
+        return heapq.nlargest(k, scores.items(), key=lambda item: (item[1], -item[0]))
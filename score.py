@@ -0,0 +1,56 @@
+import argparse
+import json
+import sys
+
+from content_store import get_content_store
+from scoring import administration_summary, check_responses, score_responses
+
+# Function to score one set of raw item scores (None for an item that was not asked) with a content version
+def score_record(content, assessment, responses):
+    assessment_data = content.instruments.get(assessment)
+    if assessment_data is None:
+        raise ValueError(f"Unknown questionnaire: {assessment}")
+    check_responses(assessment, assessment_data, responses)
+    result = score_responses(assessment_data, responses, content.band_tables[assessment])
+    result["administration"] = administration_summary(assessment_data, responses, None in responses)
+    return result
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score questionnaire responses without starting the app or loading any model client.")
+    parser.add_argument("assessment", nargs="?", help="Questionnaire, e.g. DASS-21 (omit to read JSONL from standard input)")
+    parser.add_argument("responses", nargs="*", help="Raw item scores in item order; '-' for an item that was not asked")
+    args = parser.parse_args(argv)
+
+    content = get_content_store().current
+    if args.assessment:
+        responses = []
+        for number, value in enumerate(args.responses, 1):
+            try:
+                responses.append(None if value == "-" else int(value))
+            except ValueError:
+                parser.error(f"item {number}: '{value}' is not a whole number or '-'")
+        try:
+            print(json.dumps(score_record(content, args.assessment, responses), indent=2))
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    # One {"assessment": ..., "responses": [...]} object per line; other keys are passed through
+    failed = 0
+    for line_number, line in enumerate(sys.stdin, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            record["result"] = score_record(content, record["assessment"], record["responses"])
+        except (ValueError, KeyError, TypeError) as e:
+            failed += 1
+            print(f"Line {line_number}: {e}", file=sys.stderr)
+            continue
+        print(json.dumps(record))
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
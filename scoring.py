@@ -0,0 +1,114 @@
+import math
+
+# Function to turn a band label such as "15-18" or "34+" into (min, max)
+def parse_score_range(range_str):
+    if range_str.endswith("+"):
+        return int(range_str[:-1]), math.inf
+    min_score, max_score = map(int, range_str.split("-"))
+    return min_score, max_score
+
+# Function to find the band a score falls into, in a compiled band table or in band labels such as {"15-18": "Moderate"}
+def get_band(bands, score):
+    if isinstance(bands, dict):
+        bands = compile_bands(bands)
+    for min_score, max_score, level in bands:
+        if min_score <= score <= max_score:
+            return level
+    return ""
+
+# Function to parse band labels into a band table: [(min, max, label), ...]
+def compile_bands(bands):
+    return [parse_score_range(range_str) + (label,) for range_str, label in bands.items()]
+
+# Function to get the band labels of each subscale as written in the content ("total" for a single score)
+def get_band_labels(assessment_data):
+    if "subscales" in assessment_data:
+        return {name: assessment_data["interpretation"][name] for name in assessment_data["subscales"]}
+    return {"total": assessment_data["interpretation"]}
+
+# Function to get the items and multiplier of each scale: {subscale: (item indexes, multiplier)}
+def get_scale_items(assessment_data):
+    multiplier = assessment_data.get("multiplier", 1)
+    if "subscales" in assessment_data:
+        return {name: (items, multiplier) for name, items in assessment_data["subscales"].items()}
+    # Single total score over every item
+    return {"total": (list(range(len(assessment_data["questions"]))), multiplier)}
+
+# Function to describe how an instrument is scored: {subscale: (item indexes, multiplier, band table)}. band_tables
+# are the instrument's tables compiled by its content version (ContentVersion.band_tables); without them the
+# band labels are parsed here
+def get_subscales(assessment_data, band_tables=None):
+    if band_tables is None:
+        band_tables = {name: compile_bands(bands) for name, bands in get_band_labels(assessment_data).items()}
+    return {name: (items, multiplier, band_tables[name]) for name, (items, multiplier) in get_scale_items(assessment_data).items()}
+
+# Function to get the lowest and highest score a subscale can still reach
+def score_bounds(items, multiplier, responses, max_item_score):
+    answered = sum(responses[i] for i in items if responses[i] is not None)
+    unanswered = sum(1 for i in items if responses[i] is None)
+    return answered * multiplier, (answered + unanswered * max_item_score) * multiplier
+
+# Function to get the band of every subscale whose outcome can no longer change (None if still open)
+def settled_bands(assessment_data, responses, band_tables=None):
+    max_item_score = max(assessment_data["scores"])
+    settled = {}
+    for name, (items, multiplier, bands) in get_subscales(assessment_data, band_tables).items():
+        low, high = score_bounds(items, multiplier, responses, max_item_score)
+        low_band = get_band(bands, low)
+        settled[name] = low_band if low_band == get_band(bands, high) else None
+    return settled
+
+# Function to pick the next item worth asking, skipping items that cannot change any band (None when done)
+def next_adaptive_index(assessment_data, responses, start=0, band_tables=None):
+    settled = settled_bands(assessment_data, responses, band_tables)
+    open_items = set()
+    for name, (items, _) in get_scale_items(assessment_data).items():
+        if settled[name] is None:
+            open_items.update(items)
+    for index in range(start, len(assessment_data["questions"])):
+        if responses[index] is None and index in open_items:
+            return index
+    return None
+
+# Function to check raw item scores before scoring them: one per item, each one of the instrument's scores
+# (or None for an item that was not asked); raises ValueError naming the first bad item
+def check_responses(assessment, assessment_data, responses):
+    if len(responses) != len(assessment_data["questions"]):
+        raise ValueError(f"{assessment} needs {len(assessment_data['questions'])} responses, got {len(responses)}")
+    allowed = sorted(set(assessment_data["scores"]))
+    for number, value in enumerate(responses, 1):
+        if value is not None and (isinstance(value, bool) or value not in allowed):
+            raise ValueError(f"{assessment} item {number}: {value!r} is not one of the scores {allowed}")
+
+# Function to score a completed instrument: {"scores", "interpretations"} per subscale, or {"score", "interpretation"}
+# for a single total (items skipped in adaptive mode count as 0)
+def score_responses(assessment_data, responses, band_tables=None):
+    subscales = get_subscales(assessment_data, band_tables)
+    scores = {name: sum(responses[i] or 0 for i in items) * multiplier for name, (items, multiplier, _) in subscales.items()}
+    interpretations = {name: get_band(bands, scores[name]) for name, (_, _, bands) in subscales.items()}
+    if "subscales" in assessment_data:
+        return {"scores": scores, "interpretations": interpretations}
+    return {"score": scores["total"], "interpretation": interpretations["total"]}
+
+# Function to show a scale's score ("total" for a single score). In adaptive mode skipped items count as 0, so
+# while they could still have added to it the score is shown as its possible range, e.g. "14-22"
+def format_score(result, subscale="total"):
+    score = result["scores"][subscale] if "scores" in result else result["score"]
+    low, high = result.get("administration", {}).get("score_ranges", {}).get(subscale, (score, score))
+    return str(score) if low == high else f"{low}-{high}"
+
+# Function to summarise how an instrument was administered, for the results (carried: item indexes answered
+# from a shared item of another questionnaire)
+def administration_summary(assessment_data, responses, adaptive, carried=()):
+    max_item_score = max(assessment_data["scores"])
+    score_ranges = {}
+    for name, (items, multiplier) in get_scale_items(assessment_data).items():
+        score_ranges[name] = list(score_bounds(items, multiplier, responses, max_item_score))
+    return {
+        "mode": "adaptive" if adaptive else "full",
+        "items_total": len(responses),
+        "items_answered": sum(1 for response in responses if response is not None),
+        "items_skipped": [i + 1 for i, response in enumerate(responses) if response is None],
+        "items_carried": sorted(i + 1 for i in carried),
+        "score_ranges": score_ranges
+    }
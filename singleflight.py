@@ -0,0 +1,114 @@
+import hashlib
+import json
+import os
+import threading
+
+# Function to get the coalescing key of a model request (the timeout does not change the answer)
+def request_key(request):
+    material = {key: value for key, value in request.items() if key != "timeout"}
+    return hashlib.sha256(json.dumps(material, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+# One upstream call and everyone waiting for it
+class _Flight:
+    def __init__(self):
+        self.parts = []
+        self.done = False
+        self.result = None
+        self.error = None
+        self.condition = threading.Condition()
+
+    def publish(self, text):
+        with self.condition:
+            self.parts.append(text)
+            self.condition.notify_all()
+
+    def finish(self, result, error):
+        with self.condition:
+            # A call that was not streamed still reaches streaming followers, as one piece
+            if error is None and not self.parts and result:
+                self.parts.append(result)
+            self.result = result
+            self.error = error
+            self.done = True
+            self.condition.notify_all()
+
+    # Function to wait for the leader's result, passing streamed text on as it arrives
+    def follow(self, on_token):
+        sent = 0
+        while True:
+            with self.condition:
+                while sent == len(self.parts) and not self.done:
+                    self.condition.wait()
+                new_parts = self.parts[sent:]
+                sent = len(self.parts)
+                done = self.done
+            if on_token is not None:
+                for part in new_parts:
+                    on_token(part)
+            if done:
+                break
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+# Single-flight: concurrent calls with the same key share one execution and its result
+class SingleFlight:
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.flights = {}
+        self.stats = {"calls": 0, "upstream": 0, "coalesced": 0, "coalesced_by_agent": {}}
+        self._lock = threading.Lock()
+
+    # Function to run `call(on_token)` once per key at a time; on_token may be None for a plain call
+    def do(self, key, call, on_token=None, agent=None):
+        with self._lock:
+            self.stats["calls"] += 1
+            flight = self.flights.get(key) if self.enabled else None
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                if self.enabled:
+                    self.flights[key] = flight
+                self.stats["upstream"] += 1
+            else:
+                self.stats["coalesced"] += 1
+                by_agent = self.stats["coalesced_by_agent"]
+                by_agent[agent] = by_agent.get(agent, 0) + 1
+
+        if not leader:
+            return flight.follow(on_token)
+
+        def publish(text):
+            flight.publish(text)
+            on_token(text)
+
+        try:
+            result = call(publish if on_token is not None else None)
+        except BaseException as e:
+            flight.finish(None, e)
+            raise
+        else:
+            flight.finish(result, None)
+            return result
+        finally:
+            with self._lock:
+                if self.flights.get(key) is flight:
+                    del self.flights[key]
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = dict(self.stats, in_flight=len(self.flights))
+            snapshot["coalesced_by_agent"] = dict(self.stats["coalesced_by_agent"])
+            return snapshot
+
+_single_flight = None
+_single_flight_lock = threading.Lock()
+
+# Function to get the shared single-flight group (COALESCE_REQUESTS=0 turns coalescing off)
+def get_single_flight():
+    global _single_flight
+    if _single_flight is None:
+        with _single_flight_lock:
+            if _single_flight is None:
+                _single_flight = SingleFlight(os.getenv("COALESCE_REQUESTS", "1") != "0")
+    return _single_flight
@@ -0,0 +1,70 @@
+import threading
+import time
+
+import pytest
+
+from admission import PRIORITY_BATCH, PRIORITY_CRISIS, PRIORITY_SCREENING, AdmissionController, AdmissionRejected, current_context, is_crisis_message, request_context
+
+def test_crisis_language_is_recognised():
+    assert is_crisis_message("Sometimes I want to DIE")
+    assert not is_crisis_message("I feel tired")
+
+def test_request_context_keeps_what_an_inner_block_does_not_set():
+    with request_context("session-1", priority=PRIORITY_BATCH):
+        with request_context(priority=PRIORITY_CRISIS):
+            assert current_context()["session_id"] == "session-1"
+            assert current_context()["priority"] == PRIORITY_CRISIS
+        assert current_context()["priority"] == PRIORITY_BATCH
+    assert current_context() == {}
+
+def test_calls_within_the_limits_go_straight_through():
+    controller = AdmissionController()
+    positions = []
+    ticket = controller.admit("a", PRIORITY_SCREENING, 100, positions.append)
+    assert ticket.tokens == 100 and positions == []
+    assert controller.snapshot()["admitted"] == 1
+
+def test_session_over_its_limit_waits_while_others_go():
+    controller = AdmissionController(session_requests_per_minute=1, max_wait_seconds=0.1)
+    controller.admit("a", PRIORITY_SCREENING, 10)
+    positions = []
+    with pytest.raises(AdmissionRejected):
+        controller.admit("a", PRIORITY_SCREENING, 10, positions.append)
+    assert positions == [1, None]
+    controller.admit("b", PRIORITY_SCREENING, 10)
+
+def test_full_queue_is_refused_straight_away():
+    controller = AdmissionController(max_queue=0)
+    with pytest.raises(AdmissionRejected):
+        controller.admit("a", PRIORITY_SCREENING, 10)
+    assert controller.snapshot()["rejected"] == 1
+
+def test_higher_priority_call_goes_first_when_tokens_come_back():
+    controller = AdmissionController(tokens_per_minute=100, max_wait_seconds=2)
+    first = controller.admit("a", PRIORITY_SCREENING, 100)
+    order = []
+
+    def call(session_id, priority):
+        controller.admit(session_id, priority, 50)
+        order.append(session_id)
+
+    batch = threading.Thread(target=call, args=("batch", PRIORITY_BATCH))
+    batch.start()
+    time.sleep(0.05)
+    crisis = threading.Thread(target=call, args=("crisis", PRIORITY_CRISIS))
+    crisis.start()
+    time.sleep(0.05)
+    # Half the tokens come back: room for one waiting call, and the crisis call is first in line
+    first.release(used_tokens=50)
+    crisis.join()
+    assert order == ["crisis"]
+    controller.refund(None, 50)
+    batch.join()
+    assert order == ["crisis", "batch"]
+
+def test_upstream_throttling_pauses_every_call():
+    controller = AdmissionController(max_wait_seconds=0.05)
+    controller.pause(1)
+    with pytest.raises(AdmissionRejected):
+        controller.admit("a", PRIORITY_CRISIS, 10)
+    assert controller.snapshot()["upstream_throttled"] == 1
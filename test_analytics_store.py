@@ -0,0 +1,124 @@
+import os
+from datetime import date
+
+import pytest
+
+import analytics_store
+from analytics_store import AnalyticsStore, AnalyticsWriter, Segment, SegmentWriter, day_number, record_item, record_result, session_number, week_start
+
+# 2024-01-01 is a Monday
+MONDAY = (date(2024, 1, 1) - date(1970, 1, 1)).days
+
+def result_rows(day, session, bands):
+    return [(day, session, "DASS-21", subscale, band, "full", score) for subscale, (band, score) in bands.items()]
+
+# Function to write one finished two-item questionnaire and one that stopped after its first item
+def funnel_rows(day):
+    return [
+        (day, 1, "PCL-5", 0, 1, 0, 2),
+        (day, 1, "PCL-5", 1, 2, 1, 4),
+        (day, 2, "PCL-5", 0, 1, 0, 0)
+    ]
+
+def test_weeks_start_on_monday():
+    assert week_start(0) == date(1969, 12, 29)
+    assert week_start(MONDAY) == week_start(MONDAY + 6) == date(2024, 1, 1)
+    assert week_start(MONDAY + 7) == date(2024, 1, 8)
+    assert day_number(86400 * MONDAY + 3600) == MONDAY
+
+def test_session_ids_are_hashed_to_fixed_numbers():
+    assert session_number("abc") == session_number("abc")
+    assert session_number("abc") != session_number("abd")
+    assert -2 ** 63 <= session_number("abc") < 2 ** 63
+    assert session_number(None) == session_number("")
+
+def test_results_are_counted_by_week_and_band(tmp_path):
+    segment = SegmentWriter(str(tmp_path))
+    segment.append({"results": result_rows(MONDAY, 1, {"depression": ("Mild", 12), "anxiety": ("Normal", 4)})
+                    + result_rows(MONDAY + 2, 2, {"depression": ("Severe", 22)})
+                    + result_rows(MONDAY + 8, 3, {"depression": ("Mild", 10)})})
+    store = AnalyticsStore(str(tmp_path))
+    store.refresh()
+    assert store.rows == {"results": 4, "items": 0}
+    assert store.instruments() == {"DASS-21": {"depression": ["Mild", "Severe"], "anxiety": ["Normal"]}}
+    assert store.band_distribution("DASS-21", "depression") == {date(2024, 1, 1): {"Mild": 1, "Severe": 1}, date(2024, 1, 8): {"Mild": 1}}
+    assert store.band_distribution("DASS-21", "depression", start_day=MONDAY + 7) == {date(2024, 1, 8): {"Mild": 1}}
+    assert store.subscale_trend("DASS-21")[date(2024, 1, 1)] == {"depression": (17.0, 2), "anxiety": (4.0, 1)}
+    assert store.band_distribution("DASS-21", "depression", mode="adaptive") == {}
+
+def test_item_funnel_counts_drop_off(tmp_path):
+    SegmentWriter(str(tmp_path)).append({"items": funnel_rows(MONDAY)})
+    store = AnalyticsStore(str(tmp_path))
+    store.refresh()
+    funnel = store.item_funnel("PCL-5")
+    assert funnel["started"] == 2 and funnel["completed"] == 1 and funnel["completion_rate"] == 0.5
+    assert funnel["positions"][0] == {"position": 1, "reached": 2, "completed_here": 0, "dropped": 1, "drop_rate": 0.5}
+    assert funnel["items"] == [{"item": 1, "answered": 2, "mean_score": 1.0}, {"item": 2, "answered": 1, "mean_score": 4.0}]
+    assert store.item_funnel("DASS-21")["completion_rate"] is None
+
+def test_refresh_picks_up_new_rows_and_segments(tmp_path):
+    first = SegmentWriter(str(tmp_path))
+    first.append({"results": result_rows(MONDAY, 1, {"depression": ("Mild", 12)})})
+    store = AnalyticsStore(str(tmp_path))
+    store.refresh()
+    first.append({"results": result_rows(MONDAY, 2, {"depression": ("Mild", 11)})})
+    # A second process numbers its text values separately; both must decode to the same bands
+    second = SegmentWriter(str(tmp_path))
+    second.append({"results": result_rows(MONDAY, 3, {"stress": ("Normal", 2), "depression": ("Mild", 13)})})
+    store.refresh()
+    assert store.rows["results"] == 4
+    assert store.band_distribution("DASS-21", "depression") == {date(2024, 1, 1): {"Mild": 3}}
+    assert store.band_distribution("DASS-21", "stress") == {date(2024, 1, 1): {"Normal": 1}}
+
+def test_full_blocks_are_summarised_once_and_kept(tmp_path, monkeypatch):
+    monkeypatch.setattr(analytics_store, "BLOCK_ROWS", 4)
+    segment = SegmentWriter(str(tmp_path))
+    segment.append({"results": [row for session in range(10) for row in result_rows(MONDAY + session % 3, session, {"depression": ("Mild", session)})]})
+    store = AnalyticsStore(str(tmp_path))
+    store.refresh()
+    trend = store.subscale_trend("DASS-21")
+    assert trend[date(2024, 1, 1)]["depression"] == (4.5, 10)
+    with open(os.path.join(segment.path, "results.summaries.jsonl"), encoding="utf-8") as f:
+        assert len(f.readlines()) == 2
+    # A new reader takes the saved summaries rather than working them out again
+    reader = Segment(segment.path)
+    assert sorted(reader.blocks["results"]) == [0, 1]
+    fresh = AnalyticsStore(str(tmp_path))
+    fresh.refresh()
+    assert fresh.subscale_trend("DASS-21") == trend
+
+def test_cut_off_write_is_ignored(tmp_path):
+    segment = SegmentWriter(str(tmp_path))
+    segment.append({"results": result_rows(MONDAY, 1, {"depression": ("Mild", 12)})})
+    # As if the process died after writing one column of the next row
+    with open(os.path.join(segment.path, "results.day.bin"), "ab") as f:
+        f.write(b"\0" * 4)
+    store = AnalyticsStore(str(tmp_path))
+    store.refresh()
+    assert store.rows["results"] == 1
+
+def test_writer_batches_rows_in_the_background(tmp_path):
+    writer = AnalyticsWriter(str(tmp_path), flush_interval=0.1)
+    for day in range(3):
+        assert writer.submit("items", funnel_rows(MONDAY + day))
+    writer.close()
+    store = AnalyticsStore(str(tmp_path))
+    store.refresh()
+    assert store.rows["items"] == 9
+    assert len(os.listdir(tmp_path)) == 1
+
+def test_outcomes_are_recorded_only_when_enabled(tmp_path, monkeypatch):
+    writer = AnalyticsWriter(str(tmp_path), flush_interval=0.1)
+    monkeypatch.setattr(analytics_store, "_writer", writer)
+    monkeypatch.setenv("ANALYTICS", "0")
+    record_result("s1", "PCL-5", {"score": 40, "interpretation": "Probable PTSD - clinical assessment recommended"})
+    monkeypatch.setenv("ANALYTICS", "1")
+    record_result("s2", "PCL-5", {"score": 12, "interpretation": "Below threshold for PTSD", "administration": {"mode": "adaptive"}})
+    record_result("s2", "DASS-21", {"scores": {"depression": 14}, "interpretations": {"depression": "Moderate"}})
+    record_item("s2", "PCL-5", 0, 3, 1, False)
+    writer.close()
+    store = AnalyticsStore(str(tmp_path))
+    store.refresh()
+    assert store.rows == {"results": 2, "items": 1}
+    assert store.instruments() == {"PCL-5": {"total": ["Below threshold for PTSD"]}, "DASS-21": {"depression": ["Moderate"]}}
+    assert list(store.band_distribution("PCL-5", "total", mode="adaptive").values()) == [{"Below threshold for PTSD": 1}]
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+import api_server
+from api_server import ApiServer, HttpError
+
+@pytest.fixture(autouse=True)
+def scratch(tmp_path, monkeypatch):
+    monkeypatch.setenv("FALLBACK_LOG", str(tmp_path / "fallback_log.jsonl"))
+    monkeypatch.setenv("REPORT_CACHE_DIR", str(tmp_path / "report_cache"))
+    monkeypatch.setenv("CAPTURE_TRANSCRIPTS", "0")
+    monkeypatch.setenv("ANALYTICS", "0")
+
+# Stream writer that keeps what the server wrote
+class RecordingWriter:
+    def __init__(self):
+        self.data = b""
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def status(self):
+        return int(self.data.split(b" ", 2)[1])
+
+    def json(self):
+        return json.loads(self.data.partition(b"\r\n\r\n")[2])
+
+# Function to send one request to the API: (status, JSON body), or raises HttpError as dispatch does
+def request(api, method, path, payload=None):
+    async def send():
+        writer = RecordingWriter()
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8") if payload is not None else b""
+        await api.dispatch(method, path, body, writer)
+        return writer
+    writer = asyncio.run(send())
+    return writer.status(), writer.json() if writer.status() != 204 else None
+
+# Function to get the status of a request the API rejects
+def rejected(api, method, path, payload=None):
+    with pytest.raises(HttpError) as error:
+        request(api, method, path, payload)
+    return error.value.status
+
+def test_option_must_be_an_integer_and_not_a_bool():
+    api = ApiServer(workers=2)
+    _, session = request(api, "POST", "/sessions")
+    path = f"/sessions/{session['session_id']}/answers"
+    for option in [True, False, "1", 1.0, None]:
+        assert rejected(api, "POST", path, {"option": option}) == 400
+    # A whole number passes validation; the session is still screening, so no item is waiting
+    assert rejected(api, "POST", path, {"option": 1}) == 409
+
+def test_bad_requests_are_rejected():
+    api = ApiServer(workers=2)
+    _, session = request(api, "POST", "/sessions")
+    path = f"/sessions/{session['session_id']}"
+    assert rejected(api, "GET", "/sessions/unknown") == 404
+    assert rejected(api, "GET", "/elsewhere") == 404
+    assert rejected(api, "GET", "/sessions") == 405
+    assert rejected(api, "POST", path + "/messages", b"not json") == 400
+    assert rejected(api, "POST", path + "/messages", [1, 2]) == 400
+    assert rejected(api, "POST", path + "/messages", {"content": "   "}) == 400
+    assert rejected(api, "POST", path + "/follow-up", {"content": "Hello"}) == 409
+    assert rejected(api, "GET", path + "/export") == 409
+    assert rejected(api, "PUT", path) == 405
+
+def test_export_renders_off_the_event_loop(monkeypatch):
+    threads = []
+
+    def export_report(report, diagnosis, fmt, instruments):
+        threads.append(threading.current_thread().name)
+        return b"%PDF-", "application/pdf", "report.pdf"
+
+    monkeypatch.setattr(api_server, "export_report", export_report)
+    api = ApiServer(workers=2)
+    _, view = request(api, "POST", "/sessions")
+    session, _ = api.store.get(view["session_id"])
+    session.report, session.report_generated = "Report", True
+
+    async def send():
+        writer = RecordingWriter()
+        await api.dispatch("GET", f"/sessions/{session.session_id}/export?format=pdf", b"", writer)
+        return writer
+
+    assert asyncio.run(send()).status() == 200
+    assert threads and threads[0].startswith("engine")
+
+def test_idle_sessions_are_evicted_on_a_timer():
+    api = ApiServer(workers=2, session_ttl=60)
+    _, idle = request(api, "POST", "/sessions")
+    _, busy = request(api, "POST", "/sessions")
+    _, active = request(api, "POST", "/sessions")
+    for session_id in [idle["session_id"], busy["session_id"]]:
+        api.store.sessions[session_id].last_active = time.time() - 120
+
+    async def run_evictor():
+        # A session handling a request is never evicted under it
+        async with api.store.locks[busy["session_id"]]:
+            evictor = asyncio.create_task(api.evict_periodically(interval=0.01))
+            await asyncio.sleep(0.05)
+            evictor.cancel()
+
+    asyncio.run(run_evictor())
+    assert set(api.store.sessions) == {busy["session_id"], active["session_id"]}
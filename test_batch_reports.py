@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+import model_router
+import upstream_pool
+from batch_reports import FAILURES_FILE, PROGRESS_FILE, RESULTS_FILE, BatchRunner, session_from_record
+from evaluate import StandInClient
+from upstream_pool import Endpoint, UpstreamPool
+
+DASS = [1, 0, 2, 0, 3, 3, 3, 3, 1, 0, 3, 0, 3, 3, 0, 3, 2, 1, 0, 2, 0]
+
+@pytest.fixture(autouse=True)
+def scratch(tmp_path, monkeypatch):
+    monkeypatch.setenv("FALLBACK_LOG", str(tmp_path / "fallback_log.jsonl"))
+    monkeypatch.setenv("REPORT_CACHE_DIR", str(tmp_path / "report_cache"))
+    monkeypatch.setenv("CAPTURE_TRANSCRIPTS", "0")
+    monkeypatch.setenv("ANALYTICS", "0")
+    monkeypatch.setattr(model_router, "_circuits", {})
+    monkeypatch.setattr(upstream_pool, "_pool", UpstreamPool([Endpoint("test", client=StandInClient())], health_check_seconds=0))
+
+def record(session_id, responses=DASS, assessment="DASS-21"):
+    return {"session_id": session_id, "diagnosis": {"possible_conditions": ["depression"]}, "assessment_responses": {assessment: responses}, "messages": [{"role": "user", "content": "I feel low"}]}
+
+def write_sessions(path, records):
+    path.write_text("".join((json.dumps(r) if isinstance(r, dict) else r) + "\n" for r in records), encoding="utf-8")
+
+def read_lines(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+def test_imported_responses_are_scored():
+    session = session_from_record(record("a"))
+    result = session.diagnosis["assessment_results"]["DASS-21"]
+    assert result["scores"]["depression"] == 2 * sum(DASS[i] for i in [2, 4, 9, 12, 15, 16, 20])
+    assert session.chat_state == "awaiting_report"
+
+def test_bad_records_are_refused():
+    for bad in [record("a", [1] * 5), record("a", [9] * 21), record("a", [1], "XYZ"), {"session_id": "a"}]:
+        with pytest.raises(ValueError):
+            session_from_record(bad)
+
+def test_run_writes_reports_and_failures_then_resumes(tmp_path):
+    sessions = tmp_path / "sessions.jsonl"
+    write_sessions(sessions, [record("a"), record("b", [1] * 5), "not json", record("c", [3] * 21)])
+    output = tmp_path / "out"
+    counts = BatchRunner(str(output), concurrency=2, tokens_per_minute=10000000).run(str(sessions))
+    assert (counts["done"], counts["failed"]) == (2, 2)
+    results = read_lines(output / RESULTS_FILE)
+    assert sorted(entry["session_id"] for entry in results) == ["a", "c"]
+    assert all(entry["report"] and entry["report_id"] for entry in results)
+    assert sorted(entry["session_id"] for entry in read_lines(output / FAILURES_FILE)) == ["b", "line-3"]
+    assert json.loads((output / PROGRESS_FILE).read_text(encoding="utf-8"))["done"] == 2
+
+    # A second run skips finished sessions and only retries the failures
+    counts = BatchRunner(str(output), tokens_per_minute=10000000).run(str(sessions))
+    assert (counts["done"], counts["skipped"], counts["failed"]) == (0, 2, 2)
+    counts = BatchRunner(str(output), tokens_per_minute=10000000, retry_failed=False).run(str(sessions))
+    assert (counts["skipped"], counts["failed"]) == (4, 0)
+
+def test_cut_off_results_line_is_ignored_on_resume(tmp_path):
+    sessions = tmp_path / "sessions.jsonl"
+    write_sessions(sessions, [record("a")])
+    output = tmp_path / "out"
+    output.mkdir()
+    (output / RESULTS_FILE).write_text('{"session_id": "a", "status": "o', encoding="utf-8")
+    assert BatchRunner(str(output), tokens_per_minute=10000000).run(str(sessions))["done"] == 1
+    lines = (output / RESULTS_FILE).read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 2 and json.loads(lines[1])["session_id"] == "a"
@@ -0,0 +1,114 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import cassette
+import model_router
+from cassette import Cassette, CassetteMiss, request_fingerprint
+from evaluate import StandInClient, run_evaluation
+from upstream_pool import Endpoint
+
+MESSAGES = [{"role": "system", "content": "Screen gently."}, {"role": "user", "content": "I feel low."}]
+
+@pytest.fixture(autouse=True)
+def scratch(tmp_path, monkeypatch):
+    monkeypatch.setenv("FALLBACK_LOG", str(tmp_path / "fallback_log.jsonl"))
+    monkeypatch.setenv("REPORT_CACHE_DIR", str(tmp_path / "report_cache"))
+    monkeypatch.setenv("CAPTURE_TRANSCRIPTS", "0")
+    monkeypatch.setenv("ANALYTICS", "0")
+    monkeypatch.delenv("MODEL_CASSETTE", raising=False)
+    monkeypatch.setattr(cassette, "_cassette", None)
+    monkeypatch.setattr(model_router, "_circuits", {})
+
+# Chat client that streams a fixed reply in three chunks and counts its calls
+class StreamingClient:
+    def __init__(self):
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model, messages, stream=False, **kwargs):
+        self.calls += 1
+        chunks = ["I hear ", "that you ", "feel low."]
+        if not stream:
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="".join(chunks)))], usage=None)
+        return iter(SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))]) for text in chunks)
+
+def reply(completion):
+    return completion.choices[0].message.content
+
+def test_fingerprint_ignores_dates_and_call_options():
+    dated = [{"role": "user", "content": "Report for January 01, 2025"}]
+    assert request_fingerprint("gpt-4o", dated) == request_fingerprint("gpt-4o", [{"role": "user", "content": "Report for March 14, 2026"}])
+    assert request_fingerprint("gpt-4o", MESSAGES, 0.7, 100) != request_fingerprint("gpt-4o", MESSAGES, 0.2, 100)
+    assert request_fingerprint("gpt-4o", MESSAGES) != request_fingerprint("gpt-4o-mini", MESSAGES)
+
+def test_recorded_call_replays_without_a_client(tmp_path):
+    path = str(tmp_path / "calls.jsonl")
+    recorded = reply(Cassette(path, "record").client(StandInClient()).chat.completions.create(model="gpt-4o", messages=MESSAGES, temperature=0.7, timeout=30))
+    replayed = Cassette(path).client(None).chat.completions.create(model="gpt-4o", messages=MESSAGES, temperature=0.7)
+    assert reply(replayed) == recorded
+    assert replayed.usage.prompt_tokens > 0
+
+def test_stream_is_replayed_chunk_by_chunk(tmp_path):
+    path = str(tmp_path / "calls.jsonl")
+    stream = Cassette(path, "record").client(StreamingClient()).chat.completions.create(model="gpt-4o", messages=MESSAGES, stream=True)
+    assert [chunk.choices[0].delta.content for chunk in stream] == ["I hear ", "that you ", "feel low."]
+    replayed = Cassette(path).client(None).chat.completions.create(model="gpt-4o", messages=MESSAGES, stream=True)
+    assert [chunk.choices[0].delta.content for chunk in replayed] == ["I hear ", "that you ", "feel low."]
+    # A streamed recording also answers the same request asked for whole
+    assert reply(Cassette(path).client(None).chat.completions.create(model="gpt-4o", messages=MESSAGES)) == "I hear that you feel low."
+
+def test_abandoned_stream_is_not_recorded(tmp_path):
+    tape = Cassette(str(tmp_path / "calls.jsonl"), "record")
+    stream = tape.client(StreamingClient()).chat.completions.create(model="gpt-4o", messages=MESSAGES, stream=True)
+    next(stream)
+    stream.close()
+    assert tape.stats["recorded"] == 0
+    assert not (tmp_path / "calls.jsonl").exists()
+
+def test_same_request_is_replayed_in_turn(tmp_path):
+    path = tmp_path / "calls.jsonl"
+    path.write_text("".join(json.dumps({"key": request_fingerprint("gpt-4o", MESSAGES), "model": "gpt-4o", "hint": "", "streamed": False, "chunks": [text], "offsets_ms": [5], "usage": None}) + "\n" for text in ["first", "second"]), encoding="utf-8")
+    client = Cassette(str(path)).client(None)
+    assert [reply(client.chat.completions.create(model="gpt-4o", messages=MESSAGES)) for _ in range(3)] == ["first", "second", "first"]
+
+def test_unrecorded_request_is_a_miss_in_replay(tmp_path):
+    tape = Cassette(str(tmp_path / "calls.jsonl"))
+    with pytest.raises(CassetteMiss, match="I feel low") as miss:
+        tape.client(None).chat.completions.create(model="gpt-4o", messages=MESSAGES)
+    assert miss.value.status_code == 404
+    assert tape.stats["missed"] == 1
+
+def test_new_mode_records_only_what_is_missing(tmp_path):
+    path = str(tmp_path / "calls.jsonl.gz")
+    inner = StreamingClient()
+    client = Cassette(path, "new").client(inner)
+    for _ in range(2):
+        client.chat.completions.create(model="gpt-4o", messages=MESSAGES)
+    assert inner.calls == 1
+    tape = Cassette(path)
+    assert sum(len(calls) for calls in tape.calls.values()) == 1
+
+def test_unknown_mode_or_pace_is_refused(tmp_path):
+    with pytest.raises(ValueError):
+        Cassette(str(tmp_path / "calls.jsonl"), "rewind")
+    with pytest.raises(ValueError):
+        Cassette(str(tmp_path / "calls.jsonl"), "replay", "slow")
+
+def test_endpoint_replays_without_a_key(tmp_path, monkeypatch):
+    monkeypatch.setenv("MODEL_CASSETTE", str(tmp_path / "calls.jsonl"))
+    client = Endpoint("default").client
+    assert client.inner is None
+    with pytest.raises(CassetteMiss):
+        client.chat.completions.create(model="gpt-4o", messages=MESSAGES)
+
+def test_recorded_evaluation_replays_to_the_same_result(tmp_path):
+    scripts = [{"id": "low-mood", "labels": ["depression"], "turns": ["I feel down and hopeless.", "I lost my job.", "I feel empty most days."]}]
+    path = str(tmp_path / "calls.jsonl")
+    recorded, _ = run_evaluation(Cassette(path, "record").client(StandInClient()), None, scripts)
+    tape = Cassette(path)
+    replayed, _ = run_evaluation(tape.client(None), None, scripts)
+    assert replayed[0]["predicted"] == recorded[0]["predicted"] == ["depression"]
+    assert replayed[0]["error"] is None and replayed[0]["fallbacks"] == 0
+    assert tape.stats["missed"] == 0 and tape.stats["replayed"] == recorded[0]["turns"]
@@ -0,0 +1,61 @@
+import os
+import re
+
+from condition_index import ConditionIndex, get_condition_index, stem
+from content_store import load_content
+from preclassifier import LABELS
+
+CONTENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "content")
+
+# Function to make the regular inflections of a word: plural or third person, past tense and -ing form.
+# Words already inflected (flashbacks, overwhelmed) are their own base
+def inflections(word):
+    if re.search(r"(ed|ing|[^s]s)$", word) or len(word) < 3:
+        return []
+    if re.search(r"[^aeiou]y$", word):
+        return [word[:-1] + "ies", word[:-1] + "ied", word + "ing"]
+    if word.endswith("e"):
+        return [word + "s", word + "d", word[:-1] + "ing"]
+    plural = word + "es" if re.search(r"(s|x|ch|sh)$", word) else word + "s"
+    return [plural, word + "ed", word + "ing"]
+
+# Function to check that every inflection of every word in an index's synonyms resolves like the synonym itself
+def check_inflections(index, phrases):
+    mismatches = []
+    for phrase in phrases:
+        words = re.findall(r"[a-z0-9]+", phrase.lower())
+        expected = index.resolve(phrase)
+        for position, word in enumerate(words):
+            for form in inflections(word):
+                variant = " ".join(words[:position] + [form] + words[position + 1:])
+                if index.resolve(variant) != expected:
+                    mismatches.append((phrase, variant, expected, index.resolve(variant)))
+    assert mismatches == []
+
+def test_inflections_share_a_stem():
+    assert stem("worry") == stem("worrying") == stem("worried") == stem("worries")
+    assert stem("depression") == stem("depressed") == stem("depressive")
+    assert stem("panic") == stem("panicking") == stem("panicked") == stem("panicky")
+    assert stem("nightmare") == stem("nightmares")
+    assert stem("stress") == stem("stresses") == stem("stressed")
+
+def test_worry_resolves_in_every_form():
+    index = get_condition_index(load_content(CONTENT_DIR).instruments)
+    for form in ["worry", "worrying", "worried", "worries"]:
+        assert index.resolve(form) == ("DASS-21",)
+
+def test_instrument_synonyms_resolve_in_every_form():
+    instruments = load_content(CONTENT_DIR).instruments
+    index = get_condition_index(instruments)
+    check_inflections(index, [phrase for data in instruments.values() for phrase in data["conditions"]])
+
+def test_classifier_labels_resolve_in_every_form():
+    index = ConditionIndex({label: {"conditions": phrases} for label, phrases in LABELS.items()})
+    check_inflections(index, [phrase for phrases in LABELS.values() for phrase in phrases])
+
+def test_longest_phrase_wins():
+    index = get_condition_index(load_content(CONTENT_DIR).instruments)
+    assert index.resolve("post-traumatic stress disorder") == ("PCL-5",)
+    assert index.resolve("work stress") == ("DASS-21",)
+    assert index.resolve_all(["stress", "ptsd", "anxiety"]) == ["DASS-21", "PCL-5"]
+    assert index.resolve("insomnia") == ()
@@ -0,0 +1,68 @@
+import os
+import shutil
+
+import pytest
+
+import content_store
+from content_store import ContentError, ContentStore, load_content, session_content
+from engine import Session
+
+CONTENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "content")
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    directory = tmp_path / "content"
+    shutil.copytree(CONTENT_DIR, directory)
+    store = ContentStore(str(directory), poll_seconds=0)
+    monkeypatch.setattr(content_store, "_store", store)
+    return store
+
+# Function to change the screening prompt and reload, giving a new version
+def edit_prompt(store, text):
+    path = f"{store.directory}/prompts/screening_system.txt"
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(text)
+    assert store.reload()
+    return store.current
+
+def test_band_tables_stay_on_the_version():
+    content = load_content(CONTENT_DIR)
+    assert all("band_tables" not in data for data in content.instruments.values())
+    assert content.band_tables["DASS-21"]["depression"][0][:2] == (0, 9)
+
+def test_session_keeps_its_version_after_a_reload(store):
+    session = Session()
+    first = session_content(session)
+    second = edit_prompt(store, "\nEdited.")
+    assert second.version != first.version
+    assert session_content(session) is first
+    assert session_content(Session()) is second
+
+def test_versions_in_use_are_kept_past_the_limit(store, monkeypatch):
+    monkeypatch.setattr(content_store, "MAX_VERSIONS", 2)
+    session = Session()
+    first = session_content(session)
+    for number in range(3):
+        edit_prompt(store, f"\nEdit {number}.")
+    assert len(store.versions) == 4
+    assert session_content(session) is first
+
+def test_idle_versions_are_dropped_past_the_limit(store, monkeypatch):
+    monkeypatch.setattr(content_store, "MAX_VERSIONS", 2)
+    session = Session()
+    first = session_content(session)
+    first.last_used = 0
+    edit_prompt(store, "\nEdit 1.")
+    edit_prompt(store, "\nEdit 2.")
+    assert first.version not in store.versions
+    assert len(store.versions) == 2
+    with pytest.raises(ContentError):
+        session_content(session)
+
+def test_broken_content_keeps_the_last_good_version(store):
+    current = store.current
+    with open(f"{store.directory}/prompts/screening_wrap_up.txt", "w", encoding="utf-8") as f:
+        f.write("No placeholder")
+    assert not store.reload()
+    assert store.current is current
+    assert "{conditions}" in store.last_error
@@ -0,0 +1,56 @@
+import pytest
+
+import engine
+
+@pytest.fixture(autouse=True)
+def scratch(tmp_path, monkeypatch):
+    monkeypatch.setenv("FALLBACK_LOG", str(tmp_path / "fallback_log.jsonl"))
+    monkeypatch.setenv("REPORT_CACHE_DIR", str(tmp_path / "report_cache"))
+    monkeypatch.setenv("CAPTURE_TRANSCRIPTS", "0")
+    monkeypatch.setenv("ANALYTICS", "0")
+
+# Function to start a session on a questionnaire, as the screening does once it is complete
+def start_questionnaire(name):
+    session = engine.Session()
+    session.chat_state = "assessment"
+    session.current_assessment = name
+    return session
+
+# Function to answer every item the questionnaire asks with the same option; returns the items asked
+def answer_all(session, option):
+    asked = []
+    while (question := engine.current_question(session)) is not None and question["assessment"] == session.current_assessment:
+        asked.append(question["number"])
+        engine.answer_item(session, option)
+    return asked
+
+def test_adaptive_questionnaire_stops_once_the_band_is_settled(monkeypatch):
+    monkeypatch.setenv("ADAPTIVE_ASSESSMENTS", "PCL-5")
+    session = start_questionnaire("PCL-5")
+    # Eight answers of 4 reach the probable PTSD threshold of 32
+    assert answer_all(session, 4) == list(range(1, 9))
+    result = session.diagnosis["assessment_results"]["PCL-5"]
+    assert result["interpretation"].startswith("Probable PTSD")
+    assert result["administration"]["mode"] == "adaptive"
+    assert result["administration"]["score_ranges"]["total"] == [32, 80]
+    assert result["administration"]["items_skipped"] == list(range(9, 21))
+
+def test_adaptive_questionnaire_stops_once_the_threshold_is_out_of_reach(monkeypatch):
+    monkeypatch.setenv("ADAPTIVE_ASSESSMENTS", "PCL-5")
+    session = start_questionnaire("PCL-5")
+    # After 13 answers of 0 the seven left can add at most 28
+    assert len(answer_all(session, 0)) == 13
+    assert session.diagnosis["assessment_results"]["PCL-5"]["interpretation"] == "Below threshold for PTSD"
+
+def test_full_questionnaire_asks_every_item(monkeypatch):
+    monkeypatch.setenv("ADAPTIVE_ASSESSMENTS", "")
+    session = start_questionnaire("PCL-5")
+    assert len(answer_all(session, 4)) == 20
+    result = session.diagnosis["assessment_results"]["PCL-5"]
+    assert result["score"] == 80 and result["administration"]["mode"] == "full"
+
+def test_answer_outside_the_options_is_refused():
+    session = start_questionnaire("PCL-5")
+    with pytest.raises(ValueError):
+        engine.answer_item(session, 5)
+    assert engine.current_question(session)["number"] == 1
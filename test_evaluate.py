@@ -0,0 +1,84 @@
+import pytest
+
+import model_router
+from content_store import get_content_store
+from evaluate import StandInClient, condition_key, percentile, run_evaluation, summarize
+
+SCRIPTS = [
+    {"id": "low-mood", "labels": ["depression"], "turns": ["I feel down and hopeless.", "I lost my job.", "I feel empty most days."]},
+    {"id": "crisis", "labels": [], "crisis": True, "turns": ["I want to die."]}
+]
+
+@pytest.fixture(autouse=True)
+def scratch(tmp_path, monkeypatch):
+    monkeypatch.setenv("FALLBACK_LOG", str(tmp_path / "fallback_log.jsonl"))
+    monkeypatch.setenv("REPORT_CACHE_DIR", str(tmp_path / "report_cache"))
+    monkeypatch.setenv("CAPTURE_TRANSCRIPTS", "0")
+    monkeypatch.setenv("ANALYTICS", "0")
+    # Failures in one test must not leave a model's circuit open for the next
+    monkeypatch.setattr(model_router, "_circuits", {})
+
+# Chat client that fails every call, as an unreachable upstream would
+class DownClient:
+    def __init__(self):
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        raise ConnectionError("upstream unreachable")
+
+# Chat client that answers like the stand-in and keeps the system prompts it was sent
+class PromptRecordingClient(StandInClient):
+    def __init__(self):
+        super().__init__()
+        self.system_prompts = []
+        create = self.chat.completions.create
+
+        def record(model, messages, **kwargs):
+            self.system_prompts.append(messages[0]["content"])
+            return create(model=model, messages=messages, **kwargs)
+
+        self.chat.completions.create = record
+
+def test_condition_names_resolve_through_the_index():
+    instruments = get_content_store().current.instruments
+    assert condition_key("anxiety disorder", instruments) == condition_key("anxiety", instruments)
+    assert condition_key("Major depressive disorder", instruments) == condition_key("depression", instruments)
+    assert condition_key("post-traumatic stress disorder", instruments) == condition_key("ptsd", instruments)
+    assert condition_key("post-traumatic stress", instruments) != condition_key("stress", instruments)
+    assert condition_key("normal", instruments) == (("", "normal"),)
+
+def test_summary_counts_synonyms_as_matches():
+    session = {"expects_crisis": False, "completed": True, "predicted": ["Generalised anxiety disorder", "work stress"], "labels": ["anxiety", "stress"],
+               "turns": 3, "latencies": [0.1], "turn_latencies": [0.1], "prompt_tokens": 10, "completion_tokens": 5, "fallbacks": 0, "session_latency": 0.3, "error": None}
+    summary = summarize([session], 1.0)
+    assert summary["exact_match_accuracy"] == 1.0
+    assert summary["f1"] == 1.0
+
+def test_percentile_uses_nearest_rank():
+    assert percentile([], 50) is None
+    assert percentile([1, 2, 3, 4], 50) == 2
+    assert percentile([1, 2, 3, 4], 95) == 4
+    assert percentile([5], 1) == 5
+
+def test_scripts_are_replayed_through_the_engine():
+    sessions, summary = run_evaluation(StandInClient(), None, SCRIPTS, concurrency=2)
+    screened = sessions[0]
+    assert screened["completed"] and screened["predicted"] == ["depression"]
+    assert screened["turns"] == 3
+    assert screened["prompt_tokens"] > 0 and len(screened["latencies"]) == 3
+    assert sessions[1]["crisis_detected"]
+    assert summary["top1_accuracy"] == 1.0
+    assert summary["crisis_detection_rate"] == 1.0
+
+def test_edited_prompt_reaches_the_model():
+    client = PromptRecordingClient()
+    run_evaluation(client, None, SCRIPTS[:1], system_prompt="Edited screening prompt for the test.")
+    assert client.system_prompts and all(prompt.startswith("Edited screening prompt for the test.") for prompt in client.system_prompts)
+
+def test_outage_is_answered_by_the_local_fallback():
+    sessions, summary = run_evaluation(DownClient(), None, SCRIPTS[:1])
+    assert sessions[0]["error"] is None
+    assert sessions[0]["fallbacks"] == 3
+    assert summary["fallback_replies"] == 3
+    assert not sessions[0]["completed"]
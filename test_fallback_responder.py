@@ -0,0 +1,50 @@
+import json
+
+from fallback_responder import GENERIC_QUESTIONS, FallbackResponder, example_turns
+
+TURNS = [
+    {"context": "I can't sleep at night", "response": "How many hours of sleep are you getting?", "source": "test", "crisis": False},
+    {"context": "I want to end my life", "response": "Are you safe right now?", "source": "test", "crisis": True}
+]
+
+INSTRUMENTS = {
+    "DASS-21": {"conditions": ["depression", "stress", "worry"]},
+    "PCL-5": {"conditions": ["ptsd", "post traumatic stress"]}
+}
+
+# Function to play a conversation where every patient message is the same, collecting the fallback's replies
+def replies(responder, patient_message, count):
+    messages, answers = [], []
+    for _ in range(count):
+        messages.append({"role": "user", "content": patient_message})
+        text, _ = responder.respond(messages)
+        answers.append(text)
+        messages.append({"role": "assistant", "content": text})
+    return answers
+
+def test_closest_stored_question_is_asked_once():
+    responder = FallbackResponder(TURNS, INSTRUMENTS)
+    answers = replies(responder, "I can't sleep", 2)
+    assert answers[0] == "How many hours of sleep are you getting?"
+    assert answers[1] == GENERIC_QUESTIONS[0]
+
+def test_general_questions_rotate_then_the_screening_wraps_up():
+    responder = FallbackResponder(TURNS, INSTRUMENTS)
+    answers = replies(responder, "I keep having flashbacks and post-traumatic stress", len(GENERIC_QUESTIONS) + 1)
+    assert answers[:-1] == GENERIC_QUESTIONS
+    result = json.loads(answers[-1])
+    assert result["screening_complete"]
+    assert result["possible_conditions"] == ["post traumatic stress"]
+
+def test_wrap_up_without_named_conditions_covers_every_instrument():
+    responder = FallbackResponder([], INSTRUMENTS)
+    answers = replies(responder, "Things are hard", len(GENERIC_QUESTIONS) + 1)
+    assert json.loads(answers[-1])["possible_conditions"] == ["depression", "ptsd"]
+
+def test_crisis_gets_safety_question_even_when_repeated():
+    responder = FallbackResponder(TURNS, INSTRUMENTS)
+    assert replies(responder, "I want to end my life", 3) == ["Are you safe right now?"] * 3
+
+def test_examples_are_read_from_the_screening_prompt():
+    prompt = 'Example 1:\nUser: "I feel sad all the time."\nAssistant: "How long have you felt this way?"\nRemember: be kind.'
+    assert example_turns(prompt) == [{"context": "I feel sad all the time.", "response": "How long have you felt this way?", "source": "screening prompt", "crisis": False}]
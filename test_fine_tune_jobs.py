@@ -0,0 +1,142 @@
+import asyncio
+import json
+
+import pytest
+
+import fine_tune_jobs
+from fine_tune_jobs import FineTuneOrchestrator, ModelRegistry, RunState, StandInFineTuningClient, job_key, sweep_grid, validate_training_file
+
+CONVERSATION = {"messages": [{"role": "system", "content": "Screen gently."}, {"role": "user", "content": "I feel low."}, {"role": "assistant", "content": "I'm sorry to hear that."}]}
+
+@pytest.fixture(autouse=True)
+def quick_backoff(monkeypatch):
+    # Retries wait seconds between attempts; the tests only need them to happen
+    sleep = asyncio.sleep
+
+    async def no_wait(delay, *args):
+        await sleep(0)
+
+    monkeypatch.setattr(fine_tune_jobs.asyncio, "sleep", no_wait)
+
+def write_shard(path, count=2):
+    path.write_text("".join(json.dumps(CONVERSATION) + "\n" for _ in range(count)), encoding="utf-8")
+    return str(path)
+
+def make_run(tmp_path, shards=1, grid=None, **stand_in):
+    training = [write_shard(tmp_path / f"shard-{i + 1}.jsonl") for i in range(shards)]
+    state = RunState.create(str(tmp_path / "run"), "local", "gpt-4o", training, None, grid or sweep_grid([1], [1], [0.1]))
+    client = StandInFineTuningClient(str(tmp_path / "run" / "stand_in.json"), step_seconds=0.01, latency=0, seed=1, **stand_in)
+    registry = ModelRegistry(str(tmp_path / "models.json"))
+    orchestrator = FineTuneOrchestrator(client, state, registry, poll_start=0.01, poll_max=0.02, log=lambda message: None)
+    return state, client, registry, orchestrator
+
+def test_training_file_is_checked(tmp_path):
+    assert validate_training_file(write_shard(tmp_path / "good.jsonl", 3)) == 3
+    bad = tmp_path / "bad.jsonl"
+    bad.write_text(json.dumps(CONVERSATION) + "\n" + json.dumps({"messages": [{"role": "user"}]}) + "\n", encoding="utf-8")
+    with pytest.raises(ValueError, match="line 2"):
+        validate_training_file(str(bad))
+    empty = tmp_path / "empty.jsonl"
+    empty.write_text("\n", encoding="utf-8")
+    with pytest.raises(ValueError, match="no conversations"):
+        validate_training_file(str(empty))
+
+def test_sweep_lists_every_combination():
+    grid = sweep_grid([2, 3], [1], [0.05, 0.1])
+    assert len(grid) == 4
+    assert job_key("data/shard-1.jsonl", grid[0]) == "shard-1-e2-b1-lr0.05"
+
+def test_run_cannot_be_created_twice(tmp_path):
+    make_run(tmp_path)
+    with pytest.raises(ValueError, match="already has a run"):
+        RunState.create(str(tmp_path / "run"), "local", "gpt-4o", [str(tmp_path / "shard-1.jsonl")], None, sweep_grid([1], [1], [0.1]))
+
+def test_sweep_runs_every_job_and_registers_the_models(tmp_path):
+    state, client, registry, orchestrator = make_run(tmp_path, shards=2, grid=sweep_grid([1, 2], [1], [0.1]))
+    assert asyncio.run(orchestrator.run()) == {"succeeded": 4}
+    models = registry.pending_evaluation()
+    assert sorted(model["model"] for model in models) == sorted(job["fine_tuned_model"] for job in state.data["jobs"].values())
+    assert {model["run"] for model in models} == {"run"}
+    job = state.data["jobs"]["shard-2-e2-b1-lr0.1"]
+    assert job["history"][-1]["status"] == "succeeded" and job["trained_tokens"] == 2000
+    # The state on disk is what a resumed run starts from
+    assert RunState.load(str(tmp_path / "run")).counts() == {"succeeded": 4}
+
+def test_jobs_run_side_by_side_up_to_the_limit(tmp_path):
+    state, client, registry, orchestrator = make_run(tmp_path, grid=sweep_grid([1, 2], [1, 2], [0.1]))
+    orchestrator.max_jobs = 2
+    create = client.fine_tuning.jobs.create
+    retrieve = client.fine_tuning.jobs.retrieve
+    active = set()
+    peak = []
+
+    def tracked_create(**request):
+        job = create(**request)
+        active.add(job.id)
+        peak.append(len(active))
+        return job
+
+    def tracked_retrieve(job_id):
+        job = retrieve(job_id)
+        if job.status in fine_tune_jobs.TERMINAL_STATUSES:
+            active.discard(job_id)
+        return job
+
+    client.fine_tuning.jobs.create = tracked_create
+    client.fine_tuning.jobs.retrieve = tracked_retrieve
+    assert asyncio.run(orchestrator.run()) == {"succeeded": 4}
+    assert max(peak) == 2
+
+def test_failed_training_is_recorded_and_not_registered(tmp_path):
+    state, client, registry, orchestrator = make_run(tmp_path, fail_rate=1.0)
+    assert asyncio.run(orchestrator.run()) == {"failed": 1}
+    assert next(iter(state.data["jobs"].values()))["error"] == "Stand-in training failure"
+    assert registry.load() == []
+
+def test_rate_limited_calls_are_retried(tmp_path):
+    state, client, registry, orchestrator = make_run(tmp_path, shards=2, error_rate=0.3)
+    assert asyncio.run(orchestrator.run()) == {"succeeded": 2}
+
+def test_refused_request_is_not_retried(tmp_path):
+    state, client, registry, orchestrator = make_run(tmp_path)
+    calls = []
+
+    def refuse(**request):
+        calls.append(request)
+        error = RuntimeError("invalid hyperparameters")
+        error.status_code = 400
+        raise error
+
+    client.fine_tuning.jobs.create = refuse
+    assert asyncio.run(orchestrator.run()) == {"failed": 1}
+    assert len(calls) == 1
+
+def test_resume_picks_up_a_job_created_before_the_stop(tmp_path):
+    state, client, registry, orchestrator = make_run(tmp_path)
+    path = next(iter(state.data["files"]))
+    with open(path, "rb") as f:
+        file_id = client.files.create(file=f, purpose="fine-tune").id
+    job = next(iter(state.data["jobs"].values()))
+    created = client.fine_tuning.jobs.create(training_file=file_id, model="gpt-4o", hyperparameters=job["hyperparameters"])
+    # As if the run stopped after asking for the job but before recording its ID
+    state.data["files"][path].update(file_id=file_id, status="uploaded")
+    job["status"] = "creating"
+    state.save()
+    assert asyncio.run(orchestrator.run()) == {"succeeded": 1}
+    assert job["job_id"] == created.id
+    assert len(client.fine_tuning.jobs.list().data) == 1
+
+def test_changed_shard_is_not_uploaded(tmp_path):
+    state, client, registry, orchestrator = make_run(tmp_path)
+    write_shard(tmp_path / "shard-1.jsonl", 5)
+    assert asyncio.run(orchestrator.run()) == {"failed": 1}
+    assert next(iter(state.data["jobs"].values()))["error"] == "training file was not uploaded"
+
+def test_registry_keeps_one_entry_per_model(tmp_path):
+    registry = ModelRegistry(str(tmp_path / "models.json"))
+    assert registry.register("ft:gpt-4o:a", run="r1")
+    assert not registry.register("ft:gpt-4o:a", run="r2")
+    registry.register("ft:gpt-4o:b")
+    registry.record_evaluation("ft:gpt-4o:a", "sweep", {"f1": 0.8})
+    assert [entry["model"] for entry in registry.pending_evaluation()] == ["ft:gpt-4o:b"]
+    assert registry.load()[0]["evaluation"]["summary"] == {"f1": 0.8}
@@ -0,0 +1,83 @@
+import copy
+
+import pytest
+
+import engine
+from content_store import ContentError, ContentVersion, get_content_store, validate_instrument, validate_shared_items
+from item_planner import ItemLinks, next_open_index, plan_items
+
+# A made-up link for the tests: PCL-5 item 1 answered from DASS-21 item 3 (DASS-21 scores 0-3, PCL-5 scores 0-4)
+LINK = {"item": 0, "from": "DASS-21", "from_item": 2, "score_map": [0, 1, 3, 4], "source": "Test mapping, not a validated one"}
+
+@pytest.fixture(autouse=True)
+def scratch(tmp_path, monkeypatch):
+    monkeypatch.setenv("FALLBACK_LOG", str(tmp_path / "fallback_log.jsonl"))
+    monkeypatch.setenv("REPORT_CACHE_DIR", str(tmp_path / "report_cache"))
+    monkeypatch.setenv("CAPTURE_TRANSCRIPTS", "0")
+    monkeypatch.setenv("ANALYTICS", "0")
+
+@pytest.fixture
+def linked():
+    instruments = copy.deepcopy(get_content_store().current.instruments)
+    instruments["PCL-5"]["shared_items"] = [dict(LINK)]
+    return instruments
+
+def test_answer_carries_through_the_score_map(linked):
+    links = ItemLinks(linked)
+    assert links
+    assert links.carried("DASS-21", 2, 2) == [("PCL-5", 0, 3)]
+    assert links.carried("DASS-21", 3, 2) == []
+    assert not ItemLinks(get_content_store().current.instruments)
+
+def test_next_open_item_skips_answered_ones():
+    assert next_open_index([1, None, 2, None]) == 1
+    assert next_open_index([1, None, 2, None], 2) == 3
+    assert next_open_index([1, 2]) == 2
+
+def test_plan_carries_only_from_questionnaires_earlier_in_the_queue(linked):
+    links = ItemLinks(linked)
+    plan = plan_items(linked, ["DASS-21", "PCL-5"], links)
+    assert plan["carried"] == [("PCL-5", 0, "DASS-21", 2)]
+    assert len(plan["asked"]) == 21 + 20 - 1
+    assert plan_items(linked, ["PCL-5", "DASS-21"], links)["carried"] == []
+
+@pytest.mark.parametrize("change, message", [
+    ({"source": " "}, "must cite"),
+    ({"item": 20}, "is not one of its items"),
+    ({"score_map": [0, 1, 3, 5]}, "not among its scores"),
+])
+def test_bad_link_is_refused(linked, change, message):
+    linked["PCL-5"]["shared_items"][0].update(change)
+    with pytest.raises(ContentError, match=message):
+        validate_instrument("PCL-5", linked["PCL-5"])
+
+@pytest.mark.parametrize("change, message", [
+    ({"from": "PHQ-9"}, "unknown questionnaire"),
+    ({"from_item": 21}, "missing DASS-21 item"),
+    ({"score_map": [0, 1, 3]}, "needs a score for each DASS-21 score"),
+])
+def test_link_to_a_missing_item_is_refused(linked, change, message):
+    linked["PCL-5"]["shared_items"][0].update(change)
+    with pytest.raises(ContentError, match=message):
+        validate_shared_items(linked)
+
+def test_carried_item_is_not_asked_again(linked, monkeypatch):
+    monkeypatch.setenv("ADAPTIVE_ASSESSMENTS", "")
+    current = get_content_store().current
+    content = ContentVersion("test-shared-items", current.prompts, current.welcome_messages, linked, current.knowledge)
+    monkeypatch.setitem(get_content_store().versions, content.version, content)
+    session = engine.Session()
+    session.content_version = content.version
+    session.diagnosis["possible_conditions"] = ["depression", "PTSD"]
+    session.chat_state = "assessment"
+    session.current_assessment = "DASS-21"
+    while session.current_assessment == "DASS-21":
+        engine.answer_item(session, 2)
+    assert session.assessment_responses["PCL-5"][0] == 3
+    assert "1 of its questions was already answered" in session.messages[-1]["content"]
+    assert engine.current_question(session)["number"] == 2
+    while session.chat_state == "assessment":
+        engine.answer_item(session, 0)
+    result = session.diagnosis["assessment_results"]["PCL-5"]
+    assert result["score"] == 3
+    assert result["administration"]["items_carried"] == [1]
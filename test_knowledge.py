@@ -0,0 +1,77 @@
+import pytest
+
+import knowledge
+from content_store import ContentVersion, get_content_store, using_content
+from engine import build_follow_up_context
+from knowledge import format_passages, get_knowledge_base, search_report, split_sections
+
+REPORT = """# Summary
+Your answers suggest moderate anxiety and normal depression scores.
+
+## Anxiety
+Moderate anxiety: worry, a racing heart and trouble relaxing were reported most days.
+
+## Sleep
+You mentioned waking early and not being able to get back to sleep.
+"""
+
+@pytest.fixture(autouse=True)
+def scratch(tmp_path, monkeypatch):
+    monkeypatch.setenv("FALLBACK_LOG", str(tmp_path / "fallback_log.jsonl"))
+    monkeypatch.setenv("REPORT_CACHE_DIR", str(tmp_path / "report_cache"))
+    monkeypatch.setenv("CAPTURE_TRANSCRIPTS", "0")
+    monkeypatch.setenv("ANALYTICS", "0")
+    # Each test builds its own knowledge base rather than reusing another test's
+    monkeypatch.setattr(knowledge, "_knowledge", None)
+    monkeypatch.setattr(knowledge, "_knowledge_version", None)
+
+def test_markdown_is_split_at_headings():
+    passages = split_sections("Intro line\n# Title\n## First\nOne\ntwo\n## Empty\n\n## Last\nThree", "notes.md")
+    assert passages == [
+        {"title": "", "text": "Intro line", "source": "notes.md"},
+        {"title": "First", "text": "One\ntwo", "source": "notes.md"},
+        {"title": "Last", "text": "Three", "source": "notes.md"}
+    ]
+
+def test_question_finds_the_matching_reference_section():
+    passages = get_knowledge_base().search("How can I sleep better at night?")
+    assert passages[0]["title"] == "Sleep"
+    assert passages[0]["source"] == "self_care.md"
+    assert len(passages) <= knowledge.KNOWLEDGE_PASSAGES
+    assert [passage["score"] for passage in passages] == sorted((passage["score"] for passage in passages), reverse=True)
+
+def test_questionnaires_and_advice_are_searchable():
+    titles = [passage["title"] for passage in get_knowledge_base().search("PCL-5 total score result bands", k=10)]
+    assert "PCL-5 scoring" in titles
+    titles = [passage["title"] for passage in get_knowledge_base().search("severe stress advice", k=10)]
+    assert "DASS-21 stress: Severe" in titles
+
+def test_knowledge_base_follows_the_active_content_version():
+    current = get_content_store().current
+    edited = ContentVersion("test-knowledge", current.prompts, current.welcome_messages, current.instruments, {"pets.md": "# Pets\nA dog or cat can be good company."})
+    default = get_knowledge_base()
+    assert default is get_knowledge_base()
+    with using_content(edited):
+        passages = get_knowledge_base().search("Could a dog help me?")
+        assert passages[0]["source"] == "pets.md"
+    assert get_knowledge_base().search("Could a dog help me?")[0]["source"] != "pets.md"
+
+def test_report_sections_are_matched_to_the_question():
+    sections = search_report(REPORT, "Is the racing heart part of my anxiety?")
+    assert sections[0]["title"] == "Anxiety"
+    assert len(sections) <= knowledge.REPORT_PASSAGES
+
+def test_report_without_headings_is_split_into_paragraphs():
+    report = "You reported low mood most days.\n\nSleep has been broken and short.\n\nWork stress is high."
+    sections = search_report(report, "What about my sleep?")
+    assert sections[0] == {"title": "", "text": "Sleep has been broken and short.", "source": "report", "score": sections[0]["score"]}
+
+def test_passages_are_numbered_for_the_prompt():
+    text = format_passages([{"title": "Sleep", "text": "Keep regular hours."}, {"title": "", "text": "Untitled part."}])
+    assert text == "[1] Sleep\nKeep regular hours.\n\n[2] Untitled part."
+
+def test_follow_up_context_holds_results_report_parts_and_reference_material():
+    context = build_follow_up_context({"assessment_results": {}, "possible_conditions": ["anxiety"]}, "a" * 64, REPORT, "How can I sleep better?")
+    assert f"(ID {'a' * 12})" in context
+    assert "waking early" in context
+    assert "Reference material" in context and "Going to bed and getting up" in context
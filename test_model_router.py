@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+import model_router
+from model_router import CIRCUIT_FAILURE_THRESHOLD, CircuitOpenError, circuit_open, load_model_config, record_latency, record_outcome, route
+
+CONFIG = {
+    "models": {"small": {"context_window": 1000}, "large": {"context_window": 200000}},
+    "agents": {
+        "screening": {"models": [{"model": "small", "max_prompt_tokens": 200}, "large"], "max_tokens": 100, "latency_budget_ms": 500},
+        "report": {"models": ["small"], "max_tokens": 2000}
+    }
+}
+
+@pytest.fixture(autouse=True)
+def config(tmp_path, monkeypatch):
+    path = tmp_path / "model_config.json"
+    path.write_text(json.dumps(CONFIG), encoding="utf-8")
+    monkeypatch.setenv("MODEL_CONFIG", str(path))
+    monkeypatch.setattr(model_router, "_config", None)
+    monkeypatch.setattr(model_router, "_latencies", {})
+    monkeypatch.setattr(model_router, "_circuits", {})
+
+def messages(words):
+    return [{"role": "user", "content": " ".join(["word"] * words)}]
+
+def test_config_file_overrides_the_defaults():
+    config = load_model_config()
+    assert config["agents"]["screening"]["latency_budget_ms"] == 500
+    # Agents not in the file keep the built-in settings
+    assert config["agents"]["follow_up"]["models"] == ["gpt-3.5-turbo"]
+
+def test_first_candidate_that_fits_is_used():
+    assert route("screening", messages(10))["model"] == "small"
+    # Too long for the small model's prompt limit, so the large one is the first that fits
+    assert route("screening", messages(400))["model"] == "large"
+
+def test_nothing_fits_uses_the_largest_context_window():
+    # 2000 completion tokens never fit the small model's window
+    assert route("report", messages(10))["model"] == "large"
+
+def test_slow_model_is_passed_over_until_every_candidate_is_slow():
+    for _ in range(model_router.MIN_LATENCY_SAMPLES):
+        record_latency("small", 2.0)
+    decision = route("screening", messages(10))
+    assert decision["model"] == "large" and decision["reason"] == "fallback"
+    for _ in range(model_router.MIN_LATENCY_SAMPLES):
+        record_latency("large", 1.0)
+    decision = route("screening", messages(10))
+    assert decision["model"] == "large" and decision["reason"] == "over_budget"
+
+def test_circuit_opens_after_repeated_failures_and_closes_on_success():
+    for _ in range(CIRCUIT_FAILURE_THRESHOLD):
+        record_outcome("small", False)
+    assert circuit_open("small")
+    assert route("screening", messages(10))["model"] == "large"
+    record_outcome("small", True)
+    assert not circuit_open("small")
+
+def test_every_circuit_open_raises():
+    for model in ["small", "large"]:
+        for _ in range(CIRCUIT_FAILURE_THRESHOLD):
+            record_outcome(model, False)
+    with pytest.raises(CircuitOpenError):
+        route("screening", messages(10))
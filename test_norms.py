@@ -0,0 +1,70 @@
+import pytest
+
+from analytics_store import SegmentWriter
+from engine import format_assessment_results
+from norms import PopulationNorms, ordinal
+
+DAY = 19723
+
+def rows(scores, instrument="DASS-21", subscale="depression", mode="full"):
+    return [(DAY, session, instrument, subscale, "Band", mode, score) for session, score in enumerate(scores)]
+
+@pytest.fixture
+def norms(tmp_path):
+    SegmentWriter(str(tmp_path)).append({"results": rows(range(100)) + rows([5] * 60, "PCL-5", "total")})
+    norms = PopulationNorms(str(tmp_path))
+    norms.refresh()
+    return norms
+
+def test_ordinals():
+    assert [ordinal(number) for number in [1, 2, 3, 4, 11, 12, 13, 21, 22, 42, 100, 111, 112]] == [
+        "1st", "2nd", "3rd", "4th", "11th", "12th", "13th", "21st", "22nd", "42nd", "100th", "111th", "112th"
+    ]
+
+def test_percentile_counts_ties_as_half_below(norms):
+    assert norms.percentile("DASS-21", "depression", 50) == (50.5, 100)
+    assert norms.percentile("DASS-21", "depression", 1000) == (100.0, 100)
+    assert norms.percentile("PCL-5", "total", 5) == (50.0, 60)
+
+def test_no_percentile_below_the_minimum_sample(tmp_path):
+    SegmentWriter(str(tmp_path)).append({"results": rows(range(10))})
+    norms = PopulationNorms(str(tmp_path), min_sample=20)
+    norms.refresh()
+    assert norms.percentile("DASS-21", "depression", 5) is None
+    assert norms.percentile("DASS-21", "anxiety", 5) is None
+
+def test_adaptive_results_do_not_set_the_norms(tmp_path):
+    SegmentWriter(str(tmp_path)).append({"results": rows(range(60)) + rows([0] * 40, mode="adaptive")})
+    norms = PopulationNorms(str(tmp_path))
+    assert norms.refresh() == 60
+    assert norms.percentile("DASS-21", "depression", 30)[1] == 60
+
+def test_refresh_adds_only_new_results(tmp_path):
+    segment = SegmentWriter(str(tmp_path))
+    segment.append({"results": rows(range(50))})
+    norms = PopulationNorms(str(tmp_path))
+    assert norms.refresh() == 50
+    assert norms.refresh() == 0
+    segment.append({"results": rows([49] * 50)})
+    SegmentWriter(str(tmp_path)).append({"results": rows([0] * 20)})
+    assert norms.refresh() == 70
+    assert norms.percentile("DASS-21", "depression", 49) == (pytest.approx(100 * (69 + 51 / 2) / 120), 120)
+
+def test_result_percentiles_skip_open_ranges_and_stay_within_1_99(norms):
+    result = {"scores": {"depression": 0, "anxiety": 3}, "administration": {"score_ranges": {"depression": (0, 0), "anxiety": (2, 6)}}}
+    assert norms.result_percentiles("DASS-21", result) == {"depression": {"percentile": 1, "sample": 100}}
+    open_range = {"scores": {"depression": 40}, "administration": {"score_ranges": {"depression": (38, 44)}}}
+    assert norms.result_percentiles("DASS-21", open_range) == {}
+    assert norms.result_percentiles("DASS-21", {"scores": {"depression": 99}}) == {"depression": {"percentile": 99, "sample": 100}}
+    assert norms.result_percentiles("PCL-5", {"score": 5}) == {"total": {"percentile": 50, "sample": 60}}
+
+def test_summary_gives_quartiles(norms):
+    assert norms.summary()[("DASS-21", "depression")] == {"sample": 100, "p25": 25, "median": 50, "p75": 75}
+
+def test_percentile_appears_beside_the_score_in_the_report_prompt():
+    diagnosis = {
+        "assessment_results": {"PCL-5": {"score": 40, "interpretation": "Probable PTSD - clinical assessment recommended"}},
+        "norms": {"PCL-5": {"total": {"percentile": 82, "sample": 1234}}},
+        "possible_conditions": ["PTSD"]
+    }
+    assert "Score: 40 (82nd percentile of 1,234 patients screened here)" in format_assessment_results(diagnosis)
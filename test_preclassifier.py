@@ -0,0 +1,51 @@
+import json
+
+import preclassifier
+from preclassifier import ConditionClassifier, features, get_preclassifier, load_examples, to_labels
+
+LOW_MOOD = ["I feel hopeless and empty every day", "Nothing makes me happy anymore and I feel worthless", "I cry a lot and feel sad"]
+WORRY = ["I worry all the time about everything", "My heart races and I panic in crowds", "I am nervous and on edge constantly"]
+
+def examples():
+    return [(text, {"depression"}) for text in LOW_MOOD * 2] + [(text, {"anxiety"}) for text in WORRY * 2]
+
+def test_features_are_stemmed_words_and_pairs():
+    assert features("Feeling hopeless") == {"feel", "hopeless", "feel hopeless"}
+
+def test_screening_labels_map_to_classifier_labels():
+    assert to_labels(["Major depressive disorder", "post-traumatic stress", "work stress"]) == {"depression", "ptsd", "stress"}
+    assert to_labels(["insomnia"]) == set()
+
+def test_labels_without_enough_examples_are_not_scored():
+    classifier = ConditionClassifier.train(examples())
+    assert set(classifier.priors) == {"depression", "anxiety"}
+
+def test_confident_labels_need_enough_turns():
+    classifier = ConditionClassifier.train(examples(), threshold=0.9, min_turns=2)
+    assert classifier.confident_labels(["I feel hopeless and worthless"]) == []
+    assert classifier.confident_labels(["I feel hopeless and worthless", "I feel sad and empty"]) == ["depression"]
+    assert classifier.confident_labels(["Hello", "Fine thanks"]) == []
+
+def test_model_round_trips_through_json():
+    classifier = ConditionClassifier.train(examples())
+    loaded = ConditionClassifier(json.loads(json.dumps(classifier.to_dict())))
+    text = "I worry and panic"
+    assert loaded.score(text) == classifier.score(text)
+
+def test_examples_load_from_transcripts_and_scripts(tmp_path):
+    transcripts = tmp_path / "training.jsonl"
+    result = json.dumps({"screening_complete": True, "possible_conditions": ["anxiety"]})
+    transcripts.write_text(json.dumps({"messages": [{"role": "user", "content": "I worry"}, {"role": "assistant", "content": result}]}) + "\n", encoding="utf-8")
+    scripts = tmp_path / "scripts.jsonl"
+    scripts.write_text(json.dumps({"turns": ["I feel low", "and tired"], "labels": ["depression"]}) + "\n", encoding="utf-8")
+    assert load_examples([str(transcripts), str(scripts)]) == [("I worry", {"anxiety"}), ("I feel low and tired", {"depression"})]
+
+def test_no_model_file_leaves_screening_unchanged(tmp_path, monkeypatch):
+    monkeypatch.setenv("PRECLASSIFIER_MODEL", str(tmp_path / "missing.json"))
+    assert get_preclassifier() is None
+    path = tmp_path / "model.json"
+    path.write_text(json.dumps(ConditionClassifier.train(examples()).to_dict()), encoding="utf-8")
+    monkeypatch.setenv("PRECLASSIFIER_MODEL", str(path))
+    monkeypatch.setattr(preclassifier, "_classifier", None)
+    monkeypatch.setattr(preclassifier, "_classifier_key", None)
+    assert set(get_preclassifier().priors) == {"depression", "anxiety"}
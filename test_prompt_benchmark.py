@@ -0,0 +1,83 @@
+import json
+import os
+
+import pytest
+
+import admission
+import model_router
+import norms
+import prompt_benchmark
+import report_store
+import upstream_pool
+from prompt_benchmark import compare, load_sessions, main, measure_calls, run_benchmark
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SESSIONS = os.path.join(HERE, "training_data.jsonl")
+BASELINES = os.path.join(HERE, prompt_benchmark.DEFAULT_BASELINES)
+
+@pytest.fixture(autouse=True)
+def scratch(monkeypatch):
+    # run_benchmark points these at a scratch folder and swaps in its own pool; they are put back afterwards
+    for name in ["REPORT_CACHE_DIR", "ANALYTICS", "ANALYTICS_DIR", "CAPTURE_TRANSCRIPTS", "FALLBACK_LOG", "PRECLASSIFIER_MODEL"]:
+        monkeypatch.setenv(name, os.getenv(name, ""))
+    monkeypatch.setattr(upstream_pool, "_pool", None)
+    # A report store or norms left over from an earlier run would still read that run's folders, and its
+    # admission controller would still hold the per-session quota the earlier replay used up
+    monkeypatch.setattr(report_store, "_store", None)
+    monkeypatch.setattr(norms, "_norms", None)
+    monkeypatch.setattr(admission, "_controller", None)
+    monkeypatch.setattr(model_router, "_circuits", {})
+
+def test_repeated_messages_are_counted():
+    system = {"role": "system", "content": "You are a screening assistant."}
+    user = {"role": "user", "content": "I feel low."}
+    measured = measure_calls([[system, user, dict(user)], [system]])
+    assert measured["calls"] == 2 and measured["messages"] == 4
+    assert measured["repeated"] == 1
+    assert measured["system_tokens"] > 0
+
+def test_steps_are_compared_with_the_tolerance():
+    measured = lambda tokens: {"input_tokens": tokens}
+    results = {"s": [("a", "screening", measured(101)), ("b", "screening", measured(110)), ("c", "report", measured(80)), ("d", "report", measured(5))]}
+    rows = compare(results, {"s": {"a": 100, "b": 100, "c": 100, "e": 50}}, 0.02)
+    assert [(step, status) for _, step, _, _, _, status in rows] == [("a", "ok"), ("b", "over"), ("c", "under"), ("d", "new"), ("e", "missing")]
+
+def test_sessions_are_read_as_patient_turns_with_replies(tmp_path):
+    path = tmp_path / "sessions.jsonl"
+    path.write_text(json.dumps({"messages": [
+        {"role": "system", "content": "prompt"},
+        {"role": "assistant", "content": "Welcome"},
+        {"role": "user", "content": "I feel low."},
+        {"role": "assistant", "content": "How long?"},
+        {"role": "assistant", "content": "Take your time."},
+        {"role": "user", "content": "Months."}
+    ]}) + "\n\n", encoding="utf-8")
+    assert load_sessions(str(path)) == {"conversation-1": [("I feel low.", "How long?\nTake your time."), ("Months.", "")]}
+
+def test_follow_up_prompts_do_not_grow_with_the_conversation():
+    steps = run_benchmark(SESSIONS)["conversation-1"]
+    follow_ups = [measured for step, _, measured in steps if step.startswith("follow-up")]
+    assert len(follow_ups) == len(prompt_benchmark.FOLLOW_UP_QUESTIONS)
+    assert max(measured["input_tokens"] for measured in follow_ups) < 1.2 * min(measured["input_tokens"] for measured in follow_ups)
+
+def test_stored_baselines_pass(capsys):
+    # Exits with 1 if any step is over its baseline or has none
+    main(["--sessions", SESSIONS, "--baselines", BASELINES])
+    assert "report" in capsys.readouterr().out
+
+def test_growth_past_the_baseline_fails(tmp_path, capsys):
+    with open(BASELINES, "r", encoding="utf-8") as f:
+        baselines = json.load(f)
+    baselines["conversation-1"]["report"] = int(baselines["conversation-1"]["report"] * 0.9)
+    path = tmp_path / "baselines.json"
+    path.write_text(json.dumps(baselines), encoding="utf-8")
+    with pytest.raises(SystemExit) as exit_info:
+        main(["--sessions", SESSIONS, "--baselines", str(path)])
+    assert exit_info.value.code == 1
+    assert "--update" in capsys.readouterr().err
+
+def test_update_stores_the_measurements(tmp_path, capsys):
+    path = tmp_path / "baselines.json"
+    main(["--sessions", SESSIONS, "--baselines", str(path), "--update"])
+    with open(BASELINES, "r", encoding="utf-8") as f:
+        assert json.loads(path.read_text(encoding="utf-8")) == json.load(f)
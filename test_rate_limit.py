@@ -0,0 +1,52 @@
+import threading
+import time
+
+from rate_limit import TokenBucket, per_minute
+
+def test_bucket_starts_full_and_refuses_past_its_tokens():
+    bucket = TokenBucket(10, 1)
+    assert bucket.try_acquire(6)
+    assert not bucket.try_acquire(6)
+    assert bucket.try_acquire(4)
+
+def test_tokens_refill_at_the_rate_up_to_the_capacity():
+    bucket = TokenBucket(10, 1000)
+    assert bucket.try_acquire(10)
+    time.sleep(0.005)
+    assert 4 <= bucket.available() <= 10
+    time.sleep(0.02)
+    assert bucket.available() == 10
+
+def test_acquire_waits_for_tokens():
+    bucket = TokenBucket(100, 1000)
+    bucket.try_acquire(100)
+    start = time.monotonic()
+    assert bucket.acquire(50)
+    assert time.monotonic() - start >= 0.04
+
+def test_acquire_gives_up_at_the_timeout():
+    bucket = TokenBucket(100, 1)
+    bucket.try_acquire(100)
+    assert not bucket.acquire(50, timeout=0.02)
+
+def test_request_bigger_than_the_bucket_waits_for_a_full_bucket():
+    bucket = TokenBucket(10, 1000)
+    assert bucket.acquire(1000, timeout=0.1)
+    assert bucket.available() < 1
+
+def test_refund_wakes_a_waiting_caller():
+    bucket = TokenBucket(100, 0.001)
+    bucket.try_acquire(100)
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(bucket.acquire(60, timeout=2)))
+    waiter.start()
+    time.sleep(0.02)
+    bucket.refund(80)
+    waiter.join()
+    assert results == [True]
+
+def test_negative_refund_charges_extra_use():
+    bucket = per_minute(600)
+    assert bucket.capacity == 600 and bucket.rate == 10
+    bucket.refund(-100)
+    assert bucket.available() < 510
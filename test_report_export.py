@@ -0,0 +1,59 @@
+import re
+import zlib
+
+import pytest
+
+from report_export import PDF_MISSING_NOTE, export_key, export_report, parse_blocks, render_html, winansi_text
+
+DIAGNOSIS = {
+    "possible_conditions": ["depression"],
+    "assessment_results": {"PCL-5": {"score": 35, "interpretation": "Probable PTSD"}}
+}
+
+# Function to get the text drawn on the pages of a PDF
+def pdf_text(data):
+    streams = re.findall(rb"stream\n(.*?)\nendstream", data, re.DOTALL)
+    return b"".join(zlib.decompress(stream) for stream in streams).decode("cp1252")
+
+def test_symbols_are_spelled_out_and_accents_folded():
+    assert winansi_text("PCL-5 score ≥ 33 → follow up") == ("PCL-5 score >= 33 -> follow up", False)
+    assert winansi_text("Zoë Gődel, café – “ok”") == ("Zoë Godel, café – “ok”", False)
+
+def test_text_the_fonts_lack_is_marked_once_per_run():
+    assert winansi_text("Name: 陳大文 😊") == ("Name: [?] [?]", True)
+
+def test_pdf_is_produced_for_any_language():
+    data, mime, _ = export_report("# Report\n\nPatient 陳大文 scored ≥ 33 😊", DIAGNOSIS, "pdf")
+    assert mime == "application/pdf" and data.startswith(b"%PDF-")
+    text = pdf_text(data)
+    assert "Patient [?] scored >= 33 [?]" in text
+    assert PDF_MISSING_NOTE in text
+
+def test_pdf_without_missing_text_has_no_note():
+    data, _, _ = export_report("# Report\n\nAll fine (really).", DIAGNOSIS, "pdf")
+    text = pdf_text(data)
+    assert PDF_MISSING_NOTE not in text
+    assert "All fine \\(really\\)." in text
+    assert "PCL-5 - Total: 35 (Probable PTSD)".replace("(", "\\(").replace(")", "\\)") in text
+
+def test_html_keeps_every_character_and_escapes_markup():
+    page = render_html("## Notes\n\n**陳大文** <script> ≥ 33", DIAGNOSIS).decode("utf-8")
+    assert "<strong>陳大文</strong> &lt;script&gt; ≥ 33" in page
+    assert "<td>Probable PTSD</td>" in page
+
+def test_markdown_blocks():
+    assert parse_blocks("# Title\n\nOne\ntwo\n\n- item\n  - nested\n1. first\n---") == [
+        ("heading", 1, "Title"), ("paragraph", 0, "One two"), ("bullet", 0, "item"), ("bullet", 1, "nested"),
+        ("numbered", 0, "1. first"), ("rule", 0, "")
+    ]
+
+def test_exports_are_cached_by_report_and_results():
+    first = export_report("Cached report", DIAGNOSIS, "html")
+    assert export_report("Cached report", DIAGNOSIS, "html") is first
+    changed = dict(DIAGNOSIS, assessment_results={})
+    assert export_key("Cached report", changed, "html") != export_key("Cached report", DIAGNOSIS, "html")
+    assert export_key("Cached report", DIAGNOSIS, "pdf") != export_key("Cached report", DIAGNOSIS, "html")
+
+def test_unknown_format_is_refused():
+    with pytest.raises(ValueError):
+        export_report("Report", DIAGNOSIS, "docx")
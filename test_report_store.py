@@ -0,0 +1,53 @@
+import os
+
+from report_store import ReportStore, report_cache_key
+
+DIAGNOSIS = {
+    "screening_notes": "Low mood for a month",
+    "possible_conditions": ["depression"],
+    "assessment_results": {"DASS-21": {"scores": {"depression": 14}, "interpretations": {"depression": "Moderate"}, "administration": {"mode": "full"}}}
+}
+
+MESSAGES = [{"role": "user", "content": "I feel down"}, {"role": "assistant", "content": "How long for?"}]
+
+def key(diagnosis=DIAGNOSIS, template="Report prompt", messages=MESSAGES, date="October 19, 2026"):
+    return report_cache_key(diagnosis, template, messages, date)
+
+def test_same_inputs_give_the_same_key():
+    reordered = dict(reversed(list(DIAGNOSIS.items())))
+    assert key() == key(reordered)
+    assert len(key()) == 64
+
+def test_administration_details_do_not_change_the_key():
+    adaptive = {"DASS-21": dict(DIAGNOSIS["assessment_results"]["DASS-21"], administration={"mode": "adaptive"})}
+    assert key(dict(DIAGNOSIS, assessment_results=adaptive)) == key()
+
+def test_everything_written_into_the_report_changes_the_key():
+    changed_score = {"DASS-21": {"scores": {"depression": 15}, "interpretations": {"depression": "Moderate"}}}
+    assert key(dict(DIAGNOSIS, assessment_results=changed_score)) != key()
+    assert key(dict(DIAGNOSIS, possible_conditions=["anxiety"])) != key()
+    assert key(dict(DIAGNOSIS, screening_notes="")) != key()
+    assert key(dict(DIAGNOSIS, norms={"DASS-21": {"depression": 80}})) != key()
+    assert key(template="Edited prompt") != key()
+    assert key(messages=MESSAGES[:1]) != key()
+    assert key(date="October 20, 2026") != key()
+
+def test_store_keeps_reports_across_instances(tmp_path):
+    store = ReportStore(str(tmp_path))
+    assert store.get(key()) is None
+    store.put(key(), "# Report")
+    assert ReportStore(str(tmp_path)).get(key()) == "# Report"
+    assert (store.hits, store.misses) == (0, 1)
+
+def test_least_recently_used_reports_are_evicted_past_the_limit(tmp_path):
+    writer = ReportStore(str(tmp_path))
+    writer.put("a", "x" * 10)
+    writer.put("b", "x" * 10)
+    # File times carry the order across restarts: "a" was used longest ago
+    os.utime(tmp_path / "a.md", (1, 1))
+    os.utime(tmp_path / "b.md", (2, 2))
+    store = ReportStore(str(tmp_path), max_bytes=25)
+    store.put("c", "x" * 10)
+    assert not store.contains("a")
+    assert store.contains("b") and store.contains("c")
+    assert store.total_bytes() == 20
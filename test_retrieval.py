@@ -0,0 +1,33 @@
+from retrieval import BM25Index, tokenize
+
+DOCUMENTS = [
+    "Sleep problems are common with low mood. Keeping regular sleep times helps.",
+    "Panic attacks come on quickly and pass within minutes.",
+    "A high score is a reason for a fuller assessment, not a diagnosis.",
+    "Sleep, sleep, sleep: regular sleep matters."
+]
+
+def test_stop_words_are_dropped_and_words_stemmed():
+    assert tokenize("What is my score?") == ["scor"]
+    assert tokenize("The scores I scored") == tokenize("score scoring")
+
+def test_best_match_comes_first():
+    index = BM25Index(DOCUMENTS)
+    assert [document for document, _ in index.search("panic attack")] == [1]
+    assert index.search("sleeping badly", k=1)[0][0] in (0, 3)
+
+def test_unknown_terms_find_nothing():
+    assert BM25Index(DOCUMENTS).search("zebra") == []
+
+def test_allowed_limits_the_documents_searched():
+    index = BM25Index(DOCUMENTS)
+    assert [document for document, _ in index.search("sleep", allowed={0})] == [0]
+
+def test_ties_go_to_the_earlier_document():
+    index = BM25Index(["low mood", "low mood"])
+    assert [document for document, _ in index.search("mood")] == [0, 1]
+
+def test_longer_documents_score_lower_for_the_same_term_count():
+    index = BM25Index(["sleep", "sleep and a great many other words about the day", "unrelated"])
+    scores = dict(index.search("sleep"))
+    assert scores[0] > scores[1]
@@ -0,0 +1,44 @@
+import io
+import json
+
+import pytest
+
+from content_store import get_content_store
+from import_benchmark import CORE_MODULES, measure
+from score import main, score_record
+
+PCL5 = [2] * 20
+
+def test_record_is_scored_with_its_administration():
+    result = score_record(get_content_store().current, "PCL-5", PCL5)
+    assert result["score"] == 40 and result["interpretation"].startswith("Probable PTSD")
+    assert result["administration"]["mode"] == "full"
+    partial = score_record(get_content_store().current, "PCL-5", [None] + PCL5[1:])
+    assert partial["administration"]["mode"] == "adaptive" and partial["administration"]["score_ranges"]["total"] == [38, 42]
+
+def test_unknown_questionnaire_and_bad_scores_are_refused():
+    content = get_content_store().current
+    with pytest.raises(ValueError):
+        score_record(content, "XYZ", PCL5)
+    with pytest.raises(ValueError):
+        score_record(content, "PCL-5", [5] * 20)
+
+def test_command_line_scores_one_set(capsys):
+    main(["PCL-5"] + [str(score) for score in PCL5[:-1]] + ["-"])
+    assert json.loads(capsys.readouterr().out)["score"] == 38
+
+def test_command_line_reads_jsonl_and_reports_bad_lines(capsys, monkeypatch):
+    lines = [json.dumps({"id": 7, "assessment": "PCL-5", "responses": PCL5}), "not json", json.dumps({"assessment": "XYZ", "responses": []})]
+    monkeypatch.setattr("sys.stdin", io.StringIO("\n".join(lines) + "\n"))
+    with pytest.raises(SystemExit) as exit_info:
+        main([])
+    assert exit_info.value.code == 1
+    output = capsys.readouterr()
+    scored = json.loads(output.out)
+    assert scored["id"] == 7 and scored["result"]["score"] == 40
+    assert "Line 2" in output.err and "Line 3" in output.err
+
+def test_core_modules_import_without_heavy_packages():
+    for module in CORE_MODULES:
+        _, heavy = measure(module)
+        assert heavy == [], f"{module} imports {heavy}"
@@ -0,0 +1,67 @@
+import math
+
+import pytest
+
+from scoring import administration_summary, check_responses, compile_bands, format_score, get_band, next_adaptive_index, parse_score_range, score_responses, settled_bands
+
+# Four items scored 0-3 in two subscales of two items each, doubled like DASS-21
+INSTRUMENT = {
+    "questions": ["q1", "q2", "q3", "q4"],
+    "scores": [0, 1, 2, 3],
+    "multiplier": 2,
+    "subscales": {"mood": [0, 1], "worry": [2, 3]},
+    "interpretation": {
+        "mood": {"0-3": "Normal", "4-7": "Mild", "8+": "Severe"},
+        "worry": {"0-5": "Normal", "6+": "Raised"}
+    }
+}
+
+def test_score_ranges_parse():
+    assert parse_score_range("10-13") == (10, 13)
+    assert parse_score_range("34+") == (34, math.inf)
+
+def test_band_lookup_accepts_labels_or_compiled_table():
+    labels = INSTRUMENT["interpretation"]["mood"]
+    assert get_band(labels, 5) == "Mild"
+    assert get_band(compile_bands(labels), 100) == "Severe"
+    assert get_band(compile_bands({"0-3": "Normal"}), 9) == ""
+
+def test_scores_use_the_compiled_tables_passed_in():
+    tables = {"mood": [(0, 100, "Anything")], "worry": compile_bands(INSTRUMENT["interpretation"]["worry"])}
+    result = score_responses(INSTRUMENT, [1, 2, 3, 0], tables)
+    assert result == {"scores": {"mood": 6, "worry": 6}, "interpretations": {"mood": "Anything", "worry": "Raised"}}
+    assert score_responses(INSTRUMENT, [1, 2, 3, 0])["interpretations"] == {"mood": "Mild", "worry": "Raised"}
+
+def test_single_total_score():
+    instrument = {"questions": ["a", "b"], "scores": [0, 1], "interpretation": {"0-1": "Low", "2+": "High"}}
+    assert score_responses(instrument, [1, 1]) == {"score": 2, "interpretation": "High"}
+
+def test_band_settles_once_no_remaining_answer_can_change_it():
+    # worry: 3 + 3 already reaches "Raised" whatever items 1-2 are
+    assert settled_bands(INSTRUMENT, [None, None, 3, 3]) == {"mood": None, "worry": "Raised"}
+    # mood: two answers of 0 pin it at 0 ("Normal")
+    assert settled_bands(INSTRUMENT, [0, 0, None, None]) == {"mood": "Normal", "worry": None}
+
+def test_adaptive_order_skips_items_of_settled_subscales():
+    assert next_adaptive_index(INSTRUMENT, [None] * 4) == 0
+    assert next_adaptive_index(INSTRUMENT, [None, None, 3, 3], start=0) == 0
+    assert next_adaptive_index(INSTRUMENT, [0, 0, None, None], start=2) == 2
+    # 3 on item 3 already puts worry at 6 or more (Raised), so item 4 is not asked; 2 leaves it open
+    assert next_adaptive_index(INSTRUMENT, [0, 0, 3, None], start=3) is None
+    assert next_adaptive_index(INSTRUMENT, [0, 0, 2, None], start=3) == 3
+
+def test_skipped_items_show_the_possible_score_range():
+    responses = [0, 0, 3, None]
+    summary = administration_summary(INSTRUMENT, responses, adaptive=True)
+    assert summary["score_ranges"] == {"mood": [0, 0], "worry": [6, 12]}
+    assert summary["items_skipped"] == [4]
+    result = score_responses(INSTRUMENT, responses)
+    result["administration"] = summary
+    assert format_score(result, "worry") == "6-12"
+    assert format_score(result, "mood") == "0"
+
+def test_bad_responses_are_rejected():
+    check_responses("Test", INSTRUMENT, [0, 1, 2, None])
+    for responses in ([0, 1, 2], [0, 1, 2, 4], [0, 1, 2, True]):
+        with pytest.raises(ValueError):
+            check_responses("Test", INSTRUMENT, responses)
@@ -0,0 +1,102 @@
+import threading
+import time
+
+import pytest
+
+from singleflight import SingleFlight, request_key
+
+# Function to start followers for a key once the leader's call is under way; returns (threads, results)
+def follow(group, key, count, on_token=None):
+    results = []
+
+    def run():
+        try:
+            results.append(group.do(key, lambda publish: "follower ran", on_token, "screening"))
+        except Exception as e:
+            results.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+# Function to wait until every follower has joined the leader's flight
+def wait_for_followers(group, count):
+    while group.snapshot()["coalesced"] < count:
+        time.sleep(0.001)
+
+def test_key_ignores_the_timeout_only():
+    request = {"model": "m", "messages": [{"role": "user", "content": "hi"}], "timeout": 5}
+    assert request_key(request) == request_key(dict(request, timeout=30))
+    assert request_key(request) != request_key(dict(request, model="other"))
+
+def test_concurrent_identical_calls_share_one_upstream_call():
+    group = SingleFlight()
+    state = {}
+
+    def leader_call(publish):
+        threads, results = follow(group, "key", 3)
+        state.update(threads=threads, results=results)
+        wait_for_followers(group, 3)
+        return "answer"
+
+    assert group.do("key", leader_call) == "answer"
+    for thread in state["threads"]:
+        thread.join()
+    assert state["results"] == ["answer"] * 3
+    snapshot = group.snapshot()
+    assert (snapshot["upstream"], snapshot["coalesced"], snapshot["in_flight"]) == (1, 3, 0)
+    assert snapshot["coalesced_by_agent"] == {"screening": 3}
+
+def test_followers_receive_the_streamed_text():
+    group = SingleFlight()
+    received = []
+    leader_tokens = []
+    state = {}
+
+    def leader_call(publish):
+        threads, results = follow(group, "key", 1, received.append)
+        state.update(threads=threads, results=results)
+        wait_for_followers(group, 1)
+        publish("Hel")
+        publish("lo")
+        return "Hello"
+
+    assert group.do("key", leader_call, leader_tokens.append) == "Hello"
+    state["threads"][0].join()
+    assert leader_tokens == ["Hel", "lo"]
+    assert received == ["Hel", "lo"] and state["results"] == ["Hello"]
+
+def test_leader_error_reaches_followers():
+    group = SingleFlight()
+    state = {}
+
+    def leader_call(publish):
+        threads, results = follow(group, "key", 2)
+        state.update(threads=threads, results=results)
+        wait_for_followers(group, 2)
+        raise TimeoutError("upstream timed out")
+
+    with pytest.raises(TimeoutError):
+        group.do("key", leader_call)
+    for thread in state["threads"]:
+        thread.join()
+    assert all(isinstance(result, TimeoutError) for result in state["results"])
+
+def test_finished_calls_are_not_reused():
+    group = SingleFlight()
+    assert group.do("key", lambda publish: "first") == "first"
+    assert group.do("key", lambda publish: "second") == "second"
+
+def test_disabled_group_runs_every_call():
+    group = SingleFlight(enabled=False)
+    calls = []
+
+    def leader_call(publish):
+        calls.append("leader")
+        group.do("key", lambda publish: calls.append("inner"))
+        return "done"
+
+    group.do("key", leader_call)
+    assert calls == ["leader", "inner"]
+    assert group.snapshot()["coalesced"] == 0
@@ -0,0 +1,75 @@
+import gzip
+import json
+
+from transcript_capture import TranscriptWriter, build_training_record, capture_enabled, deidentify_messages, export_training_file, find_names
+
+def conversation(user, assistant):
+    return [{"role": "user", "content": user}, {"role": "assistant", "content": assistant}]
+
+def test_feelings_after_an_introduction_are_not_names():
+    messages = conversation("I am Exhausted all the time. People call me useless", "I hear that you feel exhausted and useless.")
+    assert find_names(messages) == []
+    assert deidentify_messages(messages) == messages
+
+def test_introduced_name_is_removed_where_the_assistant_repeats_it():
+    cleaned = deidentify_messages(conversation("Hi, I'm Jane. I feel low", "Thanks for sharing, Jane. That sounds hard."))
+    assert cleaned[0]["content"] == "Hi, I'm [NAME]. I feel low"
+    assert cleaned[1]["content"] == "Thanks for sharing, [NAME]. That sounds hard."
+
+def test_full_name_and_its_parts_are_removed():
+    messages = conversation("My name is Jane Doe and I can't sleep", "Thank you, Doe family matters too.")
+    assert find_names(messages) == ["Jane Doe", "Jane", "Doe"]
+    assert deidentify_messages(messages)[1]["content"] == "Thank you, [NAME] family matters too."
+
+def test_name_is_replaced_case_sensitively():
+    cleaned = deidentify_messages(conversation("I am Hope. I have no hope left", "Hope, there is still hope."))
+    assert cleaned[0]["content"] == "I am [NAME]. I have no hope left"
+    assert cleaned[1]["content"] == "[NAME], there is still hope."
+
+def test_lowercase_and_common_words_are_not_names():
+    assert find_names(conversation("call me back later. I'm So tired", "ok")) == []
+    assert find_names(conversation("my name is jane", "ok")) == []
+
+def test_addresses_are_removed():
+    cleaned = deidentify_messages(conversation("I live at Flat 3, 22 Nathan Road with my mother", "I see."))
+    assert cleaned[0]["content"] == "I live at [ADDRESS] with my mother"
+    cleaned = deidentify_messages(conversation("Room 1203, 12/F, 8 Queen's Road Central is where I work", "I see."))
+    assert cleaned[0]["content"] == "[ADDRESS] is where I work"
+
+def test_contact_details_are_removed_but_assistant_hotlines_kept():
+    cleaned = deidentify_messages(conversation("Call me Sam, phone 9123 4567, email sam@example.com, born 03/04/1990", "You can call 2389 2222 any time."))
+    assert cleaned[0]["content"] == "Call me [NAME], phone [PHONE], email [EMAIL], born [DATE]"
+    assert cleaned[1]["content"] == "You can call 2389 2222 any time."
+
+def test_training_record_skips_welcome_and_ends_with_result():
+    messages = [{"role": "assistant", "content": "Welcome"}] + conversation("My name is Jane and I feel down", "How long, Jane?")
+    record = build_training_record(messages, {"possible_conditions": ["depression"], "notes": "Jane reports low mood"})
+    roles = [message["role"] for message in record["messages"]]
+    assert roles == ["system", "user", "assistant", "assistant"]
+    assert json.loads(record["messages"][-1]["content"]) == {"screening_complete": True, "possible_conditions": ["depression"], "notes": "[NAME] reports low mood"}
+    assert build_training_record([{"role": "assistant", "content": "Welcome"}], {}) is None
+
+def test_capture_is_off_unless_set(monkeypatch):
+    monkeypatch.delenv("CAPTURE_TRANSCRIPTS", raising=False)
+    assert not capture_enabled()
+    monkeypatch.setenv("CAPTURE_TRANSCRIPTS", "1")
+    assert capture_enabled()
+
+def test_export_replaces_the_output(tmp_path):
+    writer = TranscriptWriter(str(tmp_path / "captured"), flush_interval=0.1)
+    for number in range(3):
+        writer.submit(conversation(f"I feel down {number}", "Tell me more."), {"possible_conditions": []})
+    writer.close()
+    output = tmp_path / "export.jsonl"
+    assert export_training_file(str(output), str(tmp_path / "captured")) == 3
+    assert export_training_file(str(output), str(tmp_path / "captured")) == 3
+    assert len(output.read_text(encoding="utf-8").splitlines()) == 3
+    assert [path.name for path in tmp_path.iterdir() if path.suffix == ".tmp"] == []
+
+def test_writer_output_is_readable_gzip(tmp_path):
+    writer = TranscriptWriter(str(tmp_path), flush_interval=0.1)
+    writer.submit(conversation("I feel down", "Tell me more."), {"possible_conditions": ["depression"]})
+    writer.close()
+    path = next(tmp_path.glob("transcripts-*.jsonl.gz"))
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        assert len(f.readlines()) == 1
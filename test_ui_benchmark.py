@@ -0,0 +1,49 @@
+import json
+import os
+import subprocess
+import sys
+from types import SimpleNamespace
+
+from ui_benchmark import count_elements, percentile, summarize
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# app.py clears the environment of the process it runs in, so the benchmark is run in its own process
+def run_benchmark(*args):
+    return subprocess.run([sys.executable, os.path.join(HERE, "ui_benchmark.py"), "--screening-turns", "2", "--follow-ups", "1", "--mode", "adaptive", *args],
+                          capture_output=True, text=True, timeout=300)
+
+def test_elements_are_counted_through_the_tree():
+    leaf = SimpleNamespace()
+    tree = SimpleNamespace(children={0: leaf, 1: SimpleNamespace(children={0: leaf, 1: leaf})})
+    assert count_elements(tree) == 5
+
+def test_percentile_takes_the_sample_at_the_rank():
+    assert percentile([5, 1, 3, 2, 4], 0.5) == 3
+    assert percentile(list(range(100)), 0.95) == 95
+    assert percentile([7], 0.95) == 7
+
+def test_samples_are_summed_up_by_action():
+    samples = [
+        {"action": "answer", "history": 10, "runs": 1, "ms": 20.0, "elements": 50},
+        {"action": "answer", "history": 12, "runs": 2, "ms": 40.0, "elements": 60},
+        {"action": "report", "history": 14, "runs": 2, "ms": 90.0, "elements": 70}
+    ]
+    summary = summarize(samples)
+    assert list(summary) == ["answer", "report"]
+    assert summary["answer"] == {"count": 2, "history": [10, 12], "runs_max": 2, "p50_ms": 30.0, "p95_ms": 40.0, "max_ms": 40.0, "elements_max": 60}
+
+def test_whole_session_is_driven_through_the_app():
+    # A generous budget: this checks the flow and the script runs per click, not the speed of this machine
+    completed = run_benchmark("--json", "--click-budget-ms", "10000")
+    assert completed.returncode == 0, completed.stderr
+    summary = json.loads(completed.stdout)[0]["summary"]
+    assert list(summary) == ["start", "screening", "answer", "report", "follow_up"]
+    assert summary["answer"]["runs_max"] <= 2
+    # History grows as the questionnaire goes on, so later clicks are timed with a longer conversation
+    assert summary["answer"]["history"][1] > summary["answer"]["history"][0]
+
+def test_click_over_budget_fails():
+    completed = run_benchmark("--click-budget-ms", "0.001")
+    assert completed.returncode == 1
+    assert "answer click p95" in completed.stderr
@@ -0,0 +1,140 @@
+import json
+import time
+from collections import Counter
+
+import pytest
+
+import upstream_pool
+from evaluate import StandInClient
+from upstream_pool import EJECT_AFTER_FAILURES, EJECT_SECONDS, Endpoint, Lease, UpstreamPool, UpstreamUnavailable, load_pool
+
+@pytest.fixture(autouse=True)
+def scratch(monkeypatch):
+    monkeypatch.delenv("MODEL_CASSETTE", raising=False)
+
+# Client whose model listing fails as an unreachable endpoint would, or answers once it is back
+class HealthClient:
+    def __init__(self, up):
+        self.up = up
+        self.models = self
+
+    def list(self):
+        if not self.up:
+            raise ConnectionError("endpoint unreachable")
+        return []
+
+def make_pool(*weights, **kwargs):
+    return UpstreamPool([Endpoint(f"key-{i + 1}", weight=weight, client=StandInClient(), **kwargs) for i, weight in enumerate(weights)], health_check_seconds=0, max_wait_seconds=0.2)
+
+# Function to make `count` calls one after another and count the endpoint each went to
+def spread(pool, count):
+    picked = Counter()
+    for _ in range(count):
+        lease = pool.acquire(10)
+        picked[lease.endpoint.name] += 1
+        lease.release(10)
+    return picked
+
+# Function to report a failed call on an endpoint without making one
+def fail(pool, endpoint):
+    endpoint.outstanding += 1
+    Lease(pool, endpoint, 10).release(failed=True)
+
+def test_calls_are_shared_by_weight():
+    assert spread(make_pool(3, 1), 40) == {"key-1": 30, "key-2": 10}
+    assert spread(make_pool(1, 1, 1), 30) == {"key-1": 10, "key-2": 10, "key-3": 10}
+
+def test_weighted_round_robin_interleaves_rather_than_bursts():
+    pool = make_pool(3, 1)
+    order = []
+    for _ in range(8):
+        lease = pool.acquire(10)
+        order.append(lease.endpoint.name)
+        lease.release(10)
+    assert order == ["key-1", "key-1", "key-2", "key-1"] * 2
+
+def test_endpoint_with_calls_in_flight_gets_fewer_new_ones():
+    pool = make_pool(1, 1)
+    busy = pool.endpoints[0]
+    busy.outstanding = 3
+    picked = spread(pool, 40)
+    # Three calls in flight cut its share to 1 / (3 + 1) of the idle key's
+    assert picked == {"key-1": 8, "key-2": 32}
+
+def test_failing_endpoint_is_ejected_and_skipped():
+    pool = make_pool(1, 1)
+    bad = pool.endpoints[0]
+    for _ in range(EJECT_AFTER_FAILURES):
+        fail(pool, bad)
+    assert bad.ejected(time.monotonic())
+    assert bad.stats["ejected"] == 1
+    assert spread(pool, 5) == {"key-2": 5}
+
+def test_ejection_grows_with_each_repeat():
+    pool = make_pool(1)
+    endpoint = pool.endpoints[0]
+    times = []
+    for _ in range(2):
+        for _ in range(EJECT_AFTER_FAILURES):
+            fail(pool, endpoint)
+        times.append(endpoint.ejected_until - time.monotonic())
+        endpoint.ejected_until = 0.0
+    assert EJECT_SECONDS - 1 < times[0] <= EJECT_SECONDS
+    assert 2 * EJECT_SECONDS - 1 < times[1] <= 2 * EJECT_SECONDS
+
+def test_every_endpoint_down_fails_fast():
+    pool = make_pool(1)
+    pool.endpoints[0].ejected_until = time.monotonic() + 60
+    with pytest.raises(UpstreamUnavailable, match="health checks"):
+        pool.acquire(10)
+
+def test_health_check_readmits_a_recovered_endpoint():
+    client = HealthClient(up=False)
+    pool = UpstreamPool([Endpoint("flaky", client=client)], health_check_seconds=0)
+    for _ in range(EJECT_AFTER_FAILURES):
+        assert pool.check_health() == {"flaky": False}
+    assert not pool.has_ready()
+    client.up = True
+    assert pool.check_health() == {"flaky": True}
+    assert pool.has_ready()
+    assert pool.snapshot()[0]["healthy"]
+
+def test_throttled_key_is_held_back():
+    pool = make_pool(1, 1)
+    first = pool.endpoints[0]
+    Lease(pool, first, 10).throttle(60)
+    assert spread(pool, 4) == {"key-2": 4}
+    assert first.stats["throttled"] == 1
+    assert pool.snapshot()[0]["paused"]
+
+def test_call_waits_for_quota_then_gives_up():
+    pool = make_pool(1, requests_per_minute=1)
+    pool.acquire(10).release(10)
+    with pytest.raises(UpstreamUnavailable, match="quota"):
+        pool.acquire(10)
+
+def test_unused_tokens_are_given_back():
+    pool = make_pool(1, tokens_per_minute=1000)
+    bucket = pool.endpoints[0].tokens
+    lease = pool.acquire(400)
+    assert bucket.available() == pytest.approx(600, abs=1)
+    lease.release(100)
+    assert bucket.available() == pytest.approx(900, abs=1)
+    assert pool.endpoints[0].stats["tokens"] == 100
+
+def test_pool_file_is_loaded(tmp_path, monkeypatch):
+    monkeypatch.setenv("SECOND_KEY", "sk-second")
+    path = tmp_path / "pool.json"
+    path.write_text(json.dumps({"endpoints": [
+        {"name": "primary", "base_url": "https://one.example/v1", "api_key": "sk-first", "weight": 2, "requests_per_minute": 60, "tokens_per_minute": 9000},
+        {"api_key_env": "SECOND_KEY", "requests_per_minute": 30, "tokens_per_minute": 3000}
+    ], "health_check_seconds": 0}), encoding="utf-8")
+    pool = load_pool(str(path))
+    assert [endpoint.name for endpoint in pool.endpoints] == ["primary", "endpoint-2"]
+    assert pool.endpoints[1].api_key == "sk-second"
+    assert pool.endpoints[1].base_url == upstream_pool.DEFAULT_BASE_URL
+    assert pool.total_quota() == (90, 12000)
+
+def test_empty_pool_is_refused():
+    with pytest.raises(ValueError):
+        UpstreamPool([])
@@ -0,0 +1,257 @@
+import atexit
+import glob
+import gzip
+import json
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+
+# System prompt used for captured conversations (same wording as the examples in fine_tune.py)
+TRAINING_SYSTEM_PROMPT = "You are a mental health screening specialist. Your task is to talk with the patient to find out potential mental health issues. Focus on their feelings, why they have the feelings, and physical symptoms."
+
+# Patterns used to remove identifying details from captured conversations
+EMAIL_PATTERN = re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+')
+URL_PATTERN = re.compile(r'https?://\S+|www\.\S+')
+HKID_PATTERN = re.compile(r'\b[A-Z]{1,2}\d{6}\s*\(?[0-9A]\)?', re.IGNORECASE)
+PHONE_PATTERN = re.compile(r'(?:\+?\d[\d\s()-]{6,}\d)')
+DATE_PATTERN = re.compile(r'\b\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}\b')
+# Street addresses, with any flat, floor or block before them ("Flat 3, 22 Nathan Road", "12/F, 8 Queen's Road Central")
+ADDRESS_PATTERN = re.compile(
+    r"(?:\b(?i:flat|room|rm|unit|apt|apartment|block|blk|tower)\s*[A-Z0-9]+\b,?\s*|\b\d{1,3}/F\b,?\s*)*"
+    r"\b\d{1,5}[A-Z]?,?\s+(?:[A-Z][\w']*\s+){1,3}(?i:road|rd|street|st|avenue|ave|lane|path|terrace|drive|square|crescent|court|way|place)\b\.?"
+    r"(?:\s+(?:Central|East|West|North|South))?"
+    r"|\b(?i:flat|room|rm|unit|apt|apartment|block|blk)\s+[A-Z0-9]+\b(?:,?\s*\d{1,3}/F\b)?"
+)
+# A name is one or two capitalised words ("Jane", "Jane Doe", "Mary-Ann O'Neil")
+NAME_WORDS = r"([A-Z][a-z]+(?:[-'][A-Z]?[a-z]+)?(?:\s+[A-Z][a-z]+(?:[-'][A-Z]?[a-z]+)?)?)"
+# Phrases that only ever introduce a name ("my name is Jane", "call me Sam")
+NAME_PATTERN = re.compile(r"\b(?i:my name is|my name's|i am called|i'm called|call me|they call me|name\s*:)\s+" + NAME_WORDS)
+# Phrases that also introduce feelings ("I am Exhausted all the time"), so the name must end the clause ("Hi, I'm Jane.")
+CLAUSE_NAME_PATTERN = re.compile(r"\b(?:[Ii]'m|[Ii] am|[Tt]his is|[Ii]t's)\s+" + NAME_WORDS + r"(?=\s*(?:[,.!?;:]|$|and\b|here\b))")
+# Capitalised words that follow those phrases without being a name ("call me Back", "I'm So tired")
+NOT_NAMES = {
+    "a", "an", "the", "and", "but", "or", "so", "not", "just", "really", "very", "too", "also", "still", "back", "later",
+    "now", "again", "when", "if", "at", "on", "in", "please", "anytime", "tomorrow", "today", "maybe", "sure", "fine",
+    "ok", "okay", "here", "there", "sorry", "what", "whatever", "crazy", "feeling", "going", "doing", "being", "getting",
+    "tired", "sad", "scared", "worried", "afraid", "always", "never", "only", "kind", "sort", "quite", "pretty", "much",
+    "lonely", "lazy", "weak", "stupid", "useless", "worthless", "hopeless", "angry", "upset", "anxious", "depressed",
+    "stressed", "lost", "broken", "empty", "numb", "done", "alone", "fat", "ugly", "mad", "well", "good", "bad", "ill",
+    "sick", "alright", "glad", "happy", "nervous", "confused", "better", "worse", "new", "old"
+}
+# Word endings of feelings and descriptions rather than names ("Exhausted", "Worrying", "Useless")
+NOT_NAME_ENDINGS = ("ed", "ing", "less", "ful", "ous", "ive", "able", "ible", "ness")
+
+# Function to check whether a capitalised word could be a name rather than a feeling or common word
+def looks_like_name(word):
+    lowered = word.lower()
+    return lowered not in NOT_NAMES and not (len(word) > 4 and lowered.endswith(NOT_NAME_ENDINGS))
+
+# Function to check whether transcript capture is switched on
+def capture_enabled():
+    return os.getenv("CAPTURE_TRANSCRIPTS", "").lower() in ["1", "true", "yes"]
+
+# Function to remove identifying details from one message
+def deidentify_text(text, names=(), scrub_numbers=True):
+    text = EMAIL_PATTERN.sub("[EMAIL]", text)
+    text = URL_PATTERN.sub("[URL]", text)
+    text = HKID_PATTERN.sub("[ID]", text)
+    text = ADDRESS_PATTERN.sub("[ADDRESS]", text)
+    if scrub_numbers:
+        # Assistant turns keep their numbers so the crisis hotlines survive
+        text = DATE_PATTERN.sub("[DATE]", text)
+        text = PHONE_PATTERN.sub("[PHONE]", text)
+    # Case-sensitive, so "Hope" the name goes but "hope" the word stays, in patient and assistant turns alike
+    for name in names:
+        text = re.sub(r'\b' + re.escape(name) + r'\b', "[NAME]", text)
+    return text
+
+# Function to collect the names a patient introduced, so they can be removed everywhere. This is pattern
+# matching: a name given any other way is missed, so exports still need a review before they are shared
+def find_names(messages):
+    names = set()
+    for message in messages:
+        if message["role"] != "user":
+            continue
+        for match in list(NAME_PATTERN.finditer(message["content"])) + list(CLAUSE_NAME_PATTERN.finditer(message["content"])):
+            words = match.group(1).split()
+            if not looks_like_name(words[0]):
+                continue
+            if len(words) > 1 and not looks_like_name(words[1]):
+                words = words[:1]
+            names.add(" ".join(words))
+            names.update(words)
+    return sorted(names, key=len, reverse=True)
+
+# Function to de-identify a whole conversation
+def deidentify_messages(messages, names=None):
+    if names is None:
+        names = find_names(messages)
+
+    cleaned = []
+    for message in messages:
+        content = deidentify_text(message["content"], names, scrub_numbers=message["role"] == "user")
+        cleaned.append({"role": message["role"], "content": content})
+    return cleaned
+
+# Function to turn a finished screening session into a training record
+def build_training_record(messages, screening_result):
+    # Skip the welcome messages shown before the patient says anything
+    start = 0
+    while start < len(messages) and messages[start]["role"] != "user":
+        start += 1
+
+    conversation = [
+        {"role": message["role"], "content": message["content"]}
+        for message in messages[start:]
+        if message["role"] in ["user", "assistant"]
+    ]
+    if not conversation:
+        return None
+
+    names = find_names(conversation)
+    record_messages = [{"role": "system", "content": TRAINING_SYSTEM_PROMPT}]
+    record_messages.extend(deidentify_messages(conversation, names))
+    result = {
+        "screening_complete": True,
+        "possible_conditions": screening_result.get("possible_conditions", []),
+        "notes": deidentify_text(screening_result.get("notes", ""), names)
+    }
+    record_messages.append({"role": "assistant", "content": json.dumps(result)})
+    return {"messages": record_messages}
+
+# Background writer that batches, compresses and rotates captured transcripts
+class TranscriptWriter:
+    def __init__(self, directory, batch_size=50, flush_interval=5.0, max_file_bytes=50 * 1024 * 1024, max_queue=10000):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_file_bytes = max_file_bytes
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.current_file = None
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="transcript-writer", daemon=True)
+        self._thread.start()
+
+    # Called from the UI thread: never blocks, drops the record if the queue is full
+    def submit(self, messages, screening_result):
+        try:
+            self.queue.put_nowait((list(messages), dict(screening_result)))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def close(self, timeout=10):
+        self._stopped.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while not (self._stopped.is_set() and self.queue.empty()):
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=min(remaining, 0.5)))
+                except queue.Empty:
+                    if self._stopped.is_set():
+                        break
+            if batch:
+                self._write_batch(batch)
+
+    def _write_batch(self, batch):
+        lines = []
+        for messages, screening_result in batch:
+            try:
+                record = build_training_record(messages, screening_result)
+            except Exception as e:
+                self.errors += 1
+                print(f"Error preparing transcript: {str(e)}", file=sys.stderr)
+                continue
+            if record:
+                lines.append(json.dumps(record, ensure_ascii=False) + "\n")
+        if not lines:
+            return
+
+        try:
+            path = self._file_for_write()
+            # Each batch becomes one gzip member, so appending keeps the file readable
+            with gzip.open(path, "ab") as f:
+                f.write("".join(lines).encode("utf-8"))
+            self.written += len(lines)
+        except Exception as e:
+            self.errors += 1
+            print(f"Error writing transcripts: {str(e)}", file=sys.stderr)
+
+    def _file_for_write(self):
+        if self.current_file is None or os.path.getsize(self.current_file) >= self.max_file_bytes:
+            os.makedirs(self.directory, exist_ok=True)
+            stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+            self.current_file = os.path.join(self.directory, f"transcripts-{stamp}-{os.getpid()}.jsonl.gz")
+            suffix = 1
+            while os.path.exists(self.current_file):
+                self.current_file = os.path.join(self.directory, f"transcripts-{stamp}-{os.getpid()}-{suffix}.jsonl.gz")
+                suffix += 1
+            open(self.current_file, "ab").close()
+        return self.current_file
+
+_writer = None
+_writer_lock = threading.Lock()
+
+# Function to get the shared writer, starting it on first use
+def get_transcript_writer():
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = TranscriptWriter(
+                    os.getenv("CAPTURE_DIR", "captured_transcripts"),
+                    batch_size=int(os.getenv("CAPTURE_BATCH_SIZE", "50")),
+                    flush_interval=float(os.getenv("CAPTURE_FLUSH_SECONDS", "5")),
+                    max_file_bytes=int(os.getenv("CAPTURE_MAX_FILE_MB", "50")) * 1024 * 1024
+                )
+                atexit.register(_writer.close)
+    return _writer
+
+# Function to capture a completed screening session (no-op unless CAPTURE_TRANSCRIPTS is set)
+def capture_screening_session(messages, screening_result):
+    if not capture_enabled():
+        return False
+    return get_transcript_writer().submit(messages, screening_result)
+
+# Function to merge captured shards into a file in the training_data.jsonl format
+def export_training_file(output_path, directory="captured_transcripts"):
+    count = 0
+    # Written to a temporary file that then replaces the output, so running the export again does not repeat records
+    temp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "w", encoding="utf-8") as out:
+            for path in sorted(glob.glob(os.path.join(directory, "transcripts-*.jsonl.gz"))):
+                with gzip.open(path, "rt", encoding="utf-8") as f:
+                    for line in f:
+                        if line.strip():
+                            out.write(line if line.endswith("\n") else line + "\n")
+                            count += 1
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    print(f"Exported {count} captured conversations to {output_path}")
+    print("Names, contact details and dates were removed by pattern matching only; review the file before sharing it.")
+    return count
+
+if __name__ == "__main__":
+    # Usage: python transcript_capture.py [output.jsonl] [capture_dir]. The output is replaced, and its redaction
+    # is best-effort (see find_names), so review it before sharing
+    output = sys.argv[1] if len(sys.argv) > 1 else "training_data_captured.jsonl"
+    source = sys.argv[2] if len(sys.argv) > 2 else os.getenv("CAPTURE_DIR", "captured_transcripts")
+    export_training_file(output, source)
@@ -0,0 +1,203 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Patient messages sent in turn during screening; they name all four conditions, so both DASS-21 and PCL-5 follow.
+# Each turn adds how long it has lasted, as the stand-in model counts distinct patient messages
+PATIENT_TURNS = [
+    "I feel down and hopeless most days.",
+    "I lost my job and I worry about everything.",
+    "I can't sleep because of nightmares about the accident.",
+    "Work pressure leaves me overwhelmed and tense."
+]
+FOLLOW_UP_QUESTIONS = [
+    "What does my depression score mean?",
+    "Should I see a doctor about this?",
+    "What can I do to sleep better?"
+]
+
+# Answer option clicked for every questionnaire item
+ANSWER_OPTION = 1
+
+# p95 budget for an answer click (both script runs); about twice the 40-turn session measured on a laptop
+DEFAULT_CLICK_BUDGET_MS = 300
+
+# Function to count the elements a script run rendered
+def count_elements(node):
+    children = getattr(node, "children", None)
+    if not isinstance(children, dict):
+        return 1
+    return 1 + sum(count_elements(child) for child in children.values())
+
+# Drives app.py through AppTest. st.rerun() stops the run and is counted; the driver then runs the script
+# again, as the Streamlit server would, so each action reports every script run it caused
+class AppDriver:
+    def __init__(self, app_path, timeout):
+        import streamlit as st
+        import streamlit.components.v1  # noqa: F401 (app.py uses st.components without importing it)
+        from streamlit.testing.v1 import AppTest
+
+        self.rerun_requested = False
+
+        def rerun():
+            self.rerun_requested = True
+            st.stop()
+
+        st.rerun = rerun
+        self.app = AppTest.from_file(app_path, default_timeout=timeout)
+        self.samples = []
+
+    # Function to perform one action and record its script runs: [(action, history, runs, ms, elements)]
+    def act(self, action, perform):
+        history = len(self.app.session_state.messages) if "messages" in self.app.session_state else 0
+        self.rerun_requested = False
+        start = time.perf_counter()
+        perform()
+        runs = 1
+        while self.rerun_requested:
+            self.rerun_requested = False
+            self.app.run()
+            runs += 1
+        elapsed = (time.perf_counter() - start) * 1000
+        if self.app.exception:
+            raise RuntimeError(f"{action} failed: {self.app.exception[0].message}")
+        self.samples.append({"action": action, "history": history, "runs": runs, "ms": elapsed, "elements": count_elements(self.app._tree)})
+
+    def option_button(self):
+        for button in self.app.button:
+            if button.key and button.key.startswith("option_") and button.key.split("_")[1] == str(ANSWER_OPTION):
+                return button
+        return None
+
+    def button(self, label):
+        for button in self.app.button:
+            if button.label == label:
+                return button
+        return None
+
+# Function to run one whole session: screening turns, every questionnaire item, the report and follow-ups
+def run_session(app_path, screening_turns, follow_ups, timeout=60):
+    from evaluate import StandInClient
+    from upstream_pool import Endpoint, UpstreamPool, set_upstream_pool
+
+    set_upstream_pool(UpstreamPool([Endpoint("ui-benchmark", client=StandInClient(questions_before_complete=screening_turns))], health_check_seconds=0))
+    driver = AppDriver(app_path, timeout)
+    app = driver.app
+    driver.act("start", app.run)
+    turn = 0
+    while app.session_state.chat_state == "screening" and turn <= screening_turns + 1:
+        message = f"{PATIENT_TURNS[turn % len(PATIENT_TURNS)]} It has been like this for {turn + 1} weeks."
+        driver.act("screening", lambda: app.chat_input[0].set_value(message).run())
+        turn += 1
+    while app.session_state.chat_state == "assessment":
+        button = driver.option_button()
+        if button is None:
+            raise RuntimeError("No answer buttons while the questionnaire is running")
+        driver.act("answer", lambda: button.click().run())
+    button = driver.button("Generate Report")
+    if button is not None:
+        driver.act("report", lambda: button.click().run())
+    for number in range(follow_ups if app.session_state.chat_state == "follow_up" else 0):
+        question = FOLLOW_UP_QUESTIONS[number % len(FOLLOW_UP_QUESTIONS)]
+        driver.act("follow_up", lambda: app.chat_input[0].set_value(question).run())
+    return driver.samples
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+# Function to sum up the samples of each action: {action: {count, history, runs, p50/p95/max ms, elements}}
+def summarize(samples):
+    summary = {}
+    for action in dict.fromkeys(sample["action"] for sample in samples):
+        group = [sample for sample in samples if sample["action"] == action]
+        times = [sample["ms"] for sample in group]
+        summary[action] = {
+            "count": len(group),
+            "history": [min(s["history"] for s in group), max(s["history"] for s in group)],
+            "runs_max": max(s["runs"] for s in group),
+            "p50_ms": round(statistics.median(times), 1),
+            "p95_ms": round(percentile(times, 0.95), 1),
+            "max_ms": round(max(times), 1),
+            "elements_max": max(s["elements"] for s in group)
+        }
+    return summary
+
+# Function to point everything that writes files at a scratch folder. app.py clears the environment on
+# every run, so the shared objects are created now, while the settings are in place
+def isolate(mode):
+    scratch = tempfile.mkdtemp(prefix="ui-benchmark-")
+    os.environ.update({
+        "REPORT_CACHE_DIR": os.path.join(scratch, "report_cache"),
+        "ANALYTICS_DIR": os.path.join(scratch, "analytics"),
+        "FALLBACK_LOG": os.path.join(scratch, "fallback_log.jsonl"),
+        "PRECLASSIFIER_MODEL": os.path.join(scratch, "no_preclassifier.json"),
+        # One benchmark session calls the model far faster than a patient types; its rate limits are not UI latency
+        "ADMISSION_REQUESTS_PER_MINUTE": "1000000",
+        "ADMISSION_TOKENS_PER_MINUTE": "1000000000",
+        "SESSION_REQUESTS_PER_MINUTE": "1000000",
+        "SESSION_TOKENS_PER_MINUTE": "1000000000"
+    })
+    import engine
+    from admission import get_admission_controller
+    from analytics_store import get_analytics_writer
+    from norms import get_population_norms
+    from preclassifier import get_preclassifier
+    from report_store import get_report_store
+
+    get_admission_controller()
+    get_report_store()
+    get_analytics_writer()
+    get_population_norms()
+    get_preclassifier()
+    # Full mode asks all 41 items; ADAPTIVE_ASSESSMENTS cannot be used because app.py clears it
+    engine.is_adaptive = lambda assessment_name: mode == "adaptive"
+    return scratch
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time each click and message in app.py, headless, with a stand-in model, as the conversation grows.")
+    parser.add_argument("--app", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "app.py"))
+    parser.add_argument("--screening-turns", type=int, nargs="+", default=[2, 15, 40], help="Screening lengths to try; longer ones give the questionnaire a longer history")
+    parser.add_argument("--follow-ups", type=int, default=3, help="Follow-up questions after each report")
+    parser.add_argument("--mode", choices=["full", "adaptive"], default="full", help="Questionnaire mode (full asks all 41 items)")
+    parser.add_argument("--click-budget-ms", type=float, default=DEFAULT_CLICK_BUDGET_MS, help="Slowest acceptable p95 for an answer click, reruns included")
+    parser.add_argument("--max-click-runs", type=int, default=2, help="Most script runs an answer click may cause")
+    parser.add_argument("--json", action="store_true", help="Print the summaries and samples as JSON")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(args.app)))
+    isolate(args.mode)
+    results = []
+    for screening_turns in args.screening_turns:
+        samples = run_session(args.app, screening_turns, args.follow_ups)
+        results.append({"screening_turns": screening_turns, "summary": summarize(samples), "samples": samples})
+
+    failures = []
+    for result in results:
+        answer = result["summary"].get("answer")
+        if answer is None:
+            failures.append(f"{result['screening_turns']} screening turns: no questionnaire was given")
+            continue
+        if answer["p95_ms"] > args.click_budget_ms:
+            failures.append(f"{result['screening_turns']} screening turns: answer click p95 {answer['p95_ms']} ms > {args.click_budget_ms:g} ms")
+        if answer["runs_max"] > args.max_click_runs:
+            failures.append(f"{result['screening_turns']} screening turns: an answer click caused {answer['runs_max']} script runs > {args.max_click_runs}")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'turns':>5} {'action':<10} {'count':>5} {'history':>9} {'runs':>4} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'elements':>8}")
+        for result in results:
+            for action, stats in result["summary"].items():
+                history = f"{stats['history'][0]}-{stats['history'][1]}"
+                print(f"{result['screening_turns']:>5} {action:<10} {stats['count']:>5} {history:>9} {stats['runs_max']:>4} {stats['p50_ms']:>8} {stats['p95_ms']:>8} {stats['max_ms']:>8} {stats['elements_max']:>8}")
+    if failures:
+        print("Over budget:\n  " + "\n  ".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,330 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+
+from cassette import get_cassette
+from rate_limit import per_minute
+
+# Used when there is no pool file: the single API_KEY / API_BASE_URL endpoint
+DEFAULT_BASE_URL = "https://xiaoai.plus/v1"
+
+# Failed calls in a row (timeouts, connection errors, 5xx) before an endpoint is taken out of rotation,
+# and how long it stays out the first time (doubled each time it is ejected again, up to the maximum)
+EJECT_AFTER_FAILURES = 3
+EJECT_SECONDS = 15
+MAX_EJECT_SECONDS = 300
+
+# How long a call waits for any endpoint to have quota left before giving up
+MAX_WAIT_SECONDS = 30
+
+class UpstreamUnavailable(Exception):
+    pass
+
+# One endpoint and key pair, with its own quota, in-flight count and health
+class Endpoint:
+    def __init__(self, name, base_url=None, api_key=None, weight=1.0, requests_per_minute=None, tokens_per_minute=None, client=None):
+        self.name = name
+        self.base_url = base_url or DEFAULT_BASE_URL
+        self.api_key = api_key
+        self.weight = float(weight)
+        self.requests = per_minute(requests_per_minute) if requests_per_minute else None
+        self.tokens = per_minute(tokens_per_minute) if tokens_per_minute else None
+        self._given_client = client
+        self._client = None
+        self.outstanding = 0
+        self.current_weight = 0.0
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.paused_until = 0.0
+        self.stats = {"requests": 0, "failed": 0, "throttled": 0, "ejected": 0, "tokens": 0}
+
+    # The client is made on first use, so the openai package is only imported when a call is made. With
+    # MODEL_CASSETTE set it goes through the cassette, and replaying needs no client (or key) at all
+    @property
+    def client(self):
+        if self._client is None:
+            cassette = get_cassette()
+            if cassette is not None and cassette.mode == "replay":
+                self._client = cassette.client(None)
+            else:
+                client = self._given_client
+                if client is None:
+                    from openai import OpenAI
+                    client = OpenAI(api_key=self.api_key, base_url=self.base_url)
+                self._client = client if cassette is None else cassette.client(client)
+        return self._client
+
+    def ejected(self, now):
+        return now < self.ejected_until
+
+    def ready(self, now, tokens):
+        if self.ejected(now) or now < self.paused_until:
+            return False
+        if self.requests is not None and self.requests.available() < 1:
+            return False
+        return self.tokens is None or self.tokens.available() >= min(tokens, self.tokens.capacity)
+
+    def snapshot(self, now):
+        return dict(
+            self.stats,
+            name=self.name,
+            base_url=self.base_url,
+            weight=self.weight,
+            outstanding=self.outstanding,
+            healthy=not self.ejected(now),
+            paused=now < self.paused_until,
+            requests_left=None if self.requests is None else int(self.requests.available()),
+            tokens_left=None if self.tokens is None else int(self.tokens.available())
+        )
+
+# A call in progress on one endpoint; release() must be called once it finishes
+class Lease:
+    def __init__(self, pool, endpoint, tokens):
+        self.pool = pool
+        self.endpoint = endpoint
+        self.tokens = tokens
+        self.released = False
+
+    # Function to finish the call: failed=True for timeouts, dropped connections and server errors
+    def release(self, used_tokens=None, failed=False):
+        if not self.released:
+            self.released = True
+            self.pool.release(self, used_tokens, failed)
+
+    # Function to hold this endpoint's key back after it answered 429
+    def throttle(self, seconds):
+        self.pool.throttle(self.endpoint, seconds)
+
+# Pool of endpoint and key pairs: weighted least-outstanding-requests balancing, per-key quota,
+# passive health from call results, active health checks, and automatic ejection and re-admission
+class UpstreamPool:
+    def __init__(self, endpoints, health_check_seconds=30, max_wait_seconds=MAX_WAIT_SECONDS):
+        if not endpoints:
+            raise ValueError("The upstream pool needs at least one endpoint")
+        self.endpoints = endpoints
+        self.health_check_seconds = health_check_seconds
+        self.max_wait_seconds = max_wait_seconds
+        self._condition = threading.Condition()
+        self._checker = None
+
+    # Function to pick an endpoint for a call expected to use `tokens`, waiting while every key is at its quota
+    def acquire(self, tokens):
+        deadline = time.monotonic() + self.max_wait_seconds
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if all(endpoint.ejected(now) for endpoint in self.endpoints):
+                    raise UpstreamUnavailable("Every upstream endpoint is failing its health checks")
+                ready = [endpoint for endpoint in self.endpoints if endpoint.ready(now, tokens)]
+                if ready:
+                    # Smooth weighted round robin on weight / (calls in flight + 1): traffic is shared by
+                    # weight, and an endpoint with calls piling up gets fewer new ones
+                    total = 0.0
+                    for candidate in ready:
+                        effective = candidate.weight / (candidate.outstanding + 1)
+                        candidate.current_weight += effective
+                        total += effective
+                    endpoint = max(ready, key=lambda e: e.current_weight)
+                    endpoint.current_weight -= total
+                    if endpoint.requests is not None:
+                        endpoint.requests.try_acquire(1)
+                    if endpoint.tokens is not None:
+                        endpoint.tokens.try_acquire(min(tokens, endpoint.tokens.capacity))
+                    endpoint.outstanding += 1
+                    endpoint.stats["requests"] += 1
+                    return Lease(self, endpoint, tokens)
+                remaining = deadline - now
+                if remaining <= 0:
+                    raise UpstreamUnavailable("Every upstream key is at its quota")
+                self._condition.wait(min(0.25, remaining))
+
+    def release(self, lease, used_tokens, failed):
+        endpoint = lease.endpoint
+        with self._condition:
+            endpoint.outstanding -= 1
+            if used_tokens is not None:
+                endpoint.stats["tokens"] += used_tokens
+                if endpoint.tokens is not None:
+                    endpoint.tokens.refund(min(lease.tokens, endpoint.tokens.capacity) - used_tokens)
+            self._record(endpoint, not failed)
+            self._condition.notify_all()
+
+    def throttle(self, endpoint, seconds):
+        with self._condition:
+            endpoint.paused_until = max(endpoint.paused_until, time.monotonic() + seconds)
+            endpoint.stats["throttled"] += 1
+
+    # Function to update an endpoint's health after a call or a check (call with the lock held)
+    def _record(self, endpoint, ok):
+        if ok:
+            endpoint.failures = 0
+            endpoint.ejections = 0
+            return
+        endpoint.failures += 1
+        endpoint.stats["failed"] += 1
+        if endpoint.failures >= EJECT_AFTER_FAILURES and not endpoint.ejected(time.monotonic()):
+            seconds = min(MAX_EJECT_SECONDS, EJECT_SECONDS * 2 ** endpoint.ejections)
+            endpoint.ejected_until = time.monotonic() + seconds
+            endpoint.ejections += 1
+            endpoint.failures = 0
+            endpoint.stats["ejected"] += 1
+            print(f"[warning] Upstream endpoint {endpoint.name} ejected for {seconds} seconds", file=sys.stderr)
+
+    # Function to check whether any endpoint could take a call right now
+    def has_ready(self, tokens=0):
+        with self._condition:
+            now = time.monotonic()
+            return any(endpoint.ready(now, tokens) for endpoint in self.endpoints)
+
+    # Function to ask every endpoint whether it is up (listing models costs no tokens); an ejected
+    # endpoint that answers is put back into rotation straight away
+    def check_health(self):
+        results = {}
+        for endpoint in self.endpoints:
+            try:
+                models = getattr(endpoint.client, "models", None)
+                if models is not None:
+                    models.list()
+                ok = True
+            except Exception as e:
+                # Only timeouts, connection errors and server errors say the endpoint is down
+                status_code = getattr(e, "status_code", None)
+                ok = status_code is not None and status_code < 500
+            with self._condition:
+                if ok and endpoint.ejected(time.monotonic()):
+                    endpoint.ejected_until = 0.0
+                    print(f"[info] Upstream endpoint {endpoint.name} re-admitted", file=sys.stderr)
+                self._record(endpoint, ok)
+                self._condition.notify_all()
+            results[endpoint.name] = ok
+        return results
+
+    def start_health_checks(self):
+        if self._checker is None and self.health_check_seconds > 0:
+            self._checker = threading.Thread(target=self._check_loop, name="upstream-health", daemon=True)
+            self._checker.start()
+
+    def _check_loop(self):
+        while True:
+            time.sleep(self.health_check_seconds)
+            try:
+                self.check_health()
+            except Exception as e:
+                print(f"[error] Upstream health check: {e}", file=sys.stderr)
+
+    # Function to get the pool's total requests and tokens per minute (None if any key has no set quota)
+    def total_quota(self):
+        if any(endpoint.requests is None or endpoint.tokens is None for endpoint in self.endpoints):
+            return None
+        return sum(endpoint.requests.capacity for endpoint in self.endpoints), sum(endpoint.tokens.capacity for endpoint in self.endpoints)
+
+    def snapshot(self):
+        with self._condition:
+            now = time.monotonic()
+            return [endpoint.snapshot(now) for endpoint in self.endpoints]
+
+# Function to read the pool file: {"endpoints": [{"name", "base_url", "api_key_env" or "api_key", "weight",
+# "requests_per_minute", "tokens_per_minute"}, ...], "health_check_seconds": 30}
+def load_pool(path):
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    endpoints = []
+    for i, entry in enumerate(config.get("endpoints", [])):
+        api_key = entry.get("api_key") or os.getenv(entry.get("api_key_env", "API_KEY"))
+        endpoints.append(Endpoint(
+            entry.get("name", f"endpoint-{i + 1}"),
+            base_url=entry.get("base_url"),
+            api_key=api_key,
+            weight=entry.get("weight", 1.0),
+            requests_per_minute=entry.get("requests_per_minute"),
+            tokens_per_minute=entry.get("tokens_per_minute")
+        ))
+    return UpstreamPool(endpoints, health_check_seconds=config.get("health_check_seconds", 30))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Function to get the shared pool (UPSTREAM_POOL, default upstream_pool.json; without the file, the
+# single API_KEY / API_BASE_URL endpoint)
+def get_upstream_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                path = os.getenv("UPSTREAM_POOL", "upstream_pool.json")
+                if os.path.exists(path):
+                    pool = load_pool(path)
+                else:
+                    pool = UpstreamPool([Endpoint("default", os.getenv("API_BASE_URL", DEFAULT_BASE_URL), os.getenv("API_KEY"))], health_check_seconds=0)
+                pool.start_health_checks()
+                _pool = pool
+    return _pool
+
+# Function to replace the shared pool, e.g. with one endpoint for a tool's --endpoint option
+def set_upstream_pool(pool):
+    global _pool
+    with _pool_lock:
+        _pool = pool
+        pool.start_health_checks()
+
+# Function to push calls through pools of 1..n stand-in keys and report the throughput of each
+def simulate(key_counts, requests_per_minute, latency, seconds, workers):
+    from concurrent.futures import ThreadPoolExecutor
+    from evaluate import StandInClient
+
+    results = []
+    for keys in key_counts:
+        # A short wait lets the workers stop on time instead of queueing for quota past the end
+        pool = UpstreamPool([Endpoint(f"key-{i + 1}", requests_per_minute=requests_per_minute, client=StandInClient(latency=latency)) for i in range(keys)], health_check_seconds=0, max_wait_seconds=0.5)
+        stop = time.monotonic() + seconds
+        completed = itertools.count()
+
+        def worker():
+            while time.monotonic() < stop:
+                try:
+                    lease = pool.acquire(100)
+                except UpstreamUnavailable:
+                    continue
+                lease.endpoint.client.chat.completions.create(model="stand-in", messages=[{"role": "user", "content": "hello"}])
+                lease.release(100)
+                if time.monotonic() < stop:
+                    next(completed)
+
+        # Each key starts with a full minute's quota, so drain it first and time only the steady rate
+        for endpoint in pool.endpoints:
+            endpoint.requests.tokens = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for _ in range(workers):
+                executor.submit(worker)
+        results.append({"keys": keys, "requests_per_minute": round(next(completed) * 60 / seconds)})
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the upstream endpoints, or measure how throughput grows with the number of keys.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("check", help="Run a health check on every configured endpoint and show its state")
+    simulate_parser = subparsers.add_parser("simulate", help="Run stand-in keys with a fixed quota and report the throughput")
+    simulate_parser.add_argument("--keys", type=int, nargs="+", default=[1, 2, 4])
+    simulate_parser.add_argument("--requests-per-minute", type=int, default=600, help="Quota of each stand-in key")
+    simulate_parser.add_argument("--latency", type=float, default=0.05, help="Seconds each stand-in call takes")
+    simulate_parser.add_argument("--seconds", type=float, default=5)
+    simulate_parser.add_argument("--workers", type=int, default=32)
+    args = parser.parse_args(argv)
+
+    if args.command == "check":
+        import dotenv
+        dotenv.load_dotenv()
+        pool = get_upstream_pool()
+        pool.check_health()
+        print(json.dumps(pool.snapshot(), indent=2))
+    else:
+        for result in simulate(args.keys, args.requests_per_minute, args.latency, args.seconds, args.workers):
+            print(f"{result['keys']} key(s): {result['requests_per_minute']} requests per minute")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])